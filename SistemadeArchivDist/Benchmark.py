@@ -0,0 +1,415 @@
+# Benchmark.py
+
+import argparse
+import filecmp
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Cache import BlockCache
+from Config import REPLICATION_FACTOR, NODOS_CONOCIDOS
+from Network import DFSClient
+from Node import DFSNode
+from Placement import PlacementEngine
+from Server import NodeServer
+from Transfer import StreamingUploader, ParallelDownloader
+from Utils import MetadataManager
+
+# --- Bancos de Pruebas ---
+#
+# Dos pruebas reproducibles, cada una en un directorio temporal:
+#
+#     python Benchmark.py cluster --nodes 4 --block-sizes 256K,1M,4M \
+#         --file-sizes 1M,16M --concurrency 1,4 --json hoy.json --compare ayer.json
+#     python Benchmark.py compresion --size 64 --codecs zlib,lzma,bz2 --link-mbps 100
+#
+# 'cluster' levanta N nodos Daemon.py en procesos aparte y mide subidas y
+# descargas completas (ver la sección 2). 'compresion' compara el ritmo
+# con cada códec y sin compresión (sección 1).
+
+
+# --- 1. Compresión ---
+#
+# Levanta varios nodos en 127.0.0.1 en este mismo proceso, sube y descarga
+# un archivo de texto (compresible) y uno aleatorio (no compresible) con
+# cada códec, y compara el ritmo con el de la ruta sin compresión.
+#
+# En loopback la red es casi gratis, así que además del ritmo medido se
+# estima el que habría en un enlace de --link-mbps megabits/s: tiempo
+# medido + bytes que cruzan la red / velocidad del enlace.
+
+
+def generar_texto(size, semilla=1):
+    """Datos tipo CSV/log: se comprimen bien, como los que se suelen subir."""
+    rnd = random.Random(semilla)
+    niveles = ["INFO", "WARN", "ERROR", "DEBUG"]
+    partes = []
+    total = 0
+    i = 0
+    while total < size:
+        linea = (f"{i},2024-05-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d},"
+                 f"{rnd.choice(niveles)},nodo{rnd.randint(1, 8)},{rnd.random():.6f}\n").encode()
+        partes.append(linea)
+        total += len(linea)
+        i += 1
+    return b''.join(partes)[:size]
+
+
+def arrancar_nodos(n, puerto_base):
+    servidores = []
+    for i in range(n):
+        puerto = puerto_base + i
+        metadata = MetadataManager(f"bench{i}", "127.0.0.1", puerto, persistir=False)
+        # Sin límite de espacio: aquí no se mide la ubicación
+        servidor = NodeServer("127.0.0.1", puerto, metadata, capacity=1 << 50, on_log=lambda m: None)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidor.ready.wait()
+        servidores.append(servidor)
+    return servidores
+
+
+def medir(servidores, nodos, ruta, codec, link_mbps):
+    """Sube y descarga 'ruta' con 'codec'. Devuelve un dict con los resultados."""
+    size = os.path.getsize(ruta)
+    cliente = DFSClient(cache=BlockCache(memory_bytes=0, disk_bytes=0))
+    metadata = MetadataManager("bench-cliente", "127.0.0.1", nodos[-1][1] + 1, persistir=False)
+    placement = PlacementEngine(cliente, nodos)
+    usados = sum(s.used_bytes for s in servidores)
+    try:
+        inicio = time.perf_counter()
+        nombre, file_size, block_map = StreamingUploader(cliente, metadata, placement=placement,
+                                                         compression=codec,
+                                                         on_log=lambda m: None).upload(ruta)
+        subida = time.perf_counter() - inicio
+        guardados = sum(s.used_bytes for s in servidores) - usados
+        enviados = sum(s.bytes_transferred for s in servidores)
+
+        inicio = time.perf_counter()
+        ParallelDownloader(cliente, on_log=lambda m: None).download(block_map, ruta + ".out", file_size)
+        bajada = time.perf_counter() - inicio
+        recibidos = sum(s.bytes_transferred for s in servidores) - enviados
+        with open(ruta, 'rb') as a, open(ruta + ".out", 'rb') as b:
+            if a.read() != b.read():
+                raise IOError(f"La descarga de {nombre} con {codec} no coincide con el original")
+    finally:
+        if os.path.exists(ruta + ".out"):
+            os.remove(ruta + ".out")
+        cliente.close()
+
+    # Con replicación en cadena el cliente envía cada bloque una sola vez
+    replicas = min(REPLICATION_FACTOR, len(nodos))
+    enlace = link_mbps * 1e6 / 8
+    return {"codec": codec or "none", "ratio": guardados / replicas / size,
+            "up_mbs": size / subida / 1e6, "down_mbs": size / bajada / 1e6,
+            "up_link_mbs": size / (subida + guardados / replicas / enlace) / 1e6,
+            "down_link_mbs": size / (bajada + recibidos / enlace) / 1e6}
+
+
+
+
+def prueba_compresion(args):
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        servidores = arrancar_nodos(args.nodes, args.port)
+        nodos = [(s.host, s.port) for s in servidores]
+        size = args.size * 1024 * 1024
+        # Contenido distinto en cada prueba: si no, la deduplicación no enviaría nada
+        datos = {"texto": lambda semilla: generar_texto(size, semilla),
+                 "aleatorio": lambda semilla: os.urandom(size)}
+
+        print(f"{'datos':<10} {'códec':<6} {'ratio':>6} {'sube MB/s':>10} {'baja MB/s':>10} "
+              f"{'sube @enlace':>13} {'baja @enlace':>13}")
+        for tipo, generar in datos.items():
+            for semilla, codec in enumerate([None] + [c for c in args.codecs.split(",") if c]):
+                ruta = os.path.join(directorio, f"{tipo}_{codec}.dat")
+                with open(ruta, 'wb') as f:
+                    f.write(generar(semilla))
+                r = medir(servidores, nodos, ruta, codec, args.link_mbps)
+                print(f"{tipo:<10} {r['codec']:<6} {r['ratio']:>6.2f} {r['up_mbs']:>10.1f} "
+                      f"{r['down_mbs']:>10.1f} {r['up_link_mbs']:>13.1f} {r['down_link_mbs']:>13.1f}")
+                os.remove(ruta)
+        for servidor in servidores:
+            servidor.stop()
+    return 0
+
+
+# --- 2. Clúster Local ---
+#
+# Cada nodo es un proceso Daemon.py (con su propio GIL, como en un
+# despliegue real) en 127.0.0.1, configurado con SADTF_NODOS y
+# SADTF_CAPACIDAD_MB (ver Config.py). Este proceso hace de cliente con un
+# DFSNode sin almacenamiento, así que cada operación medida es la misma
+# que un 'Cli.py put/get': transferencia, registro y envío de metadatos.
+#
+# Para cada combinación de tamaño de bloque, tamaño de archivo y
+# concurrencia se suben --files archivos (con --concurrency operaciones a
+# la vez), se descargan todos y se borran. De cada fase se informa el
+# ritmo agregado y los percentiles 50/95/99 de la duración de cada
+# operación. Con --fault se mata un nodo (SIGKILL) a mitad de la fase
+# indicada y se vuelve a arrancar antes del borrado.
+
+DAEMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Daemon.py")
+
+
+def parse_size(texto):
+    """'256K', '4M', '1G' o un número de bytes."""
+    texto = texto.strip().upper()
+    for sufijo, factor in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3)):
+        if texto.endswith(sufijo):
+            return int(float(texto[:-1]) * factor)
+    return int(texto)
+
+
+def formato_size(n):
+    for sufijo, factor in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if n >= factor and n % factor == 0:
+            return f"{n // factor}{sufijo}"
+    return str(n)
+
+
+def percentil(muestras, p):
+    """Percentil 'p' por rango más cercano (None si no hay muestras)."""
+    if not muestras:
+        return None
+    ordenadas = sorted(muestras)
+    return ordenadas[min(len(ordenadas) - 1, max(0, -(-p * len(ordenadas) // 100) - 1))]
+
+
+class LocalCluster:
+    """'n' procesos Daemon.py en 127.0.0.1 desde 'puerto_base', con sus datos en 'directorio'."""
+    def __init__(self, n, puerto_base, directorio, capacidad_mb):
+        self.nodos = [("127.0.0.1", puerto_base + i) for i in range(n)]
+        self.directorio = directorio
+        self.env = dict(os.environ, SADTF_NODOS=",".join(f"{h}:{p}" for h, p in self.nodos),
+                        SADTF_CAPACIDAD_MB=str(capacidad_mb))
+        self.procesos = {}
+
+    def start(self, addr=None):
+        for nodo in [addr] if addr else self.nodos:
+            self.procesos[nodo] = subprocess.Popen([sys.executable, DAEMON, str(nodo[1])],
+                                                   cwd=self.directorio, env=self.env,
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, cliente, timeout=15):
+        """Espera a que todos los nodos en marcha respondan a HEARTBEAT."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if len(cliente.heartbeat(list(self.procesos))) == len(self.procesos):
+                return
+            time.sleep(0.1)
+        raise RuntimeError("Los nodos de prueba no arrancaron a tiempo")
+
+    def kill(self, addr):
+        proceso = self.procesos.pop(addr)
+        proceso.kill()
+        proceso.wait()
+
+    def stop(self):
+        for proceso in self.procesos.values():
+            proceso.terminate()
+        for proceso in self.procesos.values():
+            proceso.wait()
+        self.procesos.clear()
+
+
+def usar_nodos(nodos):
+    """
+    Apunta este proceso al clúster de prueba. El dict se modifica en su
+    sitio porque los demás módulos lo importaron con 'from Config import'.
+    """
+    NODOS_CONOCIDOS.clear()
+    NODOS_CONOCIDOS.update({f"nodo{i + 1}": addr for i, addr in enumerate(nodos)})
+
+
+def fase(operacion, tareas, concurrencia, cluster, fallo, retraso, rnd):
+    """
+    Ejecuta 'operacion(tarea)' para cada tarea con 'concurrencia' a la vez.
+    Devuelve (segundos, [duración de cada operación correcta], errores,
+    nodo matado o None).
+    """
+    matado = []
+    if fallo:
+        victima = rnd.choice(sorted(cluster.procesos))
+        temporizador = threading.Timer(retraso, lambda: matado.append(cluster.kill(victima) or victima))
+        temporizador.start()
+
+    def medida(tarea):
+        inicio = time.perf_counter()
+        operacion(tarea)
+        return time.perf_counter() - inicio
+
+    duraciones = []
+    errores = 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        for future in [executor.submit(medida, tarea) for tarea in tareas]:
+            try:
+                duraciones.append(future.result())
+            except Exception:
+                errores += 1
+    total = time.perf_counter() - inicio
+    if fallo:
+        temporizador.cancel()
+    return total, duraciones, errores, (matado[0] if matado else None)
+
+
+def prueba_cluster(args):
+    rnd = random.Random(args.seed)
+    resultados = []
+    with tempfile.TemporaryDirectory() as directorio:
+        cluster = LocalCluster(args.nodes, args.port, directorio, args.capacity_mb)
+        usar_nodos(cluster.nodos)
+        cluster.start()
+        dfs = DFSNode(on_log=(lambda m: print(m, file=sys.stderr)) if args.verbose else (lambda m: None))
+        try:
+            cluster.wait_ready(dfs.dfs_client)
+            dfs.start()
+            # Heartbeats continuos: la ubicación tiene que enterarse de un nodo caído
+            dfs.placement.start()
+
+            datos = os.path.join(directorio, "datos")
+            os.makedirs(datos)
+            print(f"{'op':<4} {'bloque':>7} {'archivo':>8} {'conc':>5} {'MB/s':>8} "
+                  f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8} {'fallo':>6}")
+            for file_size in [parse_size(x) for x in args.file_sizes.split(",")]:
+                # Los mismos archivos sirven para toda la fila: tras cada
+                # prueba se borran del sistema, así que no se deduplican
+                rutas = []
+                for i in range(args.files):
+                    ruta = os.path.join(datos, f"f{formato_size(file_size)}_{i}.dat")
+                    with open(ruta, 'wb') as f:
+                        f.write(os.urandom(file_size) if args.data == "aleatorio"
+                                else generar_texto(file_size, rnd.random()))
+                    rutas.append(ruta)
+                for block_size in [parse_size(x) for x in args.block_sizes.split(",")]:
+                    for concurrencia in [int(x) for x in args.concurrency.split(",")]:
+                        resultados += medir_cluster(args, dfs, cluster, rutas, file_size, block_size,
+                                                    concurrencia, directorio, rnd)
+                for ruta in rutas:
+                    os.remove(ruta)
+        finally:
+            dfs.close()
+            cluster.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"commit": commit_actual(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": sys.version.split()[0],
+                       "params": {k: v for k, v in vars(args).items() if k != "prueba"},
+                       "results": resultados}, f, indent=2)
+    if args.compare:
+        comparar(args.compare, resultados)
+    return 1 if any(r["errors"] for r in resultados) and not args.fault else 0
+
+
+def medir_cluster(args, dfs, cluster, rutas, file_size, block_size, concurrencia, directorio, rnd):
+    salida = os.path.join(directorio, "salida")
+    os.makedirs(salida, exist_ok=True)
+
+    def subir(ruta):
+        dfs.put(ruta, block_size=block_size)
+
+    def descargar(ruta):
+        destino = os.path.join(salida, os.path.basename(ruta))
+        dfs.get(os.path.basename(ruta), destino)
+        if not filecmp.cmp(ruta, destino, shallow=False):
+            raise IOError(f"La descarga de {ruta} no coincide con el original")
+
+    resultados = []
+    for op, operacion in (("put", subir), ("get", descargar)):
+        total, duraciones, errores, matado = fase(operacion, rutas, concurrencia, cluster,
+                                                  args.fault == op, args.fault_after, rnd)
+        r = {"op": op, "block_size": block_size, "file_size": file_size, "concurrency": concurrencia,
+             "files": len(rutas), "errors": errores, "fault": op if args.fault == op else None,
+             "mb_s": file_size * len(duraciones) / total / 1e6,
+             "p50_ms": percentil(duraciones, 50) * 1000 if duraciones else None,
+             "p95_ms": percentil(duraciones, 95) * 1000 if duraciones else None,
+             "p99_ms": percentil(duraciones, 99) * 1000 if duraciones else None}
+        resultados.append(r)
+        ms = [f"{r[k]:>8.1f}" if r[k] is not None else f"{'-':>8}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{op:<4} {formato_size(block_size):>7} {formato_size(file_size):>8} {concurrencia:>5} "
+              f"{r['mb_s']:>8.1f} {' '.join(ms)} {errores:>8} {'sí' if matado else '':>6}", flush=True)
+        if matado:
+            cluster.start(matado)
+            cluster.wait_ready(dfs.dfs_client)
+
+    # Limpieza fuera de la medida: el siguiente caso empieza con los nodos vacíos
+    for ruta in rutas:
+        try:
+            dfs.rm(os.path.basename(ruta))
+        except FileNotFoundError:
+            pass
+        destino = os.path.join(salida, os.path.basename(ruta))
+        if os.path.exists(destino):
+            os.remove(destino)
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(DAEMON),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(ruta, resultados):
+    """Compara 'resultados' con los de una ejecución anterior (--json) caso a caso."""
+    with open(ruta, encoding='utf-8') as f:
+        anterior = json.load(f)
+    clave = lambda r: (r["op"], r["block_size"], r["file_size"], r["concurrency"], r["fault"])
+    previos = {clave(r): r for r in anterior["results"]}
+    print(f"\nComparación con {ruta} (commit {anterior.get('commit') or '?'}):")
+    print(f"{'op':<4} {'bloque':>7} {'archivo':>8} {'conc':>5} {'MB/s':>16} {'p95 ms':>18}")
+    comunes = [(r, previos[clave(r)]) for r in resultados if clave(r) in previos]
+    if not comunes:
+        print("Ningún caso coincide (operación, bloque, archivo, concurrencia y fallo).")
+    for r, previo in comunes:
+        cambio_mbs = (r["mb_s"] / previo["mb_s"] - 1) * 100 if previo["mb_s"] else 0.0
+        p95 = "-"
+        if r["p95_ms"] is not None and previo["p95_ms"]:
+            p95 = f"{previo['p95_ms']:.0f} -> {r['p95_ms']:.0f} ({(r['p95_ms'] / previo['p95_ms'] - 1) * 100:+.0f}%)"
+        print(f"{r['op']:<4} {formato_size(r['block_size']):>7} {formato_size(r['file_size']):>8} "
+              f"{r['concurrency']:>5} {previo['mb_s']:>6.1f} -> {r['mb_s']:<6.1f} {cambio_mbs:+4.0f}% {p95:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bancos de pruebas de SADTF.")
+    sub = parser.add_subparsers(dest="prueba", required=True)
+
+    p = sub.add_parser("cluster", help="subidas y descargas contra N nodos en procesos aparte")
+    p.add_argument("--nodes", type=int, default=3, help="nodos a levantar")
+    p.add_argument("--port", type=int, default=58101, help="primer puerto de los nodos")
+    p.add_argument("--block-sizes", default="256K,1M,4M", help="tamaños de bloque, separados por comas")
+    p.add_argument("--file-sizes", default="1M,16M", help="tamaños de archivo, separados por comas")
+    p.add_argument("--concurrency", default="1,4", help="operaciones a la vez, separadas por comas")
+    p.add_argument("--files", type=int, default=8, help="archivos por caso")
+    p.add_argument("--data", choices=("aleatorio", "texto"), default="aleatorio",
+                   help="contenido de los archivos (el texto se comprime)")
+    p.add_argument("--capacity-mb", type=int, default=1 << 20, help="capacidad de cada nodo")
+    p.add_argument("--fault", choices=("put", "get"), help="matar un nodo a mitad de esta fase")
+    p.add_argument("--fault-after", type=float, default=0.05, help="segundos antes de matarlo")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", help="guardar los resultados en este archivo")
+    p.add_argument("--compare", help="comparar con los resultados guardados de otra ejecución")
+    p.add_argument("--verbose", action="store_true", help="mostrar los avisos del cliente")
+
+    p = sub.add_parser("compresion", help="ritmo con y sin compresión de bloques")
+    p.add_argument("--size", type=int, default=32, help="MB de cada archivo de prueba")
+    p.add_argument("--nodes", type=int, default=2, help="nodos locales a levantar")
+    p.add_argument("--codecs", default="zlib,lzma,bz2", help="códecs a comparar, separados por comas")
+    p.add_argument("--link-mbps", type=float, default=100, help="enlace simulado (megabits/s)")
+    p.add_argument("--port", type=int, default=58001, help="primer puerto de los nodos")
+
+    args = parser.parse_args()
+    return prueba_cluster(args) if args.prueba == "cluster" else prueba_compresion(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# Cache.py
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+from Compression import decodificar_bloque, nombre_contenido
+from Config import CACHE_MEMORY_MB, CACHE_DISK_MB, SERVER_CACHE_MB
+from Utils import hash_bloque
+
+_HEX = frozenset("0123456789abcdef")
+
+
+def _por_contenido(nombre_bloque):
+    """
+    Los bloques nombrados por su SHA-256 (con o sin sufijo de compresión)
+    nunca cambian de contenido: se pueden cachear.
+    """
+    contenido = nombre_contenido(nombre_bloque)
+    return len(contenido) == 64 and _HEX.issuperset(contenido)
+
+
+# --- Caché de Bloques del Cliente ---
+
+class BlockCache:
+    """
+    Caché de lectura de bloques con dos niveles, ambos con expulsión LRU y
+    limitados en bytes:
+
+    - memoria: los bloques más recientes ('memory_bytes').
+    - disco: un directorio propio ('disk_dir', 'disk_bytes'). Los bloques
+      expulsados de memoria no se pierden mientras quepan aquí.
+
+    Además, si este nodo es una de las réplicas del bloque ('local_addr'),
+    se lee directamente de su almacenamiento ('local_dir') sin pasar por
+    la red.
+
+    Solo se cachean bloques direccionados por contenido (nombre = SHA-256):
+    al leerlos de disco se comprueba que el hash coincide, y si no, la
+    entrada se descarta. La caché guarda siempre los bytes originales; un
+    bloque comprimido leído del almacenamiento local se descomprime antes.
+    Los bloques con nombres antiguos (archivo_bN.bin) pueden cambiar de
+    contenido y siempre se piden a la red.
+    """
+    def __init__(self, memory_bytes=CACHE_MEMORY_MB * 1024 * 1024,
+                 disk_bytes=CACHE_DISK_MB * 1024 * 1024, disk_dir=None,
+                 local_addr=None, local_dir=None):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self.disk_dir = disk_dir
+        self.local_addr = tuple(local_addr) if local_addr else None
+        self.local_dir = local_dir
+
+        self.lock = threading.Lock()
+        self._memoria = OrderedDict()
+        self._memoria_usada = 0
+        self._disco = OrderedDict()
+        self._disco_usado = 0
+        self.hits = {"memory": 0, "disk": 0, "local": 0}
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._cargar_disco()
+
+    def _cargar_disco(self):
+        """Recupera el índice del nivel de disco de una ejecución anterior (más antiguos primero)."""
+        entradas = []
+        for entrada in os.scandir(self.disk_dir):
+            if entrada.is_file() and _por_contenido(entrada.name):
+                stat = entrada.stat()
+                entradas.append((stat.st_mtime, entrada.name, stat.st_size))
+            elif entrada.name.endswith('.tmp'):
+                os.remove(entrada.path)
+        for _, nombre_bloque, size in sorted(entradas):
+            self._disco[nombre_bloque] = size
+            self._disco_usado += size
+        self._recortar_disco()
+
+    # --- 1. Lectura ---
+
+    def get(self, nombre_bloque, replicas=()):
+        """Devuelve los bytes del bloque si están en caché (o en este nodo), o None."""
+        if not _por_contenido(nombre_bloque):
+            return None
+        with self.lock:
+            data = self._memoria.get(nombre_bloque)
+            if data is not None:
+                self._memoria.move_to_end(nombre_bloque)
+                self.hits["memory"] += 1
+                return data
+            en_disco = nombre_bloque in self._disco
+
+        if self.local_addr in [tuple(addr) for addr in replicas]:
+            data = self._leer_verificado(os.path.join(self.local_dir, nombre_bloque), nombre_bloque,
+                                         almacenado=True)
+            if data is not None:
+                with self.lock:
+                    self.hits["local"] += 1
+                return data
+
+        if en_disco:
+            data = self._leer_verificado(os.path.join(self.disk_dir, nombre_bloque), nombre_bloque)
+            with self.lock:
+                if data is None:
+                    self._quitar_disco(nombre_bloque)
+                else:
+                    self.hits["disk"] += 1
+                    if nombre_bloque in self._disco:
+                        self._disco.move_to_end(nombre_bloque)
+                    self._guardar_memoria(nombre_bloque, data)
+                    return data
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def _leer_verificado(self, ruta, nombre_bloque, almacenado=False):
+        """'almacenado': el archivo está tal cual lo guarda un nodo (quizá comprimido)."""
+        try:
+            with open(ruta, 'rb') as f:
+                data = f.read()
+            if almacenado:
+                data = decodificar_bloque(nombre_bloque, data)
+        except OSError:
+            return None
+        return data if hash_bloque(data) == nombre_contenido(nombre_bloque) else None
+
+    # --- 2. Escritura y expulsión ---
+
+    def put(self, nombre_bloque, data):
+        """Guarda un bloque recién descargado (ya descomprimido) en ambos niveles."""
+        if not _por_contenido(nombre_bloque):
+            return
+        data = bytes(data)
+        with self.lock:
+            self._guardar_memoria(nombre_bloque, data)
+            guardar_en_disco = (self.disk_bytes >= len(data)
+                                and nombre_bloque not in self._disco)
+        if guardar_en_disco:
+            ruta = os.path.join(self.disk_dir, nombre_bloque)
+            temporal = f"{ruta}.{threading.get_ident()}.tmp"
+            try:
+                with open(temporal, 'wb') as f:
+                    f.write(data)
+                os.replace(temporal, ruta)
+            except OSError:
+                return
+            with self.lock:
+                if nombre_bloque not in self._disco:
+                    self._disco[nombre_bloque] = len(data)
+                    self._disco_usado += len(data)
+                    self._recortar_disco()
+
+    def _guardar_memoria(self, nombre_bloque, data):
+        if len(data) > self.memory_bytes:
+            return
+        if nombre_bloque in self._memoria:
+            self._memoria.move_to_end(nombre_bloque)
+            return
+        self._memoria[nombre_bloque] = data
+        self._memoria_usada += len(data)
+        while self._memoria_usada > self.memory_bytes:
+            _, viejo = self._memoria.popitem(last=False)
+            self._memoria_usada -= len(viejo)
+
+    def _recortar_disco(self):
+        while self._disco_usado > self.disk_bytes and self._disco:
+            self._quitar_disco(next(iter(self._disco)))
+
+    def _quitar_disco(self, nombre_bloque):
+        size = self._disco.pop(nombre_bloque, None)
+        if size is None:
+            return
+        self._disco_usado -= size
+        try:
+            os.remove(os.path.join(self.disk_dir, nombre_bloque))
+        except OSError:
+            pass
+
+    def invalidate(self, nombre_bloque):
+        """Olvida un bloque (por ejemplo, al borrarse el último archivo que lo usaba)."""
+        with self.lock:
+            data = self._memoria.pop(nombre_bloque, None)
+            if data is not None:
+                self._memoria_usada -= len(data)
+            self._quitar_disco(nombre_bloque)
+
+    def stats(self):
+        """Contadores de aciertos por nivel, fallos y ocupación."""
+        with self.lock:
+            aciertos = sum(self.hits.values())
+            total = aciertos + self.misses
+            return {"hits": dict(self.hits), "misses": self.misses,
+                    "hit_ratio": aciertos / total if total else 0.0,
+                    "memory_bytes": self._memoria_usada, "disk_bytes": self._disco_usado}
+
+
+# --- Caché de Bloques Calientes del Servidor ---
+
+class HotBlockCache:
+    """
+    Bloques recién leídos del disco de un nodo, en memoria y con expulsión
+    LRU dentro de 'budget' bytes. Se guardan como memoryview, así que un
+    bloque (o un rango de él) se envía al socket sin copiarlo.
+
+    Varias peticiones simultáneas del mismo bloque que no está en memoria
+    esperan a una única lectura del disco. Se usa desde el bucle asyncio
+    del servidor: la lectura se hace en un hilo del executor y el resto
+    sin bloqueos.
+    """
+    def __init__(self, budget=SERVER_CACHE_MB * 1024 * 1024):
+        self.budget = budget
+        self._bloques = OrderedDict()
+        self._usado = 0
+        self._cargando = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __contains__(self, nombre_bloque):
+        return nombre_bloque in self._bloques or nombre_bloque in self._cargando
+
+    async def get(self, nombre_bloque, ruta):
+        """Devuelve el contenido del bloque como memoryview (o None si no existe)."""
+        view = self._bloques.get(nombre_bloque)
+        if view is not None:
+            self._bloques.move_to_end(nombre_bloque)
+            self.hits += 1
+            return view
+        futuro = self._cargando.get(nombre_bloque)
+        if futuro is not None:
+            self.coalesced += 1
+            return await asyncio.shield(futuro)
+        self.misses += 1
+        return await self._cargar(nombre_bloque, ruta)
+
+    async def prefetch(self, nombre_bloque, ruta):
+        """Lee por adelantado un bloque que probablemente se pida pronto."""
+        if nombre_bloque not in self:
+            await self._cargar(nombre_bloque, ruta)
+
+    async def _cargar(self, nombre_bloque, ruta):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._cargando[nombre_bloque] = futuro
+        try:
+            data = await loop.run_in_executor(None, _leer_bloque, ruta)
+        except BaseException as e:
+            if self._cargando.get(nombre_bloque) is futuro:
+                del self._cargando[nombre_bloque]
+            futuro.set_exception(e)
+            # Nadie más esperaba: evita el aviso de excepción no recuperada
+            futuro.exception()
+            raise
+        view = memoryview(data) if data is not None else None
+        # Si el bloque se invalidó mientras se leía, no se guarda
+        if self._cargando.get(nombre_bloque) is futuro:
+            del self._cargando[nombre_bloque]
+            if view is not None:
+                self._guardar(nombre_bloque, view)
+        futuro.set_result(view)
+        return view
+
+    def _guardar(self, nombre_bloque, view):
+        if len(view) > self.budget:
+            return
+        self._bloques[nombre_bloque] = view
+        self._usado += len(view)
+        while self._usado > self.budget:
+            _, viejo = self._bloques.popitem(last=False)
+            self._usado -= len(viejo)
+
+    def invalidate(self, nombre_bloque):
+        """Olvida un bloque que se sobrescribió o se borró del disco."""
+        view = self._bloques.pop(nombre_bloque, None)
+        if view is not None:
+            self._usado -= len(view)
+        self._cargando.pop(nombre_bloque, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "blocks": len(self._bloques), "bytes": self._usado}
+
+
+def _leer_bloque(ruta):
+    try:
+        with open(ruta, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,339 @@
+# Catalog.py
+
+import sys
+from bisect import bisect_left
+
+# --- Representación Compacta de la Tabla de Bloques ---
+#
+# En la red y en disco los archivos siguen viajando en el formato de
+# siempre ({'size', 'date', 'blocks': [[nombre, original, copia, attrs]]}).
+# En memoria cada archivo es un FileRecord con una tupla de BlockRecord, y
+# cada nodo (ip, puerto) se guarda una sola vez y se referencia por un
+# entero. Con millones de bloques esto evita millones de listas y tuplas
+# repetidas.
+
+
+class NodeTable:
+    """Asigna a cada dirección (ip, puerto) un id entero estable."""
+    __slots__ = ('ids', 'addrs')
+
+    def __init__(self):
+        self.ids = {}
+        self.addrs = []
+
+    def intern(self, addr):
+        addr = (addr[0], addr[1])
+        node_id = self.ids.get(addr)
+        if node_id is None:
+            node_id = len(self.addrs)
+            self.ids[addr] = node_id
+            self.addrs.append(addr)
+        return node_id
+
+    def lookup(self, addr):
+        return self.ids.get((addr[0], addr[1]))
+
+    def addr(self, node_id):
+        return self.addrs[node_id]
+
+
+class BlockRecord:
+    """
+    Un bloque dentro de un archivo. 'nodes' son los ids de los nodos que lo
+    guardan (original, copia y réplicas extra, en ese orden). 'extra' guarda
+    los atributos que este módulo no interpreta, o None.
+    """
+    __slots__ = ('name', 'nodes', 'offset', 'size', 'extra')
+
+    def __init__(self, name, nodes, offset, size, extra):
+        self.name = name
+        self.nodes = nodes
+        self.offset = offset
+        self.size = size
+        self.extra = extra
+
+
+class FileRecord:
+    __slots__ = ('size', 'date', 'blocks')
+
+    def __init__(self, size, date, blocks):
+        self.size = size
+        self.date = date
+        self.blocks = blocks
+
+
+class Catalog:
+    """
+    Archivos y bloques con índices secundarios que se mantienen al añadir
+    o quitar cada archivo, para no recorrer toda la tabla en cada consulta:
+
+    - block_refs:  bloque -> cuántos archivos lo usan.
+    - block_nodes: bloque -> ids de los nodos que lo guardan.
+    - node_blocks: id de nodo -> {bloque: referencias} (qué hay en cada nodo).
+    - node_bytes:  id de nodo -> bytes de bloques distintos que guarda.
+    - names:       nombres de archivo ordenados (listados y prefijos).
+    - by_size:     pares (tamaño, nombre) ordenados.
+    - block_file:  bloque -> (archivo, posición) de un archivo que lo usa,
+                   para leer por adelantado (ver next_blocks) y para
+                   block_record/block_ref.
+    - block_otros: bloque -> {archivo: posición} de los demás archivos que
+                   lo usan; solo existe para bloques compartidos, y sirve
+                   para reapuntar block_file cuando su archivo se borra.
+
+    names y by_size no se mantienen en cada alta: se ordenan la primera vez
+    que se consultan tras un cambio. Cargar millones de archivos cuesta así
+    una sola ordenación, no un desplazamiento de la lista por archivo.
+    """
+    def __init__(self):
+        self.nodes = NodeTable()
+        self.files = {}
+        self.block_refs = {}
+        self.block_nodes = {}
+        self.node_blocks = {}
+        self.node_bytes = {}
+        self._names = []
+        self._by_size = []
+        self.block_file = {}
+        self.block_otros = {}
+        self.total_size = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, nombre):
+        return nombre in self.files
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = sorted(self.files)
+        return self._names
+
+    @property
+    def by_size(self):
+        if self._by_size is None:
+            self._by_size = sorted((registro.size, nombre) for nombre, registro in self.files.items())
+        return self._by_size
+
+    # --- 1. Conversión desde/hacia el formato de la red ---
+
+    def _decode_block(self, entrada):
+        attrs = entrada[3] if len(entrada) > 3 else {}
+        nodos = []
+        for addr in [entrada[1], entrada[2]] + list(attrs.get('replicas', ())):
+            node_id = self.nodes.intern(addr)
+            if node_id not in nodos:
+                nodos.append(node_id)
+        extra = {k: v for k, v in attrs.items() if k not in ('offset', 'size', 'replicas')}
+        return BlockRecord(sys.intern(entrada[0]), tuple(nodos), attrs.get('offset'),
+                           attrs.get('size'), extra or None)
+
+    def encode_block(self, bloque):
+        addrs = [self.nodes.addr(node_id) for node_id in bloque.nodes]
+        attrs = dict(bloque.extra) if bloque.extra else {}
+        if bloque.offset is not None:
+            attrs['offset'] = bloque.offset
+        if bloque.size is not None:
+            attrs['size'] = bloque.size
+        if len(addrs) > 2:
+            attrs['replicas'] = addrs[2:]
+        return [bloque.name, addrs[0], addrs[1] if len(addrs) > 1 else addrs[0], attrs]
+
+    def encode_file(self, registro):
+        return {'size': registro.size, 'date': registro.date,
+                'blocks': [self.encode_block(b) for b in registro.blocks]}
+
+    def to_dict(self):
+        return {nombre: self.encode_file(registro) for nombre, registro in self.files.items()}
+
+    # --- 2. Altas y bajas ---
+
+    def put(self, nombre, data):
+        """
+        Pone 'data' (formato de la red, o None para borrar) como contenido
+        de 'nombre'. Devuelve, en formato de la red, los bloques de la
+        versión anterior que ya ningún archivo usa.
+        """
+        viejo = self.files.pop(nombre, None)
+        self._names = self._by_size = None
+        if viejo is not None:
+            self.total_size -= viejo.size
+        if data is not None:
+            registro = FileRecord(data['size'], data.get('date', 'N/A'),
+                                  tuple(self._decode_block(e) for e in data['blocks']))
+            self.files[nombre] = registro
+            self.total_size += registro.size
+            self._contar(registro.blocks, +1)
+            for i, bloque in enumerate(registro.blocks):
+                pista = self.block_file.get(bloque.name)
+                if pista is not None and pista[0] != nombre:
+                    self.block_otros.setdefault(bloque.name, {})[pista[0]] = pista[1]
+                self.block_file[bloque.name] = (nombre, i)
+        # Las bajas se cuentan después de las altas: un bloque que sigue en
+        # la versión nueva nunca llega a quedarse sin referencias
+        return self._contar(viejo.blocks, -1, nombre) if viejo is not None else []
+
+    def clear(self):
+        self.__init__()
+
+    def set_block_nodes(self, nombre, bloques):
+        """
+        Cambia los nodos de algunos bloques de 'nombre' ({bloque: [addr]})
+        sin tocar el resto del archivo, y actualiza los índices por nodo.
+        """
+        registro = self.files.get(nombre)
+        if registro is None:
+            return
+        vistos = set()
+        for bloque in registro.blocks:
+            addrs = bloques.get(bloque.name)
+            if addrs is None:
+                continue
+            nuevos = []
+            for addr in addrs:
+                node_id = self.nodes.intern(addr)
+                if node_id not in nuevos:
+                    nuevos.append(node_id)
+            nuevos = tuple(nuevos)
+            # Un bloque repetido en el archivo cuenta una sola vez por nodo
+            if bloque.name not in vistos:
+                vistos.add(bloque.name)
+                for node_id in bloque.nodes:
+                    if node_id not in nuevos:
+                        self._contar_en_nodo(node_id, bloque, -1)
+                for node_id in nuevos:
+                    if node_id not in bloque.nodes:
+                        self._contar_en_nodo(node_id, bloque, +1)
+                self.block_nodes[bloque.name] = nuevos
+            bloque.nodes = nuevos
+
+    def _contar(self, bloques, delta, nombre=None):
+        """
+        Suma 'delta' a las referencias de 'bloques'. En una baja, 'nombre'
+        es el archivo que los usaba. Devuelve los que se quedan sin
+        referencias, en formato de la red.
+        """
+        sin_referencias = []
+        vistos = set()
+        for bloque in bloques:
+            if bloque.name in vistos:
+                continue
+            vistos.add(bloque.name)
+            for node_id in bloque.nodes:
+                self._contar_en_nodo(node_id, bloque, delta)
+            refs = self.block_refs.get(bloque.name, 0) + delta
+            if refs > 0:
+                self.block_refs[bloque.name] = refs
+                if delta > 0:
+                    self.block_nodes[bloque.name] = bloque.nodes
+                else:
+                    self._reapuntar(bloque.name, nombre)
+            else:
+                self.block_refs.pop(bloque.name, None)
+                self.block_nodes.pop(bloque.name, None)
+                self.block_file.pop(bloque.name, None)
+                self.block_otros.pop(bloque.name, None)
+                sin_referencias.append(self.encode_block(bloque))
+        return sin_referencias
+
+    def _reapuntar(self, nombre_bloque, borrado):
+        """
+        Tras quitar una versión de 'borrado' que usaba 'nombre_bloque' (que
+        aún usan otros archivos), deja block_file y block_nodes apuntando a
+        un archivo que siga usándolo.
+        """
+        otros = self.block_otros.get(nombre_bloque, {})
+        if borrado in otros and self._en_archivo(nombre_bloque, borrado, otros[borrado]) is None:
+            del otros[borrado]
+        pista = self.block_file.get(nombre_bloque)
+        registro = self._en_archivo(nombre_bloque, *pista) if pista is not None else None
+        while registro is None and otros:
+            pista = otros.popitem()
+            registro = self._en_archivo(nombre_bloque, *pista)
+        if registro is not None:
+            self.block_file[nombre_bloque] = pista
+            self.block_nodes[nombre_bloque] = registro.blocks[pista[1]].nodes
+        if not otros:
+            self.block_otros.pop(nombre_bloque, None)
+
+    def _en_archivo(self, nombre_bloque, nombre, i):
+        """El FileRecord de 'nombre' si su bloque 'i' es 'nombre_bloque', o None."""
+        registro = self.files.get(nombre)
+        if registro is None or i >= len(registro.blocks) or registro.blocks[i].name != nombre_bloque:
+            return None
+        return registro
+
+    def _contar_en_nodo(self, node_id, bloque, delta):
+        en_nodo = self.node_blocks.setdefault(node_id, {})
+        refs = en_nodo.get(bloque.name, 0) + delta
+        if refs > 0:
+            if bloque.name not in en_nodo:
+                self.node_bytes[node_id] = self.node_bytes.get(node_id, 0) + (bloque.size or 0)
+            en_nodo[bloque.name] = refs
+        elif en_nodo.pop(bloque.name, None) is not None:
+            self.node_bytes[node_id] -= bloque.size or 0
+
+    # --- 3. Consultas ---
+
+    def block_replicas(self, nombre_bloque):
+        nodos = self.block_nodes.get(nombre_bloque, ())
+        return [self.nodes.addr(node_id) for node_id in nodos]
+
+    def blocks_on_node(self, addr):
+        node_id = self.nodes.lookup(addr)
+        return list(self.node_blocks.get(node_id, ())) if node_id is not None else []
+
+    def bytes_on_node(self, addr):
+        node_id = self.nodes.lookup(addr)
+        return self.node_bytes.get(node_id, 0) if node_id is not None else 0
+
+    def _pista(self, nombre_bloque):
+        """(FileRecord, posición) de un archivo que usa el bloque, o (None, 0)."""
+        nombre, i = self.block_file.get(nombre_bloque, (None, 0))
+        registro = self._en_archivo(nombre_bloque, nombre, i)
+        return (registro, i) if registro is not None else (None, 0)
+
+    def block_record(self, nombre_bloque):
+        """El BlockRecord de 'nombre_bloque' en algún archivo, o None."""
+        registro, i = self._pista(nombre_bloque)
+        return registro.blocks[i] if registro is not None else None
+
+    def block_ref(self, nombre_bloque):
+        """
+        {'file', 'file_size', 'offsets', 'size'} de un archivo que usa el
+        bloque (lo que el cliente envía con UPLOAD_BLOCK), o None si no se
+        conoce o el archivo no guarda offsets.
+        """
+        registro, i = self._pista(nombre_bloque)
+        if registro is None or registro.blocks[i].offset is None:
+            return None
+        nombre, _ = self.block_file[nombre_bloque]
+        return {"file": nombre, "file_size": registro.size,
+                "offsets": [b.offset for b in registro.blocks if b.name == nombre_bloque],
+                "size": registro.blocks[i].size}
+
+    def next_blocks(self, nombre_bloque, n, addr=None):
+        """
+        Nombres de los 'n' bloques que siguen a 'nombre_bloque' en su
+        archivo (solo los que guarda 'addr', si se indica). Si el archivo de
+        la pista ya no existe o cambió, devuelve [].
+        """
+        registro, i = self._pista(nombre_bloque)
+        if registro is None:
+            return []
+        node_id = self.nodes.lookup(addr) if addr is not None else None
+        if addr is not None and node_id is None:
+            return []
+        return [b.name for b in registro.blocks[i + 1:i + 1 + n]
+                if node_id is None or node_id in b.nodes]
+
+    def names_with_prefix(self, prefijo):
+        inicio = bisect_left(self.names, prefijo)
+        fin = inicio
+        while fin < len(self.names) and self.names[fin].startswith(prefijo):
+            fin += 1
+        return self.names[inicio:fin]
+
+    def largest(self, n):
+        """Los 'n' archivos más grandes, de mayor a menor: [(tamaño, nombre)]."""
+        return self.by_size[max(0, len(self.by_size) - n):][::-1]
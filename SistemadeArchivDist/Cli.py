@@ -0,0 +1,200 @@
+# Cli.py
+
+import argparse
+import json
+import shlex
+import sys
+
+from Config import CHUNKING, ERASURE_K, ERASURE_M, ERASURE_SCHEME, NODOS_CONOCIDOS
+
+# --- Línea de Comandos ---
+#
+# Cliente sin GUI para scripts y servidores. Cada invocación trae los
+# metadatos de los nodos, hace su trabajo y les envía los cambios:
+#
+#     python Cli.py put datos.csv video.mp4
+#     python Cli.py put --erasure copia_2023.tar
+#     python Cli.py put --cdc exportacion.csv   # cortes por contenido (Chunking.py)
+#     python Cli.py update exportacion.csv      # envía solo los bloques que cambiaron
+#     python Cli.py ls
+#     python Cli.py --json stat datos.csv
+#     python Cli.py get datos.csv /tmp/datos.csv
+#     python Cli.py rm video.mp4
+#     python Cli.py stats 127.0.0.1:50001  # métricas (todos los nodos si no se indica)
+#     python Cli.py batch ordenes.txt      # una orden por línea ('-' = stdin)
+#
+# El modo batch ejecuta muchas órdenes con una sola sincronización de
+# metadatos y las mismas conexiones. Los avisos van a la salida de
+# errores; la salida estándar solo lleva resultados (con --json, un objeto
+# JSON por línea). Devuelve 1 si alguna orden falló.
+
+
+def construir_parser():
+    parser = argparse.ArgumentParser(prog="Cli.py", description="Cliente de línea de comandos de SADTF.")
+    parser.add_argument("--json", action="store_true", help="resultados en JSON, uno por línea")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("put", help="sube uno o más archivos")
+    p.add_argument("archivos", nargs="+")
+    p.add_argument("--erasure", action="store_true",
+                   help=f"archivo frío: erasure coding {ERASURE_K}+{ERASURE_M} en vez de réplicas")
+    p.add_argument("--cdc", action="store_true",
+                   help="partir por contenido, para que las versiones siguientes se actualicen baratas")
+    p = sub.add_parser("update", help="nueva versión de archivos ya guardados: envía solo lo que cambió")
+    p.add_argument("archivos", nargs="+")
+    p = sub.add_parser("get", help="descarga un archivo")
+    p.add_argument("nombre")
+    p.add_argument("destino", nargs="?", help="ruta local (por defecto, el nombre del archivo)")
+    p = sub.add_parser("rm", help="elimina uno o más archivos")
+    p.add_argument("nombres", nargs="+")
+    sub.add_parser("ls", help="lista los archivos")
+    p = sub.add_parser("stat", help="atributos y bloques de un archivo")
+    p.add_argument("nombre")
+    p = sub.add_parser("stats", help="métricas de los nodos, en formato de Prometheus")
+    p.add_argument("nodos", nargs="*", metavar="ip:puerto", help="por defecto, todos los de Config.py")
+    p = sub.add_parser("batch", help="ejecuta las órdenes de un archivo, una por línea")
+    p.add_argument("archivo", nargs="?", default="-", type=argparse.FileType("r", encoding="utf-8"),
+                   help="'-' para leerlas de stdin")
+    return parser
+
+
+def _mostrar(args, datos, texto):
+    print(json.dumps(datos) if args.json else texto, flush=True)
+
+
+# --- 1. Órdenes ---
+
+def cmd_put(dfs, args):
+    erasure = None
+    if args.erasure:
+        from Erasure import ErasureCode
+        erasure = ErasureCode(ERASURE_K, ERASURE_M, ERASURE_SCHEME)
+    chunking = "cdc" if args.cdc else CHUNKING
+    if erasure is None:
+        # Todos juntos: los bloques pequeños viajan en lotes por nodo
+        subidos = dfs.put_many(args.archivos, chunking=chunking)
+    else:
+        subidos = (dfs.put(ruta, erasure=erasure, chunking=chunking) for ruta in args.archivos)
+    for nombre, size, block_map in subidos:
+        _mostrar(args, {"name": nombre, "size": size, "blocks": len(block_map)},
+                 f"{nombre}: {size} bytes en {len(block_map)} bloques")
+
+
+def cmd_update(dfs, args):
+    for ruta in args.archivos:
+        r = dfs.update(ruta)
+        _mostrar(args, r, f"{r['name']}: {r['size']} bytes en {r['blocks']} bloques ({r['reused']} sin "
+                          f"cambios), {r['sent_bytes']} bytes enviados, {r['deleted']} bloques liberados")
+
+
+def cmd_get(dfs, args):
+    ruta = dfs.get(args.nombre, args.destino)
+    _mostrar(args, {"name": args.nombre, "path": ruta}, ruta)
+
+
+def cmd_rm(dfs, args):
+    borrados = dfs.rm_many(args.nombres)
+    for nombre in args.nombres:
+        if nombre in borrados:
+            _mostrar(args, {"name": nombre, "blocks_deleted": borrados[nombre]},
+                     f"{nombre}: eliminado ({borrados[nombre]} bloques liberados)")
+    faltan = [nombre for nombre in args.nombres if nombre not in borrados]
+    if faltan:
+        raise FileNotFoundError(f"No existen en los metadatos: {', '.join(faltan)}")
+
+
+def cmd_ls(dfs, args):
+    for nombre, size, date in dfs.ls():
+        _mostrar(args, {"name": nombre, "size": size, "date": date},
+                 f"{nombre:<30} {date:<15} {size / 1024:,.0f} KB")
+
+
+def cmd_stat(dfs, args):
+    info = dfs.stat(args.nombre)
+    if args.json:
+        _mostrar(args, dict(info, name=args.nombre), None)
+    else:
+        print(dfs.metadata_manager.get_file_attributes(args.nombre), end="", flush=True)
+
+
+def cmd_stats(dfs, args):
+    from Metrics import to_prometheus
+    nodos = [(h, int(p)) for h, p in (n.rsplit(":", 1) for n in args.nodos)] \
+        or [tuple(addr) for addr in NODOS_CONOCIDOS.values()]
+    todas = {"counters": [], "gauges": [], "histograms": []}
+    fallos = []
+    for addr in nodos:
+        nodo = f"{addr[0]}:{addr[1]}"
+        stats = dfs.stats(addr)
+        if stats is None:
+            fallos.append(nodo)
+            continue
+        if args.json:
+            _mostrar(args, {"node": nodo, "stats": stats}, None)
+            continue
+        # Una sola salida para todos los nodos, distinguidos por la etiqueta 'node'
+        for tipo, metricas in stats.items():
+            todas.setdefault(tipo, []).extend(dict(m, labels=dict(m["labels"], node=nodo))
+                                              for m in metricas)
+    if not args.json:
+        print(to_prometheus(todas), end="", flush=True)
+    if fallos:
+        raise ConnectionError(f"Sin respuesta de {', '.join(fallos)}")
+
+
+COMANDOS = {"put": cmd_put, "update": cmd_update, "get": cmd_get, "rm": cmd_rm, "ls": cmd_ls,
+            "stat": cmd_stat, "stats": cmd_stats}
+
+
+# --- 2. Ejecución ---
+
+def ejecutar(dfs, args):
+    """Ejecuta una orden ya analizada. Devuelve True si terminó bien."""
+    try:
+        COMANDOS[args.comando](dfs, args)
+        return True
+    except Exception as e:
+        print(f"Error en {args.comando}: {e}", file=sys.stderr, flush=True)
+        return False
+
+
+def ejecutar_lote(dfs, parser, args):
+    ok = True
+    with args.archivo:
+        for numero, linea in enumerate(args.archivo, 1):
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            try:
+                orden = parser.parse_args(shlex.split(linea))
+            except SystemExit:
+                # argparse ya explicó el error
+                print(f"Línea {numero} ignorada: {linea}", file=sys.stderr, flush=True)
+                ok = False
+                continue
+            if orden.comando == "batch":
+                print(f"Línea {numero}: batch no se puede anidar", file=sys.stderr, flush=True)
+                ok = False
+                continue
+            orden.json = orden.json or args.json
+            ok = ejecutar(dfs, orden) and ok
+    return ok
+
+
+def main(argv=None):
+    parser = construir_parser()
+    args = parser.parse_args(argv)
+
+    # Importación diferida: --help y los errores de uso no cargan el cliente
+    from Node import DFSNode
+
+    with DFSNode(on_log=lambda mensaje: print(mensaje, file=sys.stderr, flush=True)) as dfs:
+        if args.comando == "batch":
+            ok = ejecutar_lote(dfs, parser, args)
+        else:
+            ok = ejecutar(dfs, args)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
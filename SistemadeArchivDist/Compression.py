@@ -0,0 +1,100 @@
+# Compression.py
+
+import bz2
+import lzma
+import zlib
+
+from Config import COMPRESSION_CODEC, COMPRESSION_MIN_SAVING, COMPRESSION_SAMPLE_SIZE
+
+# --- 1. Códecs ---
+# Cada códec es un par (comprimir, descomprimir) de bytes a bytes. Se
+# registran en CODECS por nombre (COMPRESSION_CODEC); registrar_codec()
+# permite añadir otros sin tocar este módulo.
+
+# Niveles rápidos: para superar a un enlace de 100 Mbit/s la compresión
+# tiene que ir bastante por encima de 12 MB/s por núcleo. En bz2 el nivel
+# solo fija el tamaño de bloque interno (100-900 KB): el 1 es igual de
+# rápido y usa menos memoria.
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=1), lzma.decompress),
+    "bz2": (lambda data: bz2.compress(data, 1), bz2.decompress),
+}
+
+
+def registrar_codec(nombre, comprimir, descomprimir):
+    if '.' in nombre or not nombre:
+        raise ValueError(f"Nombre de códec inválido: {nombre!r}")
+    CODECS[nombre] = (comprimir, descomprimir)
+
+
+# --- 2. Nombres de bloque ---
+# Un bloque comprimido se guarda como '<sha256 del contenido original>.<códec>'.
+# Así un mismo nombre siempre corresponde a los mismos bytes en disco, y
+# el bloque se puede descomprimir (y verificar) conociendo solo su nombre,
+# aunque lo haya subido otro archivo o se reconstruyan los metadatos.
+
+def codec_de_bloque(nombre_bloque):
+    """Códec con el que está guardado 'nombre_bloque', o None si no está comprimido."""
+    _, punto, codec = nombre_bloque.rpartition('.')
+    return codec if punto and codec in CODECS else None
+
+
+def nombre_almacenado(nombre_bloque, codec):
+    return f"{nombre_bloque}.{codec}" if codec else nombre_bloque
+
+
+def nombre_contenido(nombre_bloque):
+    """El nombre sin el sufijo del códec (el hash de los bytes originales)."""
+    codec = codec_de_bloque(nombre_bloque)
+    return nombre_bloque[:-len(codec) - 1] if codec else nombre_bloque
+
+
+# --- 3. Compresión adaptativa ---
+
+def muestrear(f, offset, size, sample_size=COMPRESSION_SAMPLE_SIZE, trozos=4):
+    """
+    Lee hasta 'sample_size' bytes del bloque [offset, offset+size) de 'f',
+    en 'trozos' tramos repartidos a lo largo del bloque (el principio de
+    un archivo suele parecerse poco al resto).
+    """
+    if size <= sample_size:
+        f.seek(offset)
+        return f.read(size)
+    tramo = sample_size // trozos
+    paso = (size - tramo) // (trozos - 1)
+    partes = []
+    for i in range(trozos):
+        f.seek(offset + i * paso)
+        partes.append(f.read(tramo))
+    return b''.join(partes)
+
+
+def elegir_codec(muestra, codec=COMPRESSION_CODEC, min_saving=COMPRESSION_MIN_SAVING):
+    """
+    Devuelve 'codec' si comprimir la muestra ahorra al menos 'min_saving'
+    (fracción de su tamaño), o None si no compensa: datos ya comprimidos
+    (vídeo, imágenes, zip) o aleatorios se envían tal cual.
+    """
+    if not codec or not muestra:
+        return None
+    comprimida = CODECS[codec][0](muestra)
+    return codec if len(comprimida) <= len(muestra) * (1 - min_saving) else None
+
+
+def comprimir(codec, data):
+    return CODECS[codec][0](data)
+
+
+def decodificar_bloque(nombre_bloque, data):
+    """
+    Bytes originales de un bloque a partir de los guardados. Lanza IOError
+    si están corruptos y no se pueden descomprimir.
+    """
+    codec = codec_de_bloque(nombre_bloque)
+    if codec is None:
+        return data
+    try:
+        return CODECS[codec][1](data)
+    except Exception as e:
+        raise IOError(f"El bloque {nombre_bloque} no se pudo descomprimir ({codec}): {e}")
@@ -28,6 +28,8 @@ LOCAL_STORAGE_DIR = "Espacio_Compartido" '''
 
 # Config.py (Versión de 2 Nodos)
 
+import os
+
 # --- Configuración de Red ---
 
 # Usar '127.0.0.1' (localhost) para probar todo en una PC
@@ -42,4 +44,80 @@ NODOS_CONOCIDOS = {
 # --- Configuración del Sistema de Archivos ---
 BLOCK_SIZE = 1024 * 1024 
 LOCAL_STORAGE_CAPACITY_MB = 75 
-LOCAL_STORAGE_DIR = "Espacio_Compartido"
\ No newline at end of file
+LOCAL_STORAGE_DIR = "Espacio_Compartido"
+REPLICATION_FACTOR = 2        # Nodos que guardan cada bloque (original + copias)
+REPLICATION_MODE = "chain"    # "chain": cliente -> primario -> secundario...
+                              # "fanout": el cliente envía a todos a la vez
+CHUNKING = "fixed"            # "fixed": bloques de BLOCK_SIZE
+                              # "cdc": cortes según el contenido (ver Chunking.py),
+                              # para resubir versiones editadas enviando solo lo nuevo
+METADATA_OPLOG_MAX = 10000    # Operaciones de metadatos que se conservan para
+                              # enviar deltas; un nodo más atrasado recibe
+                              # la tabla completa
+METADATA_FSYNC_INTERVAL = 0.005  # Segundos que se agrupan escrituras del WAL
+                                 # antes de un fsync común (group commit)
+METADATA_SNAPSHOT_EVERY = 1000   # Operaciones en el WAL antes de compactarlo
+                                 # en una instantánea
+
+# --- Compresión de Bloques ---
+COMPRESSION_CODEC = "zlib"        # "zlib", "lzma", "bz2" o None (sin compresión)
+COMPRESSION_MIN_SAVING = 0.1      # Ahorro mínimo en la muestra para comprimir un
+                                  # bloque; si no, se envía tal cual
+COMPRESSION_SAMPLE_SIZE = 64 * 1024  # Bytes de cada bloque que se prueban
+
+# --- Erasure Coding (archivos fríos) ---
+ERASURE_K = 4          # Bloques de datos por franja
+ERASURE_M = 2          # Piezas de paridad por franja (caídas que aguanta)
+ERASURE_SCHEME = "rs"  # "rs" (Reed-Solomon) o "xor" (solo con ERASURE_M = 1)
+
+# --- Ubicación de Bloques ---
+PLACEMENT_POLICY = "free_space"  # "free_space": al azar, ponderado por espacio libre
+                                 # "two_choices": el menos cargado de dos al azar
+                                 # "random": al azar entre los que tienen espacio
+HEARTBEAT_INTERVAL = 2     # Segundos entre consultas de estado a cada nodo
+HEARTBEAT_TIMEOUT = 6      # Sin respuesta en este tiempo, el nodo se da por caído
+
+# --- Configuración del Servidor ---
+SERVER_BACKLOG = 1024          # Conexiones pendientes de aceptar (listen)
+SERVER_MAX_CONNECTIONS = 4096  # Conexiones abiertas simultáneas por nodo
+SERVER_MAX_CONCURRENT = 256    # Peticiones procesándose a la vez por nodo
+SERVER_PEER_TIMEOUT = 5        # Segundos de espera en conexiones nodo -> nodo
+SERVER_CACHE_MB = 128          # Bloques calientes que cada nodo guarda en memoria
+SERVER_READAHEAD_BLOCKS = 4    # Bloques siguientes del mismo archivo que se leen
+                               # por adelantado al servir uno
+SCRUB_RATE_MB = 20             # MB/s que puede leer la verificación de bloques locales
+SCRUB_INTERVAL = 3600          # Segundos entre pasadas de verificación
+REPAIR_RATE_MB = 10            # MB/s que puede enviar la re-replicación de bloques
+REPAIR_GRACE = 30              # Segundos sin heartbeat tras los que un nodo se da
+                               # por perdido y sus bloques se copian a otro
+REPAIR_INTERVAL = 10           # Segundos entre búsquedas de bloques con réplicas perdidas
+
+# --- Configuración de Transferencias ---
+UPLOAD_MAX_IN_FLIGHT = 8   # Bloques subiéndose a la vez por archivo
+DOWNLOAD_CONCURRENCY = 8   # Bloques descargándose a la vez por archivo
+CACHE_MEMORY_MB = 64       # Caché de bloques leídos: nivel en memoria
+CACHE_DISK_MB = 512        # y nivel en disco (0 = sin nivel en disco)
+LATENCY_WINDOW = 100       # Lecturas recientes que se recuerdan por nodo
+LATENCY_STALE = 30         # Segundos tras los que se vuelve a probar un nodo lento
+HEDGE_PERCENTILE = 95      # Si una lectura tarda más que este percentil del
+                           # nodo, se pide también a otra réplica
+HEDGE_MIN_DELAY = 0.02     # Segundos mínimos antes de duplicar una lectura
+HEDGE_INITIAL_DELAY = 0.5  # Espera antes de duplicar mientras no hay datos del nodo
+BATCH_MAX_BLOCKS = 1024    # Bloques por petición DELETE_BLOCKS, STAT_BLOCKS o UPLOAD_BLOCKS
+UPLOAD_BATCH_BYTES = 4 * 1024 * 1024  # Tamaño máximo de una petición UPLOAD_BLOCKS
+UPLOAD_BATCH_BLOCK_MAX = 256 * 1024   # Los bloques de hasta este tamaño se suben
+                                      # en lotes por nodo en vez de uno a uno
+
+# --- Interfaz Gráfica ---
+GUI_LOG_MAX_LINES = 1000   # Líneas del registro de la ventana; las más viejas
+                           # se descartan (las métricas están en STATS)
+
+# --- Sobrescritura desde el Entorno ---
+# Para levantar nodos de prueba sin editar este archivo (ver Benchmark.py):
+#   SADTF_NODOS="127.0.0.1:58001,127.0.0.1:58002"  -> NODOS_CONOCIDOS
+#   SADTF_CAPACIDAD_MB=4096                         -> LOCAL_STORAGE_CAPACITY_MB
+if os.environ.get("SADTF_NODOS"):
+    NODOS_CONOCIDOS = {f"nodo{i + 1}": (host, int(port)) for i, (host, port) in
+                       enumerate(addr.strip().rsplit(":", 1) for addr in os.environ["SADTF_NODOS"].split(","))}
+if os.environ.get("SADTF_CAPACIDAD_MB"):
+    LOCAL_STORAGE_CAPACITY_MB = int(os.environ["SADTF_CAPACIDAD_MB"])
@@ -0,0 +1,104 @@
+# Daemon.py
+
+import argparse
+import signal
+import sys
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Config import NODOS_CONOCIDOS
+
+# --- Nodo sin Interfaz Gráfica ---
+#
+# Arranca un nodo completo (servidor, metadatos persistentes, ubicación y
+# verificación de bloques) sin PyQt5, para servidores sin pantalla:
+#
+#     python Daemon.py 5001
+#     python Daemon.py 5001 --metrics-port 9101
+#
+# Los avisos del nodo se escriben en la salida estándar. Se detiene con
+# Ctrl+C o SIGTERM, guardando una instantánea de los metadatos. Con
+# --metrics-port sirve sus métricas (ver Metrics.py) en formato de texto
+# de Prometheus en http://<ip>:<puerto>/metrics.
+
+
+def ip_de_puerto(port):
+    """IP configurada en NODOS_CONOCIDOS para 'port'. Lanza ValueError si no está."""
+    for ip, port_val in NODOS_CONOCIDOS.values():
+        if port_val == port:
+            return ip
+    raise ValueError(f"Puerto {port} no encontrado en NODOS_CONOCIDOS")
+
+
+def log(mensaje):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {mensaje}", flush=True)
+
+
+def servir_metricas(nodo, host_ip, port):
+    """Arranca en un hilo un servidor HTTP que responde GET /metrics. Devuelve el servidor."""
+    from Metrics import to_prometheus
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = to_prometheus(nodo.stats()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host_ip, port), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=argv[0], description="Nodo de SADTF sin interfaz gráfica.")
+    parser.add_argument("puerto", help="puerto del nodo; debe estar en NODOS_CONOCIDOS "
+                        f"({[addr[1] for addr in NODOS_CONOCIDOS.values()]})")
+    parser.add_argument("--metrics-port", type=int, help="servir las métricas por HTTP en este puerto")
+    args = parser.parse_args(argv[1:])
+    try:
+        port = int(args.puerto)
+        host_ip = ip_de_puerto(port)
+    except ValueError as e:
+        print(f"Error: Puerto '{args.puerto}' no es válido o no está en Config.py")
+        print(e)
+        return 1
+
+    # Importación diferida: el mensaje de uso no espera a cargar el nodo
+    from Node import DFSNode
+
+    parar = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+
+    nodo = DFSNode(host_ip, port, on_log=log)
+    nodo.start()
+    log(f"Nodo {host_ip}:{port} en marcha ({len(nodo.ls())} archivos en la tabla)")
+    metricas = None
+    if args.metrics_port:
+        try:
+            metricas = servir_metricas(nodo, host_ip, args.metrics_port)
+            log(f"Métricas en http://{host_ip}:{args.metrics_port}/metrics")
+        except OSError as e:
+            log(f"No se pudo servir las métricas en el puerto {args.metrics_port}: {e}")
+    # wait() con plazo para que Ctrl+C interrumpa también en Windows
+    while not parar.wait(1):
+        pass
+    log("Cerrando el nodo...")
+    if metricas is not None:
+        metricas.shutdown()
+    nodo.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,215 @@
+# Erasure.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Utils import desempaquetar_bloque, replicas_de_bloque
+
+# --- 1. Aritmética en GF(256) ---
+# Polinomio 0x11d (el habitual en Reed-Solomon). MUL[c] es la tabla de
+# multiplicar por c, en bytes para usarla con bytes.translate.
+#
+# NumPy es opcional: sin él se usa bytes.translate y enteros grandes, a
+# un ritmo parecido. Tanto NumPy como las tablas se cargan con el primer
+# código creado (_cargar_tablas): importar NumPy cuesta ~0,1 s y la
+# mayoría de procesos no usa erasure coding.
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _EXP[_i] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a):
+    if a == 0:
+        raise ZeroDivisionError("0 no tiene inverso en GF(256)")
+    return _EXP[255 - _LOG[a]]
+
+
+np = None
+MUL = None
+_MUL_NP = None
+_tablas_lock = threading.Lock()
+
+
+def _cargar_tablas():
+    global np, MUL, _MUL_NP
+    with _tablas_lock:
+        if MUL is not None:
+            return
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        tablas = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+        if np is not None:
+            _MUL_NP = np.frombuffer(b''.join(tablas), dtype=np.uint8).reshape(256, 256)
+        MUL = tablas
+
+
+def _combinar(coeficientes, piezas, size):
+    """Suma en GF(256) de c_i * pieza_i, byte a byte (todas las piezas miden 'size')."""
+    if np is not None:
+        total = np.zeros(size, dtype=np.uint8)
+        for c, pieza in zip(coeficientes, piezas):
+            if c:
+                datos = np.frombuffer(pieza, dtype=np.uint8)
+                total ^= datos if c == 1 else _MUL_NP[c][datos]
+        return total.tobytes()
+    total = 0
+    for c, pieza in zip(coeficientes, piezas):
+        if c:
+            total ^= int.from_bytes(pieza if c == 1 else pieza.translate(MUL[c]), 'little')
+    return total.to_bytes(size, 'little')
+
+
+def _invertir(matriz):
+    """Inversa de una matriz cuadrada en GF(256) (Gauss-Jordan)."""
+    n = len(matriz)
+    filas = [list(fila) + [int(i == j) for j in range(n)] for i, fila in enumerate(matriz)]
+    for col in range(n):
+        pivote = next((f for f in range(col, n) if filas[f][col]), None)
+        if pivote is None:
+            raise ValueError("Matriz singular")
+        filas[col], filas[pivote] = filas[pivote], filas[col]
+        inv = gf_inv(filas[col][col])
+        filas[col] = [gf_mul(inv, v) for v in filas[col]]
+        for f in range(n):
+            if f != col and filas[f][col]:
+                factor = filas[f][col]
+                filas[f] = [v ^ gf_mul(factor, p) for v, p in zip(filas[f], filas[col])]
+    return [fila[n:] for fila in filas]
+
+
+# --- 2. Códigos ---
+
+class ErasureCode:
+    """
+    Código sistemático de 'k' piezas de datos y 'm' de paridad: las 'k'
+    primeras piezas son los bloques tal cual y cualquier 'k' de las k+m
+    bastan para recuperar los datos.
+
+    - "xor": una sola pieza de paridad (m=1), el XOR de los datos.
+    - "rs": Reed-Solomon con matriz de Cauchy; admite cualquier 'm'.
+
+    Los bloques de una franja pueden medir distinto (el último del
+    archivo): se rellenan con ceros hasta el mayor, que es lo que mide
+    cada pieza de paridad.
+    """
+    def __init__(self, k, m, scheme="rs"):
+        if k < 1 or m < 1 or k + m > 256:
+            raise ValueError(f"Parámetros de código inválidos: k={k}, m={m}")
+        if scheme == "xor" and m != 1:
+            raise ValueError("El esquema 'xor' solo admite m=1")
+        if scheme not in ("xor", "rs"):
+            raise ValueError(f"Esquema desconocido: {scheme}")
+        _cargar_tablas()
+        self.k = k
+        self.m = m
+        self.scheme = scheme
+        if scheme == "xor":
+            self.paridad = [[1] * k]
+        else:
+            self.paridad = [[gf_inv((k + j) ^ i) for i in range(k)] for j in range(m)]
+
+    def _fila(self, indice):
+        """Coeficientes de la pieza 'indice' en función de los datos."""
+        if indice < self.k:
+            return [int(i == indice) for i in range(self.k)]
+        return self.paridad[indice - self.k]
+
+    def encode(self, datos):
+        """Las 'm' piezas de paridad de una franja de hasta 'k' bloques."""
+        size = max(len(d) for d in datos)
+        datos = [bytes(d).ljust(size, b'\0') for d in datos]
+        datos += [bytes(size)] * (self.k - len(datos))
+        return [_combinar(fila, datos, size) for fila in self.paridad]
+
+    def decode(self, piezas, indices):
+        """
+        Recupera los bloques de datos 'indices' a partir de 'piezas'
+        ({índice: bytes}, al menos 'k'). Devuelve {índice: bytes}, con el
+        relleno de ceros incluido.
+        """
+        size = max(len(p) for p in piezas.values())
+        usadas = sorted(piezas)[:self.k]
+        if len(usadas) < self.k:
+            raise IOError(f"Se necesitan {self.k} piezas y solo hay {len(usadas)}")
+        bloques = [bytes(piezas[i]).ljust(size, b'\0') for i in usadas]
+        inversa = _invertir([self._fila(i) for i in usadas])
+        return {i: piezas[i] if i in piezas else _combinar(inversa[i], bloques, size) for i in indices}
+
+
+# --- 3. Lecturas degradadas ---
+
+class StripeIndex:
+    """
+    Franjas de los archivos guardados con erasure coding (entradas con
+    attrs['ec']). Si un bloque de datos no se puede leer de su nodo, se
+    reconstruye pidiendo en paralelo otras 'k' piezas de su franja.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloques = {}
+
+    def add(self, block_map):
+        franjas = {}
+        for entrada in block_map:
+            nombre_bloque, _, _, attrs = desempaquetar_bloque(entrada)
+            ec = attrs.get('ec')
+            if ec is None:
+                continue
+            franja = franjas.setdefault(ec['stripe'], {
+                "code": ErasureCode(ec['k'], ec['m'], ec['scheme']), "pieces": {}})
+            franja["pieces"][ec['index']] = (nombre_bloque, replicas_de_bloque(entrada),
+                                             attrs.get('size'), attrs.get('crc'))
+        with self._lock:
+            for franja in franjas.values():
+                for indice, (nombre_bloque, _, _, _) in franja["pieces"].items():
+                    if indice < franja["code"].k:
+                        self._bloques[nombre_bloque] = (franja, indice)
+
+    def __contains__(self, nombre_bloque):
+        return nombre_bloque in self._bloques
+
+    def recover(self, nombre_bloque, fetcher):
+        """Reconstruye un bloque de datos con otras piezas de su franja (BlockFetcher)."""
+        with self._lock:
+            franja, indice = self._bloques[nombre_bloque]
+        codigo = franja["code"]
+        # Primero los datos (si llegan no hay nada que calcular), luego la paridad
+        candidatos = [i for i in sorted(franja["pieces"]) if i != indice]
+        # En la última franja del archivo los datos que faltan son ceros
+        obtenidas = {i: b'' for i in range(codigo.k) if i not in franja["pieces"]}
+        with ThreadPoolExecutor(max_workers=max(1, len(candidatos))) as executor:
+            pendientes = {}
+            while len(obtenidas) < codigo.k:
+                while candidatos and len(obtenidas) + len(pendientes) < codigo.k:
+                    i = candidatos.pop(0)
+                    nombre, replicas, _, crc = franja["pieces"][i]
+                    pendientes[executor.submit(fetcher.fetch, nombre, replicas, crc=crc)] = i
+                if not pendientes:
+                    raise IOError(f"No quedan {codigo.k} piezas legibles para reconstruir {nombre_bloque}")
+                hechos, _ = wait(list(pendientes), return_when=FIRST_COMPLETED)
+                for future in hechos:
+                    i = pendientes.pop(future)
+                    data = future.result()
+                    if data is not None:
+                        obtenidas[i] = data
+            for future in pendientes:
+                future.cancel()
+        size = franja["pieces"][indice][2]
+        return codigo.decode(obtenidas, [indice])[indice][:size]
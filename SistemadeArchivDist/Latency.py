@@ -0,0 +1,119 @@
+# Latency.py
+
+import threading
+import time
+from collections import deque
+
+from Config import (LATENCY_WINDOW, LATENCY_STALE, HEDGE_PERCENTILE, HEDGE_MIN_DELAY,
+                    HEDGE_INITIAL_DELAY)
+
+# --- Latencia y Fallos por Nodo ---
+
+class LatencyTracker:
+    """
+    Guarda cuánto tardaron las últimas 'window' lecturas de bloques en cada
+    nodo, una media móvil de ese tiempo y cuántas lecturas fallaron hace
+    poco. Sirve para pedir cada bloque al nodo que se espera más rápido y
+    para decidir cuándo una petición va tan lenta que conviene duplicarla
+    en otra réplica (hedged read).
+    """
+    def __init__(self, window=LATENCY_WINDOW, alpha=0.2):
+        self.window = window
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.ewma = {}
+        self.updated = {}
+        self.fallos = {}
+        self.ultimo_fallo = {}
+
+    def record(self, addr, segundos):
+        """Una lectura completa que tardó 'segundos'."""
+        addr = tuple(addr)
+        with self.lock:
+            self.samples.setdefault(addr, deque(maxlen=self.window)).append(segundos)
+            self._media(addr, segundos)
+            # Un acierto no borra de golpe los fallos: un nodo que falla
+            # una de cada dos lecturas debe seguir detrás de los sanos
+            self.fallos[addr] = self.fallos.get(addr, 0) // 2
+
+    def record_slow(self, addr, segundos):
+        """
+        Una lectura abandonada porque otra réplica contestó antes: se sabe
+        que iba a tardar al menos 'segundos'. Sube el tiempo medio del nodo
+        (su puesto en el orden) pero no entra en las muestras de
+        deadline(), que son solo lecturas completas.
+        """
+        addr = tuple(addr)
+        with self.lock:
+            self._media(addr, segundos)
+
+    def record_failure(self, addr):
+        """
+        Una lectura que falló (conexión caída, plazo agotado, datos
+        corruptos). No es una medida de tiempo, así que no toca las
+        muestras ni la media: se cuenta aparte y rank() pone al nodo
+        detrás de los que no han fallado.
+        """
+        addr = tuple(addr)
+        with self.lock:
+            self.fallos[addr] = self.fallos.get(addr, 0) + 1
+            self.ultimo_fallo[addr] = time.monotonic()
+
+    def _media(self, addr, segundos):
+        self.updated[addr] = time.monotonic()
+        previo = self.ewma.get(addr)
+        self.ewma[addr] = segundos if previo is None else previo + self.alpha * (segundos - previo)
+
+    def failures(self, addr):
+        """
+        Fallos recientes de 'addr'. Pasados LATENCY_STALE segundos desde el
+        último se olvidan, para volver a probar un nodo que se recuperó.
+        """
+        addr = tuple(addr)
+        with self.lock:
+            if time.monotonic() - self.ultimo_fallo.get(addr, float('-inf')) > LATENCY_STALE:
+                return 0
+            return self.fallos.get(addr, 0)
+
+    def expected(self, addr):
+        """
+        Tiempo esperado de una lectura en 'addr'. Sin datos, o con datos de
+        hace más de LATENCY_STALE segundos, devuelve 0 para que el nodo se
+        vuelva a probar: uno que fue lento puede haberse recuperado.
+        """
+        addr = tuple(addr)
+        with self.lock:
+            if time.monotonic() - self.updated.get(addr, float('-inf')) > LATENCY_STALE:
+                return 0.0
+            return self.ewma[addr]
+
+    def rank(self, replicas, carga=None):
+        """
+        Ordena 'replicas' de la más rápida a la más lenta. 'carga' es
+        {addr: lecturas en curso} de este cliente: cada una en cola alarga
+        la espera. sorted() es estable, así que a igualdad se respeta el
+        orden original (original -> copia -> extras). Los nodos con fallos
+        recientes van al final, de menos a más fallos.
+        """
+        carga = carga or {}
+        return sorted(replicas, key=lambda addr: (self.failures(addr),
+                                                  self.expected(addr) * (1 + carga.get(addr, 0))))
+
+    def deadline(self, addr):
+        """
+        Cuánto esperar a 'addr' antes de lanzar la misma lectura en otra
+        réplica: el percentil HEDGE_PERCENTILE de sus lecturas completas
+        recientes. Así solo se duplica ~(100 - percentil)% de las lecturas.
+        """
+        with self.lock:
+            muestras = sorted(self.samples.get(tuple(addr), ()))
+        if len(muestras) < 8:
+            return HEDGE_INITIAL_DELAY
+        indice = int(HEDGE_PERCENTILE / 100 * (len(muestras) - 1))
+        return max(HEDGE_MIN_DELAY, muestras[indice])
+
+    def snapshot(self):
+        """{addr: (tiempo medio, fallos recientes)} para mostrar o registrar."""
+        with self.lock:
+            return {addr: (self.ewma[addr], self.fallos.get(addr, 0)) for addr in self.ewma}
@@ -2,118 +2,136 @@
 
 import sys
 import os
-import shutil
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QListWidget, QPushButton, QLabel, 
-                             QMessageBox, QFileDialog, QTextEdit, QDialog)
+                             QMessageBox, QFileDialog, QTextEdit, QDialog, QProgressBar,
+                             QCheckBox)
 # --- IMPORTACIONES CORREGIDAS ---
 from PyQt5.QtCore import QCoreApplication, Qt, QThread, pyqtSignal
 
 # Importar todos los componentes de nuestros otros archivos
-from Config import NODOS_CONOCIDOS
-from Utils import MetadataManager, particionar_archivo, combinar_bloques
-from Network import DFSServerThread, DFSClient
+from Config import NODOS_CONOCIDOS, ERASURE_K, ERASURE_M, ERASURE_SCHEME, GUI_LOG_MAX_LINES
+from Daemon import ip_de_puerto
+from Erasure import ErasureCode
+from Node import DFSNode
+from QtAdapter import NodeSignals
 
 # --- 1. NUEVA CLASE: Hilo de Descarga ---
 # Esta clase moverá el trabajo de red fuera del hilo de la GUI
 class DownloadThread(QThread):
     """
     Este hilo se encarga de todo el proceso de descarga,
-    evitando que la GUI se congele.
+    evitando que la GUI se congele. Los bloques se piden en paralelo
+    (DFSNode.get) y se escriben directamente en el archivo final.
     """
     # Señales que el hilo enviará de vuelta a la GUI
     finished = pyqtSignal(str) # (ruta_guardado) -> Éxito
     error = pyqtSignal(str)    # (mensaje_error) -> Fallo
-    log = pyqtSignal(str)      # (mensaje_log) -> Actualizar log
+    progress = pyqtSignal(int) # (porcentaje) -> Barra de progreso
 
-    def __init__(self, dfs_client, bloques_info, save_path, temp_dir):
+    def __init__(self, node, filename, save_path):
         super().__init__()
-        self.dfs_client = dfs_client
-        self.bloques_info = bloques_info
+        self.node = node
+        self.filename = filename
         self.save_path = save_path
-        self.temp_dir = temp_dir
-        self.rutas_bloques_descargados = []
+
+    def _on_progress(self, recibidos, total):
+        self.progress.emit(int(recibidos * 100 / total) if total else 100)
 
     def run(self):
         """Este es el código que se ejecuta en el hilo separado."""
         try:
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-            os.makedirs(self.temp_dir)
-            
-            # 2. y 3. Solicitar bloques (con tolerancia a fallas)
-            for nombre_bloque, addr_original_list, addr_copia_list in self.bloques_info:
-                
-                addr_original = tuple(addr_original_list)
-                addr_copia = tuple(addr_copia_list)
-
-                self.log.emit(f"Solicitando {nombre_bloque} de {addr_original}...")
-                # --- LLAMADA DE RED (AHORA SEGURA EN UN HILO) ---
-                block_data = self.dfs_client.request_block(addr_original, nombre_bloque)
-                
-                if block_data is None:
-                    self.log.emit(f"¡Fallo! Intentando con copia de {addr_copia}...")
-                    # --- LLAMADA DE RED (AHORA SEGURA EN UN HILO) ---
-                    block_data = self.dfs_client.request_block(addr_copia, nombre_bloque)
-                    
-                    if block_data is None:
-                        # Emitir señal de error y detener
-                        raise Exception(f"No se pudo recuperar el bloque {nombre_bloque} ni su copia. La descarga ha fallado.")
-                
-                # Guardar bloque temporalmente
-                temp_path = os.path.join(self.temp_dir, nombre_bloque)
-                with open(temp_path, 'wb') as f:
-                    f.write(block_data)
-                self.rutas_bloques_descargados.append(temp_path)
-
-            # 4. Reconstruir (Combinar)
-            self.log.emit("Combinando bloques...")
-            if not combinar_bloques(self.rutas_bloques_descargados, self.save_path):
-                raise Exception("No se pudo reconstruir el archivo final.")
-            
-            # 5. Éxito: Emitir señal de finalizado
+            self.node.get(self.filename, self.save_path, on_progress=self._on_progress)
             self.finished.emit(self.save_path)
+        except Exception as e:
+            self.error.emit(str(e))
+
+# --- 2. Hilo de Subida ---
+class UploadThread(QThread):
+    """
+    Sube un archivo con DFSNode.put fuera del hilo de la GUI, incluido el
+    registro en los metadatos y su envío a los demás nodos. No crea
+    bloques temporales: cada bloque se envía directamente desde su
+    posición en el archivo original. Con 'actualizar' usa DFSNode.update:
+    solo se envían los bloques que cambiaron respecto a la versión guardada.
+    """
+    finished = pyqtSignal(object) # (nombre, tamaño, block_map) o el dict de update -> Éxito
+    error = pyqtSignal(str)       # (mensaje_error) -> Fallo
+    progress = pyqtSignal(int)    # (porcentaje) -> Barra de progreso
+
+    def __init__(self, node, filepath, erasure=None, actualizar=False):
+        super().__init__()
+        self.node = node
+        self.filepath = filepath
+        self.erasure = erasure
+        self.actualizar = actualizar
+
+    def _on_progress(self, enviados, total):
+        self.progress.emit(int(enviados * 100 / total) if total else 100)
 
+    def run(self):
+        try:
+            if self.actualizar:
+                self.finished.emit(self.node.update(self.filepath, self.erasure,
+                                                    on_progress=self._on_progress))
+                return
+            self.finished.emit(self.node.put(self.filepath, self.erasure, on_progress=self._on_progress))
+        except Exception as e:
+            self.error.emit(str(e))
+
+# --- 3. Hilo de Eliminación ---
+class DeleteThread(QThread):
+    """
+    Elimina un archivo con DFSNode.rm fuera del hilo de la GUI: sus
+    bloques se borran con unas pocas peticiones DELETE_BLOCKS por nodo,
+    pero con nodos lentos o caídos la espera sigue sin congelar la ventana.
+    """
+    finished = pyqtSignal(str, int) # (nombre, bloques liberados) -> Éxito
+    error = pyqtSignal(str)         # (mensaje_error) -> Fallo
+
+    def __init__(self, node, filename):
+        super().__init__()
+        self.node = node
+        self.filename = filename
+
+    def run(self):
+        try:
+            self.finished.emit(self.filename, self.node.rm(self.filename))
+        except FileNotFoundError:
+            self.error.emit("El archivo ya no existe en los metadatos.")
         except Exception as e:
-            # 6. Fallo: Emitir señal de error
             self.error.emit(str(e))
-        
-        finally:
-            # Limpiar temporales
-            if os.path.exists(self.temp_dir):
-                try:
-                    shutil.rmtree(self.temp_dir)
-                    self.log.emit("Limpieza de temporales completada.")
-                except Exception as e:
-                    self.log.emit(f"Error al limpiar temporales: {e}")
 
-# --- 2. CLASE PRINCIPAL MODIFICADA ---
+# --- 4. CLASE PRINCIPAL MODIFICADA ---
 
 class SADTFMainWindow(QMainWindow):
     def __init__(self, host_ip, port):
         super().__init__()
         
         self.host_addr = (host_ip, port)
-        nodo_id = f"nodo_{port}"
         
         self.setWindowTitle(f"SADTF (Nodo: {host_ip}:{port})")
         self.setGeometry(100, 100, 800, 500)
         
-        self.metadata_manager = MetadataManager(nodo_id, host_ip, port)
-        self.dfs_client = DFSClient()
-
-        self.server_thread = DFSServerThread(host_ip, port, self.metadata_manager)
-        self.server_thread.metadata_changed.connect(self.refresh_file_list)
-        self.server_thread.log_message.connect(self.update_log)
-        self.server_thread.start()
+        # Todo el trabajo lo hace el nodo (Node.py); la ventana solo
+        # muestra su estado. Sus avisos llegan como señales Qt.
+        self.signals = NodeSignals()
+        self.node = DFSNode(host_ip, port, on_log=self.signals.log_message.emit,
+                            on_metadata_changed=self.signals.metadata_changed.emit)
+        self.metadata_manager = self.node.metadata_manager
         
-        self.temp_dir = f"temp_{port}"
         self.setup_ui()
+        self.signals.metadata_changed.connect(self.refresh_file_list)
+        self.signals.log_message.connect(self.update_log)
         
-        # Esta variable guardará la referencia al hilo trabajador
+        # Estas variables guardarán la referencia a los hilos trabajadores
         self.download_worker = None
+        self.upload_worker = None
+        self.delete_worker = None
         
+        # Arranca el servidor y pide a los demás nodos los cambios que nos perdimos
+        self.node.start()
         self.refresh_file_list()
 
     def setup_ui(self):
@@ -140,9 +158,19 @@ class SADTFMainWindow(QMainWindow):
         button_layout.addWidget(self.btn_descargar)
         button_layout.addWidget(self.btn_eliminar)
         main_layout.addLayout(button_layout)
+        # Archivos fríos: franjas con paridad en lugar de copias completas
+        self.chk_erasure = QCheckBox(f"Subir como archivo frío (erasure coding "
+                                     f"{ERASURE_K}+{ERASURE_M}, ocupa "
+                                     f"{(ERASURE_K + ERASURE_M) / ERASURE_K:.1f}x)")
+        main_layout.addWidget(self.chk_erasure)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
         self.log_box = QTextEdit()
         self.log_box.setReadOnly(True)
         self.log_box.setMaximumHeight(100)
+        # Sin límite el registro crece mientras el nodo esté abierto
+        self.log_box.document().setMaximumBlockCount(GUI_LOG_MAX_LINES)
         main_layout.addWidget(self.log_box)
         self.btn_cargar.clicked.connect(self.guardar_archivo)
         self.btn_atributos.clicked.connect(self.mostrar_atributos)
@@ -173,47 +201,55 @@ class SADTFMainWindow(QMainWindow):
         nombre_archivo = " ".join(partes[:-3])
         return nombre_archivo.strip()
 
-    def broadcast_updates(self):
-        metadata_json = self.metadata_manager.get_file_table_json()
-        # TODO: Mover 'guardar' y 'eliminar' a hilos
-        self.dfs_client.broadcast_metadata_update(metadata_json, self.host_addr)
-        self.refresh_file_list()
-
-    # --- FUNCIÓN 'guardar_archivo' (SIN CAMBIOS POR AHORA) ---
-    # NOTA: Esta función también debería moverse a un hilo.
+    # --- FUNCIÓN 'guardar_archivo' (AHORA USA HILOS) ---
     def guardar_archivo(self):
+        """
+        Inicia la subida en un hilo separado. Los bloques se envían en
+        streaming desde el archivo original, sin directorio temporal.
+        """
         filepath, _ = QFileDialog.getOpenFileName(self, "Seleccionar archivo para subir")
         if not filepath: return
-        filename = os.path.basename(filepath)
-        file_size = os.path.getsize(filepath)
-        self.update_log(f"Iniciando subida de: {filename}")
-        if os.path.exists(self.temp_dir): shutil.rmtree(self.temp_dir)
-        bloques = particionar_archivo(filepath, self.temp_dir)
-        if not bloques:
-            QMessageBox.critical(self, "Error", "No se pudo particionar el archivo.")
-            return
-        block_map = []
-        for nombre_bloque, ruta_bloque in bloques:
-            nodos_asignados = self.metadata_manager.get_nodos_para_bloque(n=2)
-            if not nodos_asignados:
-                self.update_log("Error: No hay nodos en la configuración.")
-                continue
-            
-            addr_original = tuple(nodos_asignados[0])
-            addr_copia = tuple(nodos_asignados[1]) if len(nodos_asignados) > 1 else addr_original
-            
-            if not self.dfs_client.send_block(addr_original, nombre_bloque, ruta_bloque):
-                self.update_log(f"Fallo al enviar bloque {nombre_bloque} a {addr_original}")
-            if not self.dfs_client.send_block(addr_copia, nombre_bloque, ruta_bloque):
-                self.update_log(f"Fallo al enviar copia de {nombre_bloque} a {addr_copia}")
-            block_map.append((nombre_bloque, addr_original, addr_copia))
-            
-        self.metadata_manager.add_file_entry(filename, file_size, block_map)
-        self.broadcast_updates()
-        shutil.rmtree(self.temp_dir)
+        # Un archivo que ya está en el sistema se actualiza: solo viaja lo que cambió
+        actualizar = any(nombre == os.path.basename(filepath) for nombre, _, _ in self.node.ls())
+        if actualizar:
+            self.update_log(f"Iniciando actualización de: {os.path.basename(filepath)}")
+        else:
+            self.update_log(f"Iniciando subida de: {os.path.basename(filepath)}")
+
+        erasure = None
+        if self.chk_erasure.isChecked():
+            erasure = ErasureCode(ERASURE_K, ERASURE_M, ERASURE_SCHEME)
+        self.upload_worker = UploadThread(self.node, filepath, erasure, actualizar)
+        self.upload_worker.finished.connect(self.on_upload_finished)
+        self.upload_worker.error.connect(self.on_upload_error)
+        self.upload_worker.progress.connect(self.progress_bar.setValue)
+
+        self.btn_descargar.setEnabled(False)
+        self.btn_cargar.setEnabled(False)
+        self.btn_eliminar.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+
+        self.upload_worker.start()
+
+    def on_upload_finished(self, resultado):
+        """Se llama cuando el hilo de subida termina (el archivo ya está registrado y propagado)."""
+        if isinstance(resultado, dict):
+            filename = resultado["name"]
+            self.update_log(f"{filename}: {resultado['reused']} de {resultado['blocks']} bloques sin "
+                            f"cambios, {resultado['sent_bytes'] / 1024:,.0f} KB enviados")
+        else:
+            filename, file_size, block_map = resultado
         self.update_log(f"¡Subida de {filename} completada!")
+        self.re_enable_buttons()
         QMessageBox.information(self, "Éxito", f"'{filename}' ha sido subido al sistema.")
 
+    def on_upload_error(self, error_message):
+        """Se llama cuando el hilo de subida falla."""
+        self.update_log(f"ERROR CRÍTICO en subida: {error_message}")
+        self.re_enable_buttons()
+        QMessageBox.critical(self, "Error de Subida", f"Falló la subida:\n{error_message}")
+
     # --- FUNCIÓN 'descargar_archivo' (AHORA USA HILOS) ---
     def descargar_archivo(self):
         """
@@ -223,8 +259,7 @@ class SADTFMainWindow(QMainWindow):
         if not filename:
             return
 
-        bloques_info = self.metadata_manager.get_file_blocks(filename)
-        if not bloques_info:
+        if not self.metadata_manager.get_file_blocks(filename):
             QMessageBox.critical(self, "Error", "No se encontró información de bloques para este archivo.")
             return
 
@@ -235,22 +270,19 @@ class SADTFMainWindow(QMainWindow):
         self.update_log(f"Iniciando descarga de: {filename}...")
         
         # 1. Crear el hilo
-        self.download_worker = DownloadThread(
-            dfs_client=self.dfs_client,
-            bloques_info=bloques_info,
-            save_path=save_path,
-            temp_dir=self.temp_dir
-        )
+        self.download_worker = DownloadThread(self.node, filename, save_path)
         
         # 2. Conectar las señales del hilo a las funciones de la GUI
         self.download_worker.finished.connect(self.on_download_finished)
         self.download_worker.error.connect(self.on_download_error)
-        self.download_worker.log.connect(self.update_log)
+        self.download_worker.progress.connect(self.progress_bar.setValue)
         
         # 3. Deshabilitar botones para evitar clics múltiples
         self.btn_descargar.setEnabled(False)
         self.btn_cargar.setEnabled(False)
         self.btn_eliminar.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
 
         # 4. Iniciar el hilo
         self.download_worker.start()
@@ -259,6 +291,9 @@ class SADTFMainWindow(QMainWindow):
     def on_download_finished(self, save_path):
         """Se llama cuando el hilo de descarga termina con éxito."""
         self.update_log(f"Descarga completada: {save_path}")
+        stats = self.node.dfs_client.cache.stats()
+        self.update_log(f"Caché: aciertos {stats['hits']}, fallos {stats['misses']} "
+                        f"({stats['hit_ratio']:.0%})")
         QMessageBox.information(self, "Éxito", f"Archivo descargado y reconstruido en:\n{save_path}")
         self.re_enable_buttons()
 
@@ -270,41 +305,44 @@ class SADTFMainWindow(QMainWindow):
 
     def re_enable_buttons(self):
         """Reactiva los botones de la GUI."""
+        self.progress_bar.setVisible(False)
         self.btn_descargar.setEnabled(True)
         self.btn_cargar.setEnabled(True)
         self.btn_eliminar.setEnabled(True)
 
-    # --- FUNCIÓN 'eliminar_archivo' (AÚN SIN HILOS) ---
-    # NOTA: Esta función también debería moverse a un hilo
+    # --- FUNCIÓN 'eliminar_archivo' (AHORA USA HILOS) ---
     def eliminar_archivo(self):
         filename = self._get_selected_filename()
         if not filename:
             return
-        try:
-            confirm = QMessageBox.question(self, "Confirmar Eliminación", 
-                                          f"¿Estás seguro de que quieres eliminar '{filename}' de forma permanente?",
-                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-            if confirm == QMessageBox.No:
-                return
-            bloques_a_eliminar = self.metadata_manager.remove_file_entry(filename)
-            if not bloques_a_eliminar:
-                QMessageBox.critical(self, "Error", "El archivo ya no existe en los metadatos.")
-                self.broadcast_updates()
-                return
-            self.update_log(f"Iniciando eliminación de: {filename}")
-            for nombre_bloque, addr_original_list, addr_copia_list in bloques_a_eliminar:
-                addr_original = tuple(addr_original_list)
-                addr_copia = tuple(addr_copia_list)
-                if not self.dfs_client.send_delete_block(addr_original, nombre_bloque):
-                    self.update_log(f"Fallo al contactar {addr_original} para eliminar {nombre_bloque}")
-                if (addr_original != addr_copia) and (not self.dfs_client.send_delete_block(addr_copia, nombre_bloque)):
-                    self.update_log(f"Fallo al contactar {addr_copia} para eliminar copia de {nombre_bloque}")
-            self.broadcast_updates()
-            self.update_log(f"Eliminación de {filename} completada.")
-            QMessageBox.information(self, "Éxito", f"'{filename}' ha sido eliminado del sistema.")
-        except Exception as e:
-            self.update_log(f"ERROR CRÍTICO en eliminación: {e}")
-            QMessageBox.critical(self, "Error de Eliminación", f"Falló la eliminación:\n{e}")
+        confirm = QMessageBox.question(self, "Confirmar Eliminación", 
+                                      f"¿Estás seguro de que quieres eliminar '{filename}' de forma permanente?",
+                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if confirm == QMessageBox.No:
+            return
+        self.update_log(f"Iniciando eliminación de: {filename}")
+
+        self.delete_worker = DeleteThread(self.node, filename)
+        self.delete_worker.finished.connect(self.on_delete_finished)
+        self.delete_worker.error.connect(self.on_delete_error)
+
+        self.btn_descargar.setEnabled(False)
+        self.btn_cargar.setEnabled(False)
+        self.btn_eliminar.setEnabled(False)
+
+        self.delete_worker.start()
+
+    def on_delete_finished(self, filename, borrados):
+        """Se llama cuando el hilo de eliminación termina (el cambio ya está propagado)."""
+        self.update_log(f"Eliminación de {filename} completada ({borrados} bloques liberados).")
+        self.re_enable_buttons()
+        QMessageBox.information(self, "Éxito", f"'{filename}' ha sido eliminado del sistema.")
+
+    def on_delete_error(self, error_message):
+        """Se llama cuando el hilo de eliminación falla."""
+        self.update_log(f"ERROR CRÍTICO en eliminación: {error_message}")
+        self.re_enable_buttons()
+        QMessageBox.critical(self, "Error de Eliminación", f"Falló la eliminación:\n{error_message}")
 
     # --- OTRAS FUNCIONES (SIN CAMBIOS) ---
     def mostrar_atributos(self):
@@ -332,10 +370,7 @@ class SADTFMainWindow(QMainWindow):
 
     def closeEvent(self, event):
         self.update_log("Cerrando el nodo...")
-        self.server_thread.stop()
-        self.server_thread.wait()
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        self.node.close()
         event.accept()
 
 # --- Arranque de la Aplicación (Corregido para IPs de LAN) ---
@@ -348,13 +383,7 @@ if __name__ == '__main__':
         
     try:
         PORT = int(sys.argv[1])
-        NODE_IP = None
-        for ip, port_val in NODOS_CONOCIDOS.values():
-            if port_val == PORT:
-                NODE_IP = ip
-                break
-        if NODE_IP is None:
-            raise ValueError(f"Puerto {PORT} no encontrado en NODOS_CONOCIDOS")
+        NODE_IP = ip_de_puerto(PORT)
     except ValueError as e:
         print(f"Error: Puerto '{sys.argv[1]}' no es válido o no está en sadtf_config.py")
         print(e)
@@ -0,0 +1,138 @@
+# Metrics.py
+
+import threading
+from bisect import bisect_left
+
+# --- Métricas del Nodo ---
+#
+# Contadores, histogramas de latencia y medidas instantáneas, pensados
+# para llamarse en cada petición: un contador es una suma en un dict y un
+# histograma, una búsqueda binaria en límites fijos. Las medidas
+# instantáneas (peticiones en curso, aciertos de caché...) no cuestan nada
+# al trabajar: son funciones que solo se evalúan al pedir una instantánea.
+#
+# Las etiquetas van como argumentos con nombre:
+#
+#     metrics.inc("server_bytes_in_total", 4096)
+#     metrics.observe("client_request_seconds", 0.012, op="DOWNLOAD_BLOCK", peer="10.0.0.2:5001")
+#     metrics.gauge("server_in_flight", lambda: servidor.in_flight)
+#
+# snapshot() devuelve todo como datos (se envía tal cual en la respuesta a
+# STATS) y to_prometheus() lo convierte al formato de texto de Prometheus.
+
+# Límites (segundos) de los histogramas de latencia: de 0,5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cuentas por intervalo de un histograma con límites fijos, más su suma."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Un intervalo por límite y uno más para lo que los supera todos
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, valor):
+        self.counts[bisect_left(self.buckets, valor)] += 1
+        self.sum += valor
+        self.count += 1
+
+
+class Metrics:
+    """Registro de métricas de un proceso. Se puede usar desde cualquier hilo."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._counters[clave] = self._counters.get(clave, 0) + valor
+
+    def observe(self, nombre, valor, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self._histograms.get(clave)
+            if histograma is None:
+                histograma = self._histograms[clave] = Histogram()
+            histograma.observe(valor)
+
+    def gauge(self, nombre, funcion, **etiquetas):
+        """Registra 'funcion()' como el valor actual de 'nombre'."""
+        with self._lock:
+            self._gauges[(nombre, tuple(sorted(etiquetas.items())))] = funcion
+
+    def snapshot(self):
+        """
+        Todas las métricas como datos serializables en JSON:
+        {"counters": [...], "gauges": [...], "histograms": [...]}, cada
+        una con "name", "labels" y su valor.
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = [(clave, list(h.counts), h.sum, h.count, h.buckets)
+                          for clave, h in self._histograms.items()]
+        resultado = {"counters": [], "gauges": [], "histograms": []}
+        for (nombre, etiquetas), valor in counters:
+            resultado["counters"].append({"name": nombre, "labels": dict(etiquetas), "value": valor})
+        for (nombre, etiquetas), funcion in gauges:
+            try:
+                valor = funcion()
+            except Exception:
+                continue
+            resultado["gauges"].append({"name": nombre, "labels": dict(etiquetas), "value": valor})
+        for (nombre, etiquetas), counts, suma, count, buckets in histograms:
+            resultado["histograms"].append({"name": nombre, "labels": dict(etiquetas),
+                                            "buckets": list(buckets), "counts": counts,
+                                            "sum": suma, "count": count})
+        return resultado
+
+
+# --- Formato de Texto de Prometheus ---
+
+def _etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas.items()) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(snapshot, prefijo="sadtf_"):
+    """Convierte una instantánea (Metrics.snapshot o la respuesta a STATS) a texto de Prometheus."""
+    lineas = []
+    tipos = set()
+
+    def tipo(nombre, clase):
+        if nombre not in tipos:
+            tipos.add(nombre)
+            lineas.append(f"# TYPE {nombre} {clase}")
+
+    for m in sorted(snapshot.get("counters", []), key=lambda m: m["name"]):
+        nombre = prefijo + m["name"]
+        tipo(nombre, "counter")
+        lineas.append(f"{nombre}{_etiquetas(m['labels'])} {m['value']}")
+    for m in sorted(snapshot.get("gauges", []), key=lambda m: m["name"]):
+        nombre = prefijo + m["name"]
+        tipo(nombre, "gauge")
+        lineas.append(f"{nombre}{_etiquetas(m['labels'])} {m['value']}")
+    for m in sorted(snapshot.get("histograms", []), key=lambda m: m["name"]):
+        nombre = prefijo + m["name"]
+        tipo(nombre, "histogram")
+        # Prometheus espera cuentas acumuladas: cada 'le' incluye las anteriores
+        acumulado = 0
+        for limite, n in zip(list(m["buckets"]) + ["+Inf"], m["counts"]):
+            acumulado += n
+            lineas.append(f"{nombre}_bucket{_etiquetas(m['labels'], ('le', limite))} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(m['labels'])} {m['sum']}")
+        lineas.append(f"{nombre}_count{_etiquetas(m['labels'])} {m['count']}")
+    return "".join(linea + "\n" for linea in lineas)
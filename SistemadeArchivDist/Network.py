@@ -1,224 +1,301 @@
 # Network.py
 
-import socket
-import threading
 import json
 import os
-from PyQt5.QtCore import QThread, pyqtSignal
+
 # Asegúrate que esta importación sea correcta (Config o sadtf_config)
-from Config import BLOCK_SIZE, NODOS_CONOCIDOS 
+from Config import NODOS_CONOCIDOS, BATCH_MAX_BLOCKS, SERVER_PEER_TIMEOUT
+from Pool import ConnectionPool
+from Latency import LatencyTracker
+from Metrics import Metrics
+from Cache import BlockCache
+from Compression import decodificar_bloque
+from Utils import bloque_integro
+from Protocol import (OP_UPLOAD_BLOCK, OP_DOWNLOAD_BLOCK, OP_DELETE_BLOCK,
+                      OP_HAVE_BLOCKS, OP_METADATA_DELTA, OP_METADATA_PULL, OP_HEARTBEAT, OP_STATS,
+                      OP_DELETE_BLOCKS, OP_UPLOAD_BLOCKS, OP_STAT_BLOCKS,
+                      STATUS_OK, STATUS_NOT_FOUND, STATUS_NAMES, FileRange, ProtocolError)
 
-# --- 1. Lógica del Cliente (DFSClient) ---
-# (Esta clase está bien, el error no está aquí, pero la incluimos
-#  para que el archivo esté completo. Es la misma de la respuesta anterior.)
+# --- Lógica del Cliente (DFSClient) ---
+# El servidor del nodo vive en Server.py (NodeServer). Node.py reúne ambos
+# en un DFSNode, que usan la GUI, el demonio y la línea de comandos.
 class DFSClient:
-    def __init__(self):
+    def __init__(self, pool=None, cache=None, metrics=None):
         self.timeout = 3 
+        # Contadores y latencias de las peticiones (ver Metrics.py)
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Conexiones persistentes reutilizadas entre peticiones (ver Pool.py)
+        self.pool = pool or ConnectionPool(timeout=self.timeout, metrics=self.metrics)
+        # Último vector de versiones de metadatos conocido de cada nodo
+        self.peer_vectors = {}
+        # Tiempos de lectura de bloques por nodo (ver Latency.py)
+        self.latency = LatencyTracker()
+        # Bloques leídos recientemente (ver Cache.py); por defecto solo en memoria
+        self.cache = cache if cache is not None else BlockCache(disk_bytes=0)
+        for nivel in ("memory", "disk", "local"):
+            self.metrics.gauge("client_cache_hits", lambda nivel=nivel: self.cache.stats()["hits"][nivel],
+                               level=nivel)
+        self.metrics.gauge("client_cache_misses", lambda: self.cache.stats()["misses"])
 
-    def _send_request(self, target_ip, target_port, data):
+    def _request(self, target_addr, opcode, args=None, body=b'', timeout=None):
+        """
+        Envía un mensaje enmarcado (ver Protocol.py) por una conexión del
+        pool y espera su respuesta (como mucho 'timeout' segundos; por
+        defecto, los del pool). Devuelve el Message de respuesta, o None
+        si hubo un error de red.
+        """
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(self.timeout)
-                s.connect((target_ip, target_port))
-                s.sendall(data)
-                return True
-        except socket.error as e:
-            print(f"Error de cliente (a {target_ip}:{target_port}): {e}")
-            return False
+            return self.pool.request(target_addr, opcode, args, body, timeout)
+        except (OSError, ProtocolError) as e:
+            print(f"Error de cliente (a {target_addr[0]}:{target_addr[1]}): {e}")
+            return None
 
     def send_block(self, target_addr, nombre_bloque, ruta_bloque_local):
-        """Envía COMANDO|NOMBRE_BLOQUE|...data..."""
+        """Envía UPLOAD_BLOCK {name} con el contenido completo de un archivo local."""
         try:
             with open(ruta_bloque_local, 'rb') as f:
-                block_data = f.read()
-            
-            # Formato: "UPLOAD_BLOCK" | "nombre_bloque|...datos_binarios..."
-            header = f"UPLOAD_BLOCK".encode('utf-8')
-            # El nombre del bloque AHORA es parte del payload
-            payload_data = f"{nombre_bloque}".encode('utf-8') + b'|' + block_data
-            
-            payload = header + b'|' + payload_data
-            
-            return self._send_request(target_addr[0], target_addr[1], payload)
-            
+                size = os.fstat(f.fileno()).st_size
+                return self.send_block_range(target_addr, nombre_bloque, f, 0, size)
         except IOError as e:
             print(f"Error leyendo bloque local {ruta_bloque_local}: {e}")
             return False
 
-    def request_block(self, target_addr, nombre_bloque):
-        """Envía COMANDO|NOMBRE_BLOQUE"""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(self.timeout)
-                s.connect(target_addr)
-                
-                header = f"DOWNLOAD_BLOCK".encode('utf-8')
-                payload_data = f"{nombre_bloque}".encode('utf-8')
-                payload = header + b'|' + payload_data
-                
-                s.sendall(payload)
-                
-                block_data = b''
-                while True:
-                    chunk = s.recv(4096)
-                    if not chunk:
-                        break
-                    block_data += chunk
-                
-                s.close()
-
-                # --- CORRECCIÓN ---
-                # Si el servidor envió 0 bytes (b''), lo tratamos como
-                # un fallo (None) para que el cliente intente con la copia.
-                if not block_data: 
-                    # Eliminé la línea self.update_log(...) que causaba el crash
-                    return None
-                # --- FIN DE LA CORRECCIÓN ---
-                
-                return block_data
-        except socket.error as e:
-            print(f"Error solicitando bloque {nombre_bloque} de {target_addr}: {e}")
-            return None
-        
-    def broadcast_metadata_update(self, metadata_json, remitente_addr):
-        """Envía COMANDO|JSON_DATA"""
-        header = f"UPDATE_METADATA".encode('utf-8')
-        payload = header + b'|' + metadata_json.encode('utf-8')
-        
-        for nodo_addr in NODOS_CONOCIDOS.values():
-            if nodo_addr != remitente_addr:
-                self._send_request(nodo_addr[0], nodo_addr[1], payload)
+    def send_block_range(self, target_addr, nombre_bloque, f, offset, size, ref=None):
+        """
+        Envía UPLOAD_BLOCK {name} con 'size' bytes de 'f' desde 'offset'.
+        Los datos salen del archivo con sendfile, sin cargarlos en memoria.
+        'ref' ({file, file_size, offsets}) le dice al nodo a qué archivo
+        pertenece el bloque, para poder reconstruir sus metadatos.
+        """
+        return bool(self.upload_block([target_addr], nombre_bloque, FileRange(f, offset, size), ref))
 
-    def send_delete_block(self, target_addr, nombre_bloque):
-        """Envía COMANDO|NOMBRE_BLOQUE"""
-        # Formato: "DELETE_BLOCK" | "nombre_bloque"
-        header = f"DELETE_BLOCK".encode('utf-8')
-        payload_data = f"{nombre_bloque}".encode('utf-8')
-        payload = header + b'|' + payload_data
-        
-        return self._send_request(target_addr[0], target_addr[1], payload)
+    def send_block_chain(self, targets, nombre_bloque, f, offset, size, ref=None):
+        """
+        Replicación en cadena: envía el bloque solo al primer nodo de
+        'targets' y este lo reenvía al siguiente mientras lo recibe, y así
+        sucesivamente. Devuelve la lista de nodos que confirmaron haberlo
+        guardado (vacía si el primero falló).
+        """
+        return self.upload_block(targets, nombre_bloque, FileRange(f, offset, size), ref)
 
+    def upload_block(self, targets, nombre_bloque, body, ref=None):
+        """
+        Envía UPLOAD_BLOCK con 'body' (bytes, o un FileRange que sale con
+        sendfile) al primer nodo de 'targets', que lo reenvía en cadena a
+        los demás. Devuelve los nodos que lo guardaron.
+
+        Cada nodo de la cadena espera la respuesta del siguiente hasta
+        SERVER_PEER_TIMEOUT segundos, así que el plazo de espera crece con
+        la longitud de la cadena.
+        """
+        targets = [tuple(addr) for addr in targets]
+        args = dict(ref or {}, name=nombre_bloque)
+        if len(targets) > 1:
+            args["forward"] = targets[1:]
+        plazo = self.timeout + (len(targets) - 1) * SERVER_PEER_TIMEOUT
+        respuesta = self._request(targets[0], OP_UPLOAD_BLOCK, args, body, timeout=plazo)
+        if respuesta is None or respuesta.status != STATUS_OK:
+            return []
+        return [tuple(addr) for addr in respuesta.args.get("stored", [targets[0]])]
 
-# --- 2. Lógica del Servidor (DFSServerThread) ---
-# (Esta sección es la que contiene la corrección principal)
+    def upload_blocks(self, target_addr, bloques):
+        """
+        Envía varios bloques pequeños en una sola petición UPLOAD_BLOCKS.
+        'bloques' es [(nombre, bytes, ref)], con 'ref' como en upload_block.
+        Devuelve el set de los que el nodo guardó (vacío si no responde).
+        """
+        args = {"blocks": [dict(ref or {}, name=nombre_bloque, size=len(data))
+                           for nombre_bloque, data, ref in bloques]}
+        respuesta = self._request(target_addr, OP_UPLOAD_BLOCKS, args,
+                                  b''.join(data for _, data, _ in bloques))
+        if respuesta is None or respuesta.status != STATUS_OK:
+            return set()
+        return set(respuesta.args.get("stored", []))
+
+    def _por_lotes(self, por_nodo, opcode):
+        """
+        Envía a la vez, por el pool, una petición 'opcode' {names} por cada
+        lote de hasta BATCH_MAX_BLOCKS bloques de cada nodo de 'por_nodo'
+        ({addr: [nombres]}), y espera las respuestas. Devuelve
+        [(addr, respuesta o None)].
+        """
+        futures = []
+        for addr, nombres in por_nodo.items():
+            nombres = list(nombres)
+            for i in range(0, len(nombres), BATCH_MAX_BLOCKS):
+                futures.append((tuple(addr), self.pool.submit(addr, opcode,
+                                                              {"names": nombres[i:i + BATCH_MAX_BLOCKS]})))
+        respuestas = []
+        for addr, future in futures:
+            try:
+                respuesta = self.pool.wait(future)
+            except (OSError, ProtocolError) as e:
+                print(f"Error de cliente (a {addr[0]}:{addr[1]}): {e}")
+                respuesta = None
+            respuestas.append((addr, respuesta if respuesta is not None and respuesta.status == STATUS_OK
+                               else None))
+        return respuestas
 
-class DFSServerThread(QThread):
-    metadata_changed = pyqtSignal()
-    log_message = pyqtSignal(str)
+    def delete_blocks(self, por_nodo):
+        """
+        Borra muchos bloques de varios nodos ({addr: [nombres]}) con
+        peticiones DELETE_BLOCKS en paralelo. Devuelve {addr: set de los
+        que ya no están en el nodo}; si un lote falla, sus bloques no
+        aparecen.
+        """
+        confirmados = {tuple(addr): set() for addr in por_nodo}
+        for addr, respuesta in self._por_lotes(por_nodo, OP_DELETE_BLOCKS):
+            if respuesta is not None:
+                confirmados[addr].update(respuesta.args.get("deleted", []))
+                confirmados[addr].update(respuesta.args.get("missing", []))
+        return confirmados
 
-    def __init__(self, host, port, metadata_manager):
-        super().__init__()
-        self.host = host
-        self.port = port
-        self.metadata_manager = metadata_manager
-        self.is_running = True
+    def stat_blocks(self, por_nodo):
+        """
+        Consulta en lotes (STAT_BLOCKS, en paralelo) qué bloques de
+        'por_nodo' ({addr: [nombres]}) guarda cada nodo y cuántos bytes
+        ocupan. Devuelve {addr: {nombre: tamaño}}; un nodo que no responde
+        queda vacío.
+        """
+        tamanos = {tuple(addr): {} for addr in por_nodo}
+        for addr, respuesta in self._por_lotes(por_nodo, OP_STAT_BLOCKS):
+            if respuesta is not None:
+                tamanos[addr].update(respuesta.args.get("sizes", {}))
+        return tamanos
 
-    def run(self):
-        # ... (código de 'run' sin cambios) ...
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+    def have_blocks(self, target_addr, nombres_bloques):
+        """
+        Consulta en una sola petición (HAVE_BLOCKS) cuáles de los bloques ya
+        están guardados en el nodo. Devuelve un set, o None si no responde.
+        """
+        respuesta = self._request(target_addr, OP_HAVE_BLOCKS, {"names": list(nombres_bloques)})
+        if respuesta is None or respuesta.status != STATUS_OK:
+            return None
+        return set(respuesta.args.get("have", []))
+
+    def request_block(self, target_addr, nombre_bloque, crc=None):
+        """
+        Envía DOWNLOAD_BLOCK {name}. Devuelve los bytes del bloque, o None si
+        el nodo no responde o no tiene el bloque (STATUS_NOT_FOUND), para que
+        el cliente intente con la copia. Si el bloque está en la caché no se
+        envía nada. Un bloque comprimido se devuelve ya descomprimido. Un
+        bloque que no pasa la comprobación de integridad ('crc', o el hash
+        de su contenido) también devuelve None.
+        """
+        block_data = self.cache.get(nombre_bloque, [target_addr])
+        if block_data is not None:
+            return block_data
+        respuesta = self._request(target_addr, OP_DOWNLOAD_BLOCK, {"name": nombre_bloque})
+        if respuesta is None:
+            return None
+        if respuesta.status != STATUS_OK:
+            print(f"Bloque {nombre_bloque} no disponible en {target_addr}: "
+                  f"{STATUS_NAMES.get(respuesta.status, respuesta.status)}")
+            return None
+        if not bloque_integro(nombre_bloque, respuesta.body, crc):
+            print(f"Bloque {nombre_bloque} corrupto en {target_addr}")
+            return None
         try:
-            server_socket.bind((self.host, self.port))
-            server_socket.listen(5)
-            self.log_message.emit(f"Servidor escuchando en {self.host}:{self.port}")
-        except socket.error as e:
-            self.log_message.emit(f"Error al iniciar servidor: {e}")
-            return
-
-        while self.is_running:
-            try:
-                server_socket.settimeout(1.0) 
-                conn, addr = server_socket.accept()
-                threading.Thread(target=self.handle_client, args=(conn, addr)).start()
-            except socket.timeout:
-                continue 
-            except socket.error as e:
-                if self.is_running:
-                    self.log_message.emit(f"Error de socket: {e}")
-                break 
+            block_data = decodificar_bloque(nombre_bloque, respuesta.body)
+        except IOError as e:
+            print(e)
+            return None
+        self.cache.put(nombre_bloque, block_data)
+        return block_data
         
-        server_socket.close()
-        self.log_message.emit("Servidor detenido.")
+    def request_block_async(self, target_addr, nombre_bloque, offset=None, length=None):
+        """
+        Envía DOWNLOAD_BLOCK {name} sin esperar. Con 'offset' y 'length' el
+        nodo devuelve solo ese rango del bloque. Devuelve un Future con el
+        Message de respuesta; se puede abandonar con cancel().
+        """
+        args = {"name": nombre_bloque}
+        if offset is not None:
+            args["offset"] = offset
+        if length is not None:
+            args["length"] = length
+        return self.pool.submit(target_addr, OP_DOWNLOAD_BLOCK, args)
+
+    def cancel(self, future):
+        self.pool.cancel(future)
 
-    def handle_client(self, conn, addr):
+    def broadcast_metadata_delta(self, metadata_manager, remitente_addr):
         """
-        Maneja la lógica de una conexión entrante.
-        *** ESTA ES LA SECCIÓN CORREGIDA ***
+        Envía a cada nodo solo las operaciones de metadatos que le faltan,
+        calculadas a partir del último vector de versiones que nos dio.
+        Si su respuesta muestra que aún le falta algo (vector desconocido o
+        desactualizado), se le manda una segunda ronda con lo que corresponde.
         """
-        try:
-            full_data = b''
-            while True:
-                chunk = conn.recv(4096) 
-                if not chunk:
-                    break 
-                full_data += chunk
-            
-            if not full_data:
-                return
+        pendientes = [tuple(addr) for addr in NODOS_CONOCIDOS.values()
+                      if tuple(addr) != tuple(remitente_addr)]
+        for _ in range(2):
+            futures = {}
+            for addr in pendientes:
+                delta = metadata_manager.delta_para(self.peer_vectors.get(addr))
+                futures[addr] = self.pool.submit(addr, OP_METADATA_DELTA,
+                                                 body=json.dumps(delta).encode('utf-8'))
+            pendientes = []
+            for addr, future in futures.items():
+                try:
+                    respuesta = self.pool.wait(future)
+                except (OSError, ProtocolError) as e:
+                    print(f"Error de cliente (a {addr[0]}:{addr[1]}): {e}")
+                    self.peer_vectors.pop(addr, None)
+                    continue
+                if respuesta.status != STATUS_OK:
+                    continue
+                self.peer_vectors[addr] = respuesta.args.get("vector", {})
+                if metadata_manager.tiene_pendientes(self.peer_vectors[addr]):
+                    pendientes.append(addr)
+            if not pendientes:
+                break
 
+    def pull_metadata(self, metadata_manager, remitente_addr):
+        """
+        Pide a los demás nodos las operaciones de metadatos que nos faltan
+        (por ejemplo, al arrancar). Devuelve True si la tabla cambió.
+        """
+        vector = metadata_manager.get_vector()
+        futures = {tuple(addr): self.pool.submit(addr, OP_METADATA_PULL, {"vector": vector})
+                   for addr in NODOS_CONOCIDOS.values() if tuple(addr) != tuple(remitente_addr)}
+        cambio = False
+        for addr, future in futures.items():
             try:
-                parts = full_data.split(b'|', 1)
-                header_bytes = parts[0]
-                payload_bytes = parts[1] if len(parts) > 1 else b''
-                command = header_bytes.decode('utf-8')
-            except Exception as e:
-                self.log_message.emit(f"Error de decodificación de encabezado: {e}")
-                return
-
-            # --- Lógica de Comandos (Corregida) ---
-            
-            if command == "UPLOAD_BLOCK":
-                try:
-                    nombre_bytes, block_data = payload_bytes.split(b'|', 1)
-                    nombre_bloque = nombre_bytes.decode('utf-8')
-                except Exception as e:
-                    self.log_message.emit(f"Error parseando UPLOAD_BLOCK: {e}")
-                    return
-                ruta_guardado = self.metadata_manager.get_local_storage_path(nombre_bloque)
-                with open(ruta_guardado, 'wb') as f:
-                    f.write(block_data) 
-                self.log_message.emit(f"Bloque recibido: {nombre_bloque} de {addr}")
-
-            elif command == "DOWNLOAD_BLOCK":
-                nombre_bloque = payload_bytes.decode('utf-8')
-                ruta_bloque = self.metadata_manager.get_local_storage_path(nombre_bloque)
-                
-                if os.path.exists(ruta_bloque):
-                    
-                    # --- CORRECCIÓN DE DEADLOCK ---
-                    # En lugar de conn.sendall(f.read()), enviamos en trozos
-                    # para liberar el GIL y permitir que el hilo cliente reciba.
-                    with open(ruta_bloque, 'rb') as f:
-                        while True:
-                            bytes_read = f.read(4096)
-                            if not bytes_read:
-                                break # Archivo enviado
-                            conn.sendall(bytes_read)
-                    # --- FIN DE LA CORRECCIÓN ---
-                    
-                    self.log_message.emit(f"Enviando bloque: {nombre_bloque} a {addr}")
-                else:
-                    self.log_message.emit(f"Petición de bloque {nombre_bloque} no encontrado.")
-                    # Importante: No enviamos nada, el cliente recibirá 0 bytes
-
-            elif command == "UPDATE_METADATA":
-                metadata_json = payload_bytes.decode('utf-8')
-                if self.metadata_manager.set_file_table(metadata_json):
-                    self.log_message.emit(f"Metadatos sincronizados desde {addr}")
-                    self.metadata_changed.emit()
-
-            elif command == "DELETE_BLOCK":
-                nombre_bloque = payload_bytes.decode('utf-8')
-                ruta_bloque = self.metadata_manager.get_local_storage_path(nombre_bloque)
-                if os.path.exists(ruta_bloque):
-                    os.remove(ruta_bloque)
-                    self.log_message.emit(f"Bloque eliminado localmente: {nombre_bloque}")
-                
-        except Exception as e:
-            self.log_message.emit(f"Error manejando cliente {addr}: {e}")
-        finally:
-            conn.close() # Esto le dice al cliente que terminamos de enviar
-
-    def stop(self):
-        self.is_running = False
\ No newline at end of file
+                respuesta = self.pool.wait(future)
+                if respuesta.status == STATUS_OK:
+                    delta = json.loads(bytes(respuesta.body).decode('utf-8'))
+                    cambio = metadata_manager.apply_delta(delta)[0] or cambio
+            except (OSError, ProtocolError, ValueError) as e:
+                print(f"Error de cliente (a {addr[0]}:{addr[1]}): {e}")
+        return cambio
+
+    def heartbeat(self, nodos):
+        """
+        Pide a la vez su estado (HEARTBEAT) a todos los nodos de 'nodos'.
+        Devuelve {addr: estadísticas} solo con los que respondieron.
+        """
+        futures = {tuple(addr): self.pool.submit(addr, OP_HEARTBEAT) for addr in nodos}
+        estados = {}
+        for addr, future in futures.items():
+            try:
+                respuesta = self.pool.wait(future)
+            except (OSError, ProtocolError):
+                continue
+            if respuesta.status == STATUS_OK:
+                estados[addr] = respuesta.args
+        return estados
+
+    def stats(self, target_addr):
+        """Métricas de un nodo (STATS, ver Metrics.Metrics.snapshot), o None si no responde."""
+        respuesta = self._request(target_addr, OP_STATS)
+        if respuesta is None or respuesta.status != STATUS_OK:
+            return None
+        return respuesta.args
+
+    def close(self):
+        self.pool.close()
+
+    def send_delete_block(self, target_addr, nombre_bloque):
+        """Envía DELETE_BLOCK {name}. Un bloque inexistente no es un error."""
+        respuesta = self._request(target_addr, OP_DELETE_BLOCK, {"name": nombre_bloque})
+        return respuesta is not None and respuesta.status in (STATUS_OK, STATUS_NOT_FOUND)
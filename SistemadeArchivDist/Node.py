@@ -0,0 +1,282 @@
+# Node.py
+
+import os
+import threading
+import time
+
+from Cache import BlockCache
+from Config import BLOCK_SIZE, CHUNKING
+from Metrics import Metrics
+from Network import DFSClient
+from Placement import PlacementEngine
+from Transfer import StreamingUploader, ParallelDownloader
+from Utils import MetadataManager, replicas_de_bloque
+
+# --- Núcleo del Sistema (sin GUI) ---
+#
+# DFSNode reúne lo que antes vivía en la ventana de Main.py: metadatos,
+# cliente, ubicación de bloques y, si es un nodo, servidor y verificación
+# de bloques. Lo usan la GUI (Main.py), el demonio (Daemon.py) y la línea
+# de comandos (Cli.py):
+#
+#     with DFSNode() as dfs:            # cliente, sin almacenamiento propio
+#         dfs.put("datos.csv")
+#         dfs.get("datos.csv", "/tmp/datos.csv")
+#
+#     nodo = DFSNode("192.168.1.10", 5001)   # nodo completo
+#     nodo.start()
+
+
+class DFSNode:
+    """
+    Un participante del sistema. Con 'port' es un nodo completo: sirve
+    bloques, guarda los metadatos en disco y, en segundo plano, verifica
+    sus bloques y vuelve a replicar los que estaban en un nodo caído. Sin
+    él (port=0) es solo un cliente: trae los metadatos de los nodos al
+    arrancar y les envía sus cambios.
+
+    Las operaciones (put, get, rm, ls, stat y sus variantes) bloquean
+    hasta terminar y lanzan excepciones: la GUI las ejecuta en hilos de
+    trabajo y la línea de comandos directamente. 'on_log(mensaje)' recibe los avisos y
+    'on_metadata_changed()' se llama cuando cambia la tabla.
+
+    Servidor y cliente anotan sus medidas en el mismo 'metrics' (ver
+    Metrics.py): un STATS a este nodo las devuelve todas.
+    """
+    def __init__(self, host_ip=None, port=0, on_log=None, on_metadata_changed=None):
+        self.host_addr = (host_ip, port)
+        self.on_log = on_log or print
+        self.on_metadata_changed = on_metadata_changed or (lambda: None)
+        self.metrics = Metrics()
+
+        self.metadata_manager = MetadataManager(f"nodo_{port}" if port else "cliente",
+                                                host_ip, port, persistir=bool(port))
+        if port:
+            # Caché de lectura: memoria + disco propio, y lectura directa de
+            # los bloques que este mismo nodo guarda
+            cache = BlockCache(disk_dir=f"{self.metadata_manager.storage_dir}_cache",
+                               local_addr=self.host_addr, local_dir=self.metadata_manager.storage_dir)
+        else:
+            cache = BlockCache(disk_bytes=0)
+        self.dfs_client = DFSClient(cache=cache, metrics=self.metrics)
+        # Estado de los nodos (espacio, carga) para decidir dónde subir bloques
+        self.placement = PlacementEngine(self.dfs_client)
+
+        self.server = None
+        self.scrubber = None
+        self.repairer = None
+        self._server_thread = None
+        if port:
+            # Solo un nodo necesita asyncio y el servidor
+            from Server import NodeServer
+            from Scrubber import Scrubber
+            from Repair import Repairer
+            self.server = NodeServer(host_ip, port, self.metadata_manager, on_log=self.on_log,
+                                     metrics=self.metrics, on_metadata_changed=self.on_metadata_changed)
+            # Verificación periódica de los bloques de este nodo
+            self.scrubber = Scrubber(self.metadata_manager, self.dfs_client, on_log=self.on_log,
+                                     on_repaired=self.server.invalidate_block)
+            # Re-replicación de los bloques de nodos perdidos (ver Repair.py)
+            self.repairer = Repairer(self.metadata_manager, self.dfs_client, self.placement,
+                                     metrics=self.metrics, on_log=self.on_log, on_changed=self.publish)
+
+    def start(self):
+        """Arranca el servidor y los hilos de fondo, y se pone al día con los demás nodos."""
+        if self.server is not None:
+            self._server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self._server_thread.start()
+            self.server.ready.wait()
+            self.placement.start()
+            self.scrubber.start()
+            self.repairer.start()
+        else:
+            # Un cliente dura una operación: basta una ronda de heartbeats
+            self.placement.refresh()
+        # Pedir a los demás nodos los cambios que nos perdimos
+        self.sync()
+        return self
+
+    def close(self):
+        self.placement.stop()
+        if self.server is not None:
+            self.scrubber.stop()
+            self.repairer.stop()
+            self.server.stop()
+            self._server_thread.join()
+        self.dfs_client.close()
+        self.metadata_manager.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- 1. Metadatos ---
+
+    def sync(self):
+        """Trae de los demás nodos las operaciones que faltan. Devuelve True si la tabla cambió."""
+        cambio = self.dfs_client.pull_metadata(self.metadata_manager, self.host_addr)
+        if cambio:
+            self.on_metadata_changed()
+        return cambio
+
+    def publish(self):
+        """Envía a cada nodo solo las operaciones que no tiene todavía."""
+        self.dfs_client.broadcast_metadata_delta(self.metadata_manager, self.host_addr)
+        self.on_metadata_changed()
+
+    def ls(self):
+        """[(nombre, tamaño, fecha)] de todos los archivos del sistema."""
+        return self.metadata_manager.get_lista_archivos()
+
+    def stat(self, filename):
+        """{'size', 'date', 'blocks'} de 'filename'. Lanza FileNotFoundError si no existe."""
+        for nombre, size, date in self.ls():
+            if nombre == filename:
+                return {"size": size, "date": date,
+                        "blocks": self.metadata_manager.get_file_blocks(filename)}
+        raise FileNotFoundError(f"El archivo {filename} no existe en el sistema.")
+
+    def stats(self, addr=None):
+        """
+        Métricas de este proceso, o las del nodo 'addr' pedidas con STATS
+        (None si no responde). Ver Metrics.to_prometheus para mostrarlas.
+        """
+        if addr is None:
+            return self.metrics.snapshot()
+        return self.dfs_client.stats(addr)
+
+    # --- 2. Operaciones sobre archivos ---
+
+    def put(self, filepath, erasure=None, block_size=BLOCK_SIZE, chunking=CHUNKING, on_progress=None):
+        """
+        Sube 'filepath' (ver Transfer.StreamingUploader), lo registra y
+        propaga el cambio. Con 'erasure' (un Erasure.ErasureCode) se guarda
+        con paridad en vez de réplicas. Si ya existía un archivo con ese
+        nombre se reemplaza, y sus bloques que nadie más usa se borran de
+        los nodos. Devuelve (nombre, tamaño, block_map).
+        """
+        filename, file_size, block_map, _, _ = self._subir(filepath, erasure, block_size, chunking,
+                                                           on_progress)
+        return filename, file_size, block_map
+
+    def put_many(self, filepaths, block_size=BLOCK_SIZE, chunking=CHUNKING, on_progress=None):
+        """
+        Sube varios archivos con réplicas en una sola pasada (ver
+        Transfer.StreamingUploader.upload_many): los bloques pequeños de
+        todos viajan en lotes por nodo y el cambio se propaga una sola vez.
+        Devuelve [(nombre, tamaño, block_map)] en el mismo orden; si falla,
+        no se registra ninguno.
+        """
+        uploader = StreamingUploader(self.dfs_client, self.metadata_manager, placement=self.placement,
+                                     block_size=block_size, chunking=chunking,
+                                     on_progress=on_progress, on_log=self.on_log)
+        inicio = time.perf_counter()
+        subidos = uploader.upload_many(filepaths)
+        sin_uso = []
+        for filename, file_size, block_map in subidos:
+            sin_uso += self.metadata_manager.add_file_entry(filename, file_size, block_map)
+        self.publish()
+        self._borrar_bloques(sin_uso)
+        self._medir("put_many", inicio, sum(file_size for _, file_size, _ in subidos))
+        return subidos
+
+    def update(self, filepath, erasure=None, block_size=BLOCK_SIZE, on_progress=None):
+        """
+        Sube una nueva versión de un archivo que ya está en el sistema,
+        partida por contenido (ver Chunking.py): los bloques que no
+        cambiaron ya están en los nodos y no se envían, y los de la versión
+        anterior que dejan de usarse se borran. Si la versión anterior se
+        subió con bloques fijos, esta primera actualización no reaprovecha
+        nada; las siguientes, sí.
+
+        Devuelve {'name', 'size', 'blocks', 'reused' (bloques que ya tenía
+        la versión anterior), 'sent_bytes', 'deleted'}. Lanza
+        FileNotFoundError si el archivo no existe.
+        """
+        anteriores = {entrada[0] for entrada in self.stat(os.path.basename(filepath))["blocks"]}
+        filename, file_size, block_map, enviados, borrados = self._subir(filepath, erasure, block_size,
+                                                                         "cdc", on_progress)
+        return {"name": filename, "size": file_size, "blocks": len(block_map),
+                "reused": sum(1 for entrada in block_map if entrada[0] in anteriores),
+                "sent_bytes": enviados, "deleted": borrados}
+
+    def _subir(self, filepath, erasure, block_size, chunking, on_progress):
+        """Sube y registra. Devuelve (nombre, tamaño, block_map, bytes enviados, bloques borrados)."""
+        uploader = StreamingUploader(self.dfs_client, self.metadata_manager, placement=self.placement,
+                                     erasure=erasure, block_size=block_size, chunking=chunking,
+                                     on_progress=on_progress, on_log=self.on_log)
+        inicio = time.perf_counter()
+        filename, file_size, block_map = uploader.upload(filepath)
+        sin_uso = self.metadata_manager.add_file_entry(filename, file_size, block_map)
+        self.publish()
+        # Bloques de la versión reemplazada que ya no usa ningún archivo
+        borrados = self._borrar_bloques(sin_uso)
+        self._medir("put", inicio, file_size)
+        return filename, file_size, block_map, uploader.bytes_transferidos, borrados
+
+    def get(self, filename, save_path=None, on_progress=None):
+        """Descarga 'filename' en 'save_path' (por defecto, con su nombre en el directorio actual)."""
+        bloques_info = self.metadata_manager.get_file_blocks(filename)
+        if not bloques_info:
+            raise FileNotFoundError(f"El archivo {filename} no existe en el sistema.")
+        save_path = save_path or os.path.basename(filename)
+        downloader = ParallelDownloader(self.dfs_client, on_progress=on_progress, on_log=self.on_log)
+        inicio = time.perf_counter()
+        file_size = self.metadata_manager.get_file_size(filename)
+        ruta = downloader.download(bloques_info, save_path, file_size)
+        self._medir("get", inicio, file_size)
+        return ruta
+
+    def rm(self, filename):
+        """
+        Quita 'filename' de la tabla, borra de los nodos los bloques que ya
+        no usa ningún archivo y propaga el cambio. Devuelve cuántos bloques
+        se borraron. Lanza FileNotFoundError si no existe.
+        """
+        borrados = self.rm_many([filename])
+        if filename not in borrados:
+            # Quizá otro nodo ya lo borró (rm_many ya nos puso al día)
+            raise FileNotFoundError(f"El archivo {filename} ya no existe en los metadatos.")
+        return borrados[filename]
+
+    def rm_many(self, filenames):
+        """
+        Quita varios archivos de la tabla, borra de una vez los bloques que
+        ya no usa ningún archivo (ver _borrar_bloques) y propaga el cambio
+        una sola vez. Devuelve {nombre: bloques borrados} de los que
+        existían; los demás no aparecen.
+        """
+        borrados = {}
+        entradas = []
+        for filename in filenames:
+            sin_uso = self.metadata_manager.remove_file_entry(filename)
+            if sin_uso is not None:
+                borrados[filename] = len(sin_uso)
+                entradas += sin_uso
+        self._borrar_bloques(entradas)
+        self.publish()
+        return borrados
+
+    def _borrar_bloques(self, entradas):
+        """
+        Borra de sus nodos los bloques de 'entradas' con peticiones
+        DELETE_BLOCKS agrupadas por nodo y enviadas en paralelo (miles de
+        bloques son unas pocas idas y vueltas). Devuelve cuántos eran.
+        """
+        por_nodo = {}
+        for entrada in entradas:
+            self.dfs_client.cache.invalidate(entrada[0])
+            for addr in replicas_de_bloque(entrada):
+                por_nodo.setdefault(addr, []).append(entrada[0])
+        confirmados = self.dfs_client.delete_blocks(por_nodo)
+        for addr, nombres in por_nodo.items():
+            fallidos = len(nombres) - len(confirmados[addr])
+            if fallidos:
+                self.on_log(f"Fallo al contactar {addr} para eliminar {fallidos} bloque(s)")
+        return len(entradas)
+
+    def _medir(self, op, inicio, nbytes):
+        self.metrics.observe("file_op_seconds", time.perf_counter() - inicio, op=op)
+        self.metrics.inc("file_op_bytes_total", nbytes or 0, op=op)
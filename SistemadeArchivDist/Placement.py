@@ -0,0 +1,181 @@
+# Placement.py
+
+import random
+import threading
+import time
+
+from Config import NODOS_CONOCIDOS, PLACEMENT_POLICY, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+
+# --- 1. Estado de cada nodo ---
+
+class NodeStats:
+    """
+    Último estado conocido de un nodo (respuesta a HEARTBEAT). 'pending'
+    son los bytes que este cliente ya le asignó desde ese heartbeat y que
+    el nodo aún no ha informado como usados o reservados.
+    """
+    __slots__ = ('addr', 'capacity', 'used', 'reserved', 'in_flight', 'throughput',
+                 'bytes', 'time', 'updated', 'pending')
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.capacity = 0
+        self.used = 0
+        self.reserved = 0
+        self.in_flight = 0
+        self.throughput = 0.0
+        self.bytes = None
+        self.time = None
+        self.updated = None
+        self.pending = 0
+
+    @property
+    def free(self):
+        return self.capacity - self.used - self.reserved - self.pending
+
+    def actualizar(self, estado, ahora):
+        if self.bytes is not None and estado["time"] > self.time:
+            self.throughput = (estado["bytes"] - self.bytes) / (estado["time"] - self.time)
+        self.capacity = estado["capacity"]
+        self.used = estado["used"]
+        self.reserved = estado["reserved"]
+        self.in_flight = estado["in_flight"]
+        self.bytes = estado["bytes"]
+        self.time = estado["time"]
+        self.updated = ahora
+        self.pending = 0
+
+
+# --- 2. Políticas ---
+# Cada política elige un nodo de 'candidatos' (todos vivos y con espacio
+# para el bloque). Se registran en POLITICAS por nombre (PLACEMENT_POLICY).
+
+def politica_aleatoria(candidatos):
+    return random.choice(candidatos)
+
+
+def politica_espacio_libre(candidatos):
+    """Al azar, con probabilidad proporcional al espacio libre: los nodos se llenan parejos."""
+    return random.choices(candidatos, weights=[max(s.free, 1) for s in candidatos])[0]
+
+
+def politica_dos_opciones(candidatos):
+    """
+    'Power of two choices': se toman dos nodos al azar y se queda el menos
+    cargado (menos transferencias en curso; a igualdad, más espacio libre).
+    """
+    if len(candidatos) < 2:
+        return candidatos[0]
+    a, b = random.sample(candidatos, 2)
+    return min((a, b), key=lambda s: (s.in_flight + s.pending // (1024 * 1024), -s.free))
+
+
+POLITICAS = {
+    "random": politica_aleatoria,
+    "free_space": politica_espacio_libre,
+    "two_choices": politica_dos_opciones,
+}
+
+
+# --- 3. Motor de ubicación ---
+
+class PlacementEngine:
+    """
+    Decide en qué nodos guardar cada bloque a partir de su estado, que
+    consulta con HEARTBEAT cada 'interval' segundos en un hilo propio.
+
+    - Solo se eligen nodos que respondieron hace menos de 'timeout'
+      segundos y que tienen espacio libre para el bloque, así que un
+      bloque nunca se envía a un nodo lleno.
+    - Las réplicas de un mismo bloque se reparten entre máquinas
+      distintas (IP) siempre que haya alguna con espacio.
+    - Entre los candidatos decide la política ('policy', ver POLITICAS).
+    """
+    def __init__(self, dfs_client, nodos=None, policy=PLACEMENT_POLICY,
+                 interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT):
+        self.dfs_client = dfs_client
+        self.nodos = [tuple(addr) for addr in (nodos or NODOS_CONOCIDOS.values())]
+        self.policy = POLITICAS[policy] if isinstance(policy, str) else policy
+        self.interval = interval
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.stats = {addr: NodeStats(addr) for addr in self.nodos}
+        self._stop = threading.Event()
+        self._thread = None
+        self._inicio = time.monotonic()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat_loop(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                return
+
+    def refresh(self):
+        """Consulta el estado de todos los nodos (una ronda de heartbeats)."""
+        estados = self.dfs_client.heartbeat(self.nodos)
+        ahora = time.monotonic()
+        with self.lock:
+            for addr, estado in estados.items():
+                try:
+                    self.stats[addr].actualizar(estado, ahora)
+                except (KeyError, TypeError) as e:
+                    print(f"Heartbeat inválido de {addr}: {e}")
+
+    def vivos(self):
+        ahora = time.monotonic()
+        with self.lock:
+            return [s.addr for s in self.stats.values()
+                    if s.updated is not None and ahora - s.updated < self.timeout]
+
+    def perdidos(self, grace):
+        """
+        Nodos que llevan más de 'grace' segundos sin responder al heartbeat
+        (contando desde que arrancó el motor si nunca respondieron).
+        """
+        ahora = time.monotonic()
+        with self.lock:
+            return [s.addr for s in self.stats.values()
+                    if ahora - (s.updated if s.updated is not None else self._inicio) >= grace]
+
+    def choose(self, n, size, exclude=()):
+        """
+        Elige hasta 'n' nodos distintos (y distintos de 'exclude') con espacio
+        para 'size' bytes, y les descuenta ese espacio hasta el próximo
+        heartbeat. Devuelve menos de 'n' si no hay suficientes.
+        """
+        if not any(s.updated is not None for s in self.stats.values()):
+            self.refresh()
+
+        ahora = time.monotonic()
+        exclude = {tuple(addr) for addr in exclude}
+        hosts = {addr[0] for addr in exclude}
+        elegidos = []
+        with self.lock:
+            while len(elegidos) < n:
+                disponibles = [s for s in self.stats.values()
+                               if s.addr not in exclude and s.updated is not None
+                               and ahora - s.updated < self.timeout and s.free >= size]
+                if not disponibles:
+                    break
+                otra_maquina = [s for s in disponibles if s.addr[0] not in hosts]
+                elegido = self.policy(otra_maquina or disponibles)
+                elegido.pending += size
+                elegidos.append(elegido.addr)
+                exclude.add(elegido.addr)
+                hosts.add(elegido.addr[0])
+        return elegidos
+
+    def release(self, addr, size):
+        """Devuelve el espacio descontado en choose() si el bloque no llegó a enviarse."""
+        with self.lock:
+            stats = self.stats.get(tuple(addr))
+            if stats is not None:
+                stats.pending = max(0, stats.pending - size)
@@ -0,0 +1,287 @@
+# Pool.py
+
+import itertools
+import select
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from Metrics import Metrics
+from Protocol import (OP_PING, OPCODE_NAMES, HEADER_SIZE, STATUS_OK, ProtocolError, encode_args,
+                      encode_header, recv_message, send_body)
+
+# --- 1. Conexión persistente con pipelining ---
+
+class PeerConnection:
+    """
+    Una conexión TCP persistente hacia un nodo. Varias peticiones pueden
+    estar en vuelo a la vez: cada una lleva su request_id y un hilo lector
+    entrega cada respuesta al Future correspondiente, sin esperar a que
+    termine la anterior para enviar la siguiente.
+
+    En 'metrics' se anotan los bytes enviados y recibidos y la duración de
+    cada petición, por comando y nodo.
+
+    'timeout' es el plazo para conectar y también para cada trozo que se
+    envía o se recibe a mitad de un mensaje: un nodo que deja de leer, o
+    que se queda callado a mitad de una respuesta, corta la conexión en
+    vez de bloquear para siempre a quien envía por ella. Esperar a que
+    empiece una respuesta no tiene plazo aquí; eso lo decide cada Future.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, addr, timeout, metrics=None):
+        self.addr = tuple(addr)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.peer = f"{self.addr[0]}:{self.addr[1]}"
+        self.sock = socket.create_connection(self.addr, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock.settimeout(timeout)
+
+        self.send_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+        self.last_used = time.monotonic()
+
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def submit(self, opcode, args=None, body=b''):
+        """
+        Envía una petición y devuelve un Future con el Message de respuesta.
+        'body' puede ser bytes o un Protocol.FileRange (se envía con sendfile).
+        """
+        future = Future()
+        if self.closed:
+            future.set_exception(ConnectionError(f"Conexión a {self.addr} cerrada"))
+            return future
+
+        request_id = next(self._ids) & 0xFFFFFFFF
+        args_bytes = encode_args(args)
+        with self.pending_lock:
+            self.pending[request_id] = future
+        self.last_used = time.monotonic()
+        future.add_done_callback(self._medidor(opcode, time.perf_counter()))
+
+        try:
+            # El cerrojo impide que dos peticiones se intercalen en el socket
+            with self.send_lock:
+                self.sock.sendall(encode_header(opcode, len(args_bytes), len(body), request_id)
+                                  + args_bytes)
+                send_body(self.sock, body)
+            self.metrics.inc("client_bytes_out_total", HEADER_SIZE + len(args_bytes) + len(body))
+        except OSError as e:
+            self.close(e)
+        return future
+
+    def _medidor(self, opcode, inicio):
+        """Callback que anota cuánto tardó la petición, o que falló."""
+        op = OPCODE_NAMES.get(opcode, str(opcode))
+
+        def medir(future):
+            # Una petición abandonada (hedged read que perdió, plazo agotado) no cuenta
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.metrics.inc("client_request_errors_total", op=op, peer=self.peer)
+            else:
+                self.metrics.observe("client_request_seconds", time.perf_counter() - inicio,
+                                     op=op, peer=self.peer)
+        return medir
+
+    def _read_loop(self):
+        error = ConnectionError(f"Conexión a {self.addr} cerrada por el servidor")
+        try:
+            while True:
+                # Entre mensajes se espera sin plazo a que llegue algo (o a
+                # que close() haga shutdown); el plazo del socket solo corre
+                # ya dentro de un mensaje
+                select.select([self.sock], [], [])
+                respuesta = recv_message(self.sock)
+                if respuesta is None:
+                    break
+                # Los argumentos de las respuestas (JSON corto) no se cuentan
+                self.metrics.inc("client_bytes_in_total", HEADER_SIZE + len(respuesta.body))
+                self.last_used = time.monotonic()
+                with self.pending_lock:
+                    future = self.pending.pop(respuesta.request_id, None)
+                # Si la petición fue cancelada o expiró, se descarta la respuesta
+                if future is not None and future.set_running_or_notify_cancel():
+                    future.set_result(respuesta)
+        except (OSError, ValueError, ProtocolError) as e:
+            # ValueError: select() sobre un socket que close() ya cerró
+            error = e
+        self.close(error)
+
+    def close(self, error=None):
+        with self.pending_lock:
+            if self.closed:
+                return
+            self.closed = True
+            pendientes = list(self.pending.values())
+            self.pending.clear()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+        error = error or ConnectionError(f"Conexión a {self.addr} cerrada")
+        for future in pendientes:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+
+# --- 2. Pool de conexiones por nodo ---
+
+class ConnectionPool:
+    """
+    Mantiene hasta 'max_per_peer' conexiones persistentes por nodo.
+    Una petición usa la conexión menos cargada y solo se abre una nueva
+    cuando todas tienen 'max_in_flight' peticiones pendientes. Un hilo de
+    mantenimiento cierra conexiones ociosas y comprueba con PING las que
+    llevan un rato sin tráfico.
+    """
+    def __init__(self, timeout=3, max_per_peer=4, max_in_flight=32,
+                 idle_timeout=60.0, health_interval=15.0, metrics=None):
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.max_per_peer = max_per_peer
+        self.max_in_flight = max_in_flight
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+
+        self.lock = threading.Lock()
+        self.peers = {}
+        # Conexiones que se están abriendo, por nodo: ocupan cupo de
+        # 'max_per_peer' desde antes de conectar
+        self._conectando = {}
+        self._abierta = threading.Condition(self.lock)
+        self._stop = threading.Event()
+        self._maintenance = threading.Thread(target=self._maintenance_loop, daemon=True)
+        self._maintenance.start()
+        self.metrics.gauge("client_in_flight", self.in_flight)
+
+    def in_flight(self):
+        """Peticiones enviadas que aún esperan respuesta, en todas las conexiones."""
+        with self.lock:
+            return sum(c.in_flight for lista in self.peers.values() for c in lista)
+
+    def _acquire(self, addr):
+        addr = tuple(addr)
+        with self.lock:
+            while True:
+                conexiones = [c for c in self.peers.get(addr, []) if not c.closed]
+                self.peers[addr] = conexiones
+                conectando = self._conectando.get(addr, 0)
+                lleno = len(conexiones) + conectando >= self.max_per_peer
+                if conexiones:
+                    mejor = min(conexiones, key=lambda c: c.in_flight)
+                    if mejor.in_flight < self.max_in_flight or lleno:
+                        return mejor
+                if not lleno:
+                    break
+                # Aún no hay ninguna abierta y todo el cupo se está conectando
+                self._abierta.wait()
+            self._conectando[addr] = conectando + 1
+
+        # Conectar fuera del cerrojo para no bloquear a los demás nodos; el
+        # hueco ya está reservado
+        nueva = None
+        try:
+            nueva = PeerConnection(addr, self.timeout, self.metrics)
+        finally:
+            with self.lock:
+                self._conectando[addr] -= 1
+                if not self._conectando[addr]:
+                    del self._conectando[addr]
+                if nueva is not None:
+                    self.peers.setdefault(addr, []).append(nueva)
+                self._abierta.notify_all()
+        return nueva
+
+    def submit(self, addr, opcode, args=None, body=b''):
+        """Envía una petición sin esperar la respuesta (pipelining)."""
+        try:
+            return self._acquire(addr).submit(opcode, args, body)
+        except OSError as e:
+            self.metrics.inc("client_connect_errors_total", peer=f"{addr[0]}:{addr[1]}")
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def wait(self, future, timeout=None):
+        """
+        Espera la respuesta de 'future'. Si vence el plazo, solo esa
+        petición se abandona (ver cancel): las demás que comparten su
+        conexión siguen esperando sus propias respuestas.
+        """
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            self.metrics.inc("client_timeouts_total")
+            self.cancel(future)
+            raise TimeoutError("Tiempo de espera agotado esperando respuesta")
+
+    def request(self, addr, opcode, args=None, body=b'', timeout=None):
+        return self.wait(self.submit(addr, opcode, args, body), timeout)
+
+    def cancel(self, future):
+        """
+        Abandona una petición cuya respuesta ya no interesa. Si era la única
+        pendiente en su conexión, la conexión se cierra para que el nodo deje
+        de enviar; si no, su respuesta se descartará al llegar.
+        """
+        future.cancel()
+        with self.lock:
+            conexiones = [c for lista in self.peers.values() for c in lista]
+        for conn in conexiones:
+            with conn.pending_lock:
+                pendientes = list(conn.pending.values())
+            if future in pendientes:
+                if len(pendientes) == 1:
+                    conn.close(ConnectionAbortedError("Petición cancelada"))
+                return
+
+    def _maintenance_loop(self):
+        intervalo = max(1.0, min(self.idle_timeout, self.health_interval) / 2)
+        while not self._stop.wait(intervalo):
+            ahora = time.monotonic()
+            with self.lock:
+                conexiones = [c for lista in self.peers.values() for c in lista]
+            for conn in conexiones:
+                if conn.closed or conn.in_flight:
+                    continue
+                ocioso = ahora - conn.last_used
+                if ocioso >= self.idle_timeout:
+                    conn.close()
+                elif ocioso >= self.health_interval:
+                    self._health_check(conn)
+            with self.lock:
+                for addr in list(self.peers):
+                    self.peers[addr] = [c for c in self.peers[addr] if not c.closed]
+                    if not self.peers[addr]:
+                        del self.peers[addr]
+
+    def _health_check(self, conn):
+        try:
+            respuesta = conn.submit(OP_PING).result(self.timeout)
+            if respuesta.status != STATUS_OK:
+                conn.close()
+        except Exception:
+            conn.close()
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            conexiones = [c for lista in self.peers.values() for c in lista]
+            self.peers.clear()
+        for conn in conexiones:
+            conn.close()
@@ -0,0 +1,220 @@
+# Protocol.py
+
+import json
+import struct
+from collections import namedtuple
+
+# --- 1. Formato del Encabezado ---
+# Todo mensaje (petición o respuesta) empieza con un encabezado fijo:
+#
+#   magic (2s) | versión (B) | opcode (B) | flags (B) | status (B) |
+#   request_id (I) | longitud_args (I) | longitud_cuerpo (Q)
+#
+# Después vienen 'longitud_args' bytes de argumentos (JSON UTF-8) y
+# 'longitud_cuerpo' bytes binarios (los datos del bloque). Como el receptor
+# conoce ambos tamaños por adelantado puede reservar el buffer exacto y la
+# conexión puede reutilizarse para varios mensajes seguidos.
+
+MAGIC = b'SD'
+PROTOCOL_VERSION = 1
+
+HEADER_FORMAT = "!2sBBBBIIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+_HEADER = struct.Struct(HEADER_FORMAT)
+
+# Límites defensivos para no aceptar un encabezado corrupto o malicioso. Los
+# cuerpos más grandes son los metadatos completos (METADATA_PULL); un bloque
+# o un lote de UPLOAD_BLOCKS ocupan unos pocos MB. Aun así la memoria se
+# reserva a medida que llegan los bytes (ver recv_exact), no según el
+# tamaño anunciado.
+MAX_ARGS_SIZE = 16 * 1024 * 1024
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# --- 2. Opcodes ---
+OP_UPLOAD_BLOCK = 1
+OP_DOWNLOAD_BLOCK = 2
+# 3 era UPDATE_METADATA (la tabla completa); se sustituyó por METADATA_DELTA
+OP_DELETE_BLOCK = 4
+OP_PING = 5
+OP_HAVE_BLOCKS = 6
+OP_METADATA_DELTA = 7
+OP_METADATA_PULL = 8
+OP_HEARTBEAT = 9
+OP_STATS = 10
+OP_DELETE_BLOCKS = 11
+OP_UPLOAD_BLOCKS = 12
+OP_STAT_BLOCKS = 13
+
+OPCODE_NAMES = {
+    OP_UPLOAD_BLOCK: "UPLOAD_BLOCK",
+    OP_DOWNLOAD_BLOCK: "DOWNLOAD_BLOCK",
+    OP_DELETE_BLOCK: "DELETE_BLOCK",
+    OP_PING: "PING",
+    OP_HAVE_BLOCKS: "HAVE_BLOCKS",
+    OP_METADATA_DELTA: "METADATA_DELTA",
+    OP_METADATA_PULL: "METADATA_PULL",
+    OP_HEARTBEAT: "HEARTBEAT",
+    OP_STATS: "STATS",
+    OP_DELETE_BLOCKS: "DELETE_BLOCKS",
+    OP_UPLOAD_BLOCKS: "UPLOAD_BLOCKS",
+    OP_STAT_BLOCKS: "STAT_BLOCKS",
+}
+
+# --- 3. Códigos de Estado (solo significativos en respuestas) ---
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2
+STATUS_BAD_REQUEST = 3
+STATUS_NO_SPACE = 4
+STATUS_CORRUPT = 5
+
+STATUS_NAMES = {
+    STATUS_OK: "OK",
+    STATUS_NOT_FOUND: "NOT_FOUND",
+    STATUS_ERROR: "ERROR",
+    STATUS_BAD_REQUEST: "BAD_REQUEST",
+    STATUS_NO_SPACE: "NO_SPACE",
+    STATUS_CORRUPT: "CORRUPT",
+}
+
+# --- 4. Flags ---
+FLAG_RESPONSE = 0x01
+
+# Tamaño de los trozos al enviar o recibir cuerpos grandes en streaming
+CHUNK_SIZE = 256 * 1024
+
+
+class ProtocolError(Exception):
+    """Mensaje mal formado o de una versión de protocolo desconocida."""
+
+
+Message = namedtuple('Message', 'opcode flags status request_id args body')
+
+
+class FileRange:
+    """
+    Cuerpo de mensaje tomado de un rango de un archivo abierto. Se envía con
+    socket.sendfile (sin copias en Python) en lugar de cargarlo en memoria.
+    """
+    __slots__ = ('file', 'offset', 'count')
+
+    def __init__(self, file, offset, count):
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+
+def encode_header(opcode, args_len, body_len, request_id=0, status=STATUS_OK, flags=0):
+    return _HEADER.pack(MAGIC, PROTOCOL_VERSION, opcode, flags, status,
+                        request_id, args_len, body_len)
+
+
+def decode_header(data):
+    """Devuelve (opcode, flags, status, request_id, args_len, body_len)."""
+    magic, version, opcode, flags, status, request_id, args_len, body_len = _HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError(f"Magic inválido: {bytes(magic)!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Versión de protocolo no soportada: {version}")
+    if args_len > MAX_ARGS_SIZE or body_len > MAX_BODY_SIZE:
+        raise ProtocolError(f"Tamaños fuera de rango (args={args_len}, cuerpo={body_len})")
+    return opcode, flags, status, request_id, args_len, body_len
+
+
+def encode_args(args):
+    if not args:
+        return b''
+    return json.dumps(args, separators=(',', ':')).encode('utf-8')
+
+
+def decode_args(raw):
+    """Los argumentos son siempre un objeto JSON; cualquier otra cosa es un error."""
+    if not raw:
+        return {}
+    try:
+        args = json.loads(bytes(raw).decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Argumentos inválidos: {e}")
+    if not isinstance(args, dict):
+        raise ProtocolError(f"Los argumentos deben ser un objeto, no {type(args).__name__}")
+    return args
+
+
+def build_message(opcode, args=None, body=b'', request_id=0, status=STATUS_OK, flags=0):
+    """Serializa un mensaje completo (encabezado + args + cuerpo) en bytes."""
+    args_bytes = encode_args(args)
+    header = encode_header(opcode, len(args_bytes), len(body), request_id, status, flags)
+    return header + args_bytes + bytes(body)
+
+
+def build_response(request, status=STATUS_OK, args=None, body=b''):
+    """Construye la respuesta a 'request' conservando su opcode y request_id."""
+    return build_message(request.opcode, args, body, request.request_id,
+                         status, FLAG_RESPONSE)
+
+
+# --- 5. E/S sobre sockets bloqueantes ---
+
+def recv_exact(sock, n):
+    """
+    Lee exactamente 'n' bytes con recv_into, sin concatenaciones. El buffer
+    empieza en CHUNK_SIZE y dobla su tamaño cada vez que se llena: 'n' viene
+    del encabezado del par y no se reserva hasta que los bytes llegan.
+    Lanza ConnectionError si el par cierra a medias.
+    """
+    buffer = bytearray(min(n, CHUNK_SIZE))
+    recibidos = 0
+    while recibidos < n:
+        if recibidos == len(buffer):
+            buffer.extend(bytes(min(n, 2 * len(buffer)) - len(buffer)))
+        with memoryview(buffer) as view:
+            leidos = sock.recv_into(view[recibidos:])
+        if leidos == 0:
+            raise ConnectionError(f"Conexión cerrada tras {recibidos} de {n} bytes")
+        recibidos += leidos
+    return buffer
+
+
+def recv_message(sock):
+    """
+    Lee un mensaje completo. Devuelve None si el par cerró la conexión
+    limpiamente entre mensajes.
+    """
+    first = sock.recv(HEADER_SIZE)
+    if not first:
+        return None
+    if len(first) < HEADER_SIZE:
+        first += recv_exact(sock, HEADER_SIZE - len(first))
+
+    opcode, flags, status, request_id, args_len, body_len = decode_header(first)
+    args = decode_args(recv_exact(sock, args_len)) if args_len else {}
+    body = recv_exact(sock, body_len) if body_len else b''
+    return Message(opcode, flags, status, request_id, args, body)
+
+
+def send_body(sock, body):
+    """
+    Envía el cuerpo: bytes con sendall, o un FileRange con sendfile. Si el
+    socket tiene plazo, se aplica a cada trozo de CHUNK_SIZE (sendfile ya
+    lo hace así): un par que deja de leer corta el envío, pero uno lento
+    que sigue avanzando no.
+    """
+    if isinstance(body, FileRange):
+        # socket.sendfile usa os.sendfile cuando puede y si no cae a send()
+        enviados = sock.sendfile(body.file, body.offset, body.count)
+        if enviados != body.count:
+            raise ConnectionError(f"sendfile envió {enviados} de {body.count} bytes")
+    elif body:
+        with memoryview(body) as view:
+            for inicio in range(0, len(view), CHUNK_SIZE):
+                sock.sendall(view[inicio:inicio + CHUNK_SIZE])
+
+
+def send_message(sock, opcode, args=None, body=b'', request_id=0, status=STATUS_OK, flags=0):
+    args_bytes = encode_args(args)
+    header = encode_header(opcode, len(args_bytes), len(body), request_id, status, flags)
+    sock.sendall(header + args_bytes)
+    send_body(sock, body)
@@ -0,0 +1,12 @@
+# QtAdapter.py
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# --- Adaptador Qt del Nodo ---
+# El nodo (Node.DFSNode) no depende de PyQt5: avisa con callbacks desde
+# sus propios hilos. Esta clase los convierte en señales, que Qt entrega
+# en el hilo de la GUI.
+
+class NodeSignals(QObject):
+    metadata_changed = pyqtSignal()
+    log_message = pyqtSignal(str)
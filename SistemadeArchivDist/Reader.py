@@ -0,0 +1,140 @@
+# Reader.py
+
+import io
+import os
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from Config import BLOCK_SIZE, DOWNLOAD_CONCURRENCY
+from Erasure import StripeIndex
+from Transfer import BlockFetcher
+from Utils import disposicion_bloques
+
+# --- 1. Lectura de Rangos ---
+
+class RangeReader:
+    """
+    Lee rangos de bytes de un archivo del sistema sin descargarlo entero.
+    El rango se traduce a los bloques que lo cubren y a cada nodo se le
+    pide solo el trozo necesario de cada bloque (DOWNLOAD_BLOCK con
+    'offset' y 'length'). Si el rango abarca varios bloques, se piden en
+    paralelo. Si un bloque de un archivo con erasure coding no se puede
+    leer, se reconstruye entero con su franja y se toma el trozo pedido.
+
+        reader = RangeReader(dfs_client, metadata_manager)
+        cabecera = reader.read("datos.csv", 0, 4096)
+        with reader.open("video.mp4") as f:
+            f.seek(-1024, os.SEEK_END)
+            cola = f.read()
+    """
+    def __init__(self, dfs_client, metadata_manager, concurrency=DOWNLOAD_CONCURRENCY, on_log=None):
+        self.metadata_manager = metadata_manager
+        self.fetcher = BlockFetcher(dfs_client, on_log)
+        self.franjas = StripeIndex()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def layout(self, filename):
+        """(tamaño, disposición de bloques) del archivo. Lanza FileNotFoundError si no existe."""
+        file_size = self.metadata_manager.get_file_size(filename)
+        if file_size is None:
+            raise FileNotFoundError(f"El archivo {filename} no existe en el sistema.")
+        block_map = self.metadata_manager.get_file_blocks(filename)
+        self.franjas.add(block_map)
+        return file_size, disposicion_bloques(block_map, file_size)
+
+    def read(self, filename, offset, length):
+        """Hasta 'length' bytes de 'filename' desde 'offset' (menos si llega al final)."""
+        file_size, bloques = self.layout(filename)
+        return self.read_range(file_size, bloques, offset, length)
+
+    def read_range(self, file_size, bloques, offset, length):
+        """Como read(), con la disposición ya obtenida de layout()."""
+        if offset < 0 or length < 0:
+            raise ValueError("offset y length no pueden ser negativos")
+        fin = min(offset + length, file_size)
+        if offset >= fin:
+            return b''
+
+        # Tramos (bloque, inicio dentro del bloque, bytes) que cubren [offset, fin)
+        i = max(0, bisect_right([b[0] for b in bloques], offset) - 1)
+        tramos = []
+        while i < len(bloques) and bloques[i][0] < fin:
+            inicio_bloque, size, nombre_bloque, replicas, crc = bloques[i]
+            inicio = max(offset, inicio_bloque) - inicio_bloque
+            n = min(fin, inicio_bloque + size) - inicio_bloque - inicio
+            tramos.append((nombre_bloque, replicas, inicio, n, size, crc))
+            i += 1
+
+        if len(tramos) == 1:
+            partes = [self._leer_tramo(*tramos[0])]
+        else:
+            partes = list(self.executor.map(lambda t: self._leer_tramo(*t), tramos))
+        return b''.join(partes)
+
+    def _leer_tramo(self, nombre_bloque, replicas, inicio, n, size, crc):
+        # Un bloque entero se comprueba con el CRC de los metadatos; un trozo
+        # no se puede comprobar (ver BlockFetcher.fetch)
+        if inicio == 0 and n == size:
+            data = self.fetcher.fetch(nombre_bloque, replicas, crc=crc)
+        else:
+            data = self.fetcher.fetch(nombre_bloque, replicas, inicio, n)
+        if data is None and nombre_bloque in self.franjas:
+            self.fetcher.metrics.inc("client_stripe_recoveries_total")
+            data = self.franjas.recover(nombre_bloque, self.fetcher)[inicio:inicio + n]
+        if data is None or len(data) != n:
+            raise IOError(f"No se pudo leer el bloque {nombre_bloque} de ninguna réplica.")
+        return data
+
+    def open(self, filename, buffer_size=BLOCK_SIZE):
+        """Objeto archivo de solo lectura (read/seek/tell) con buffer sobre 'filename'."""
+        return io.BufferedReader(DFSFile(self, filename), buffer_size)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# --- 2. Objeto Archivo ---
+
+class DFSFile(io.RawIOBase):
+    """
+    Archivo del sistema visto como un archivo local de solo lectura. Cada
+    read() pide al sistema solo los bytes solicitados; envuelto en un
+    io.BufferedReader (ver RangeReader.open) las lecturas pequeñas y
+    seguidas se agrupan en peticiones de un bloque.
+    """
+    def __init__(self, reader, filename):
+        super().__init__()
+        self.reader = reader
+        self.name = filename
+        self.size, self._bloques = reader.layout(filename)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.reader.read_range(self.size, self._bloques, self._pos, len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if pos < 0:
+            raise ValueError("Posición negativa")
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
@@ -0,0 +1,211 @@
+# Repair.py
+
+import os
+import threading
+import time
+
+from Config import REPAIR_RATE_MB, REPAIR_GRACE, REPAIR_INTERVAL
+from Protocol import FileRange
+
+# --- Re-replicación de Bloques tras la Pérdida de un Nodo ---
+
+class TokenBucket:
+    """
+    Presupuesto de 'rate' bytes/s con ráfagas de hasta 'burst' bytes (por
+    defecto, un segundo). Un envío más grande que la ráfaga se permite y
+    deja el saldo en negativo: los siguientes esperan a recuperarlo.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n, stop=None):
+        """Espera hasta poder gastar 'n' bytes. Devuelve False si 'stop' (un Event) se activa antes."""
+        with self.lock:
+            while True:
+                ahora = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (ahora - self.updated) * self.rate)
+                self.updated = ahora
+                if self.tokens >= min(n, self.burst):
+                    self.tokens -= n
+                    return True
+                espera = (min(n, self.burst) - self.tokens) / self.rate
+                if stop is not None:
+                    if stop.wait(espera):
+                        return False
+                else:
+                    time.sleep(espera)
+
+
+class Repairer:
+    """
+    Devuelve a su factor de replicación los bloques que guardaba un nodo
+    caído. Un nodo se da por perdido cuando lleva 'grace' segundos sin
+    responder al heartbeat (ver Placement.PlacementEngine.perdidos): un
+    reinicio corto no dispara copias. Cada 'interval' segundos:
+
+    - Con el índice inverso de los metadatos (bloques por nodo) se buscan
+      los bloques que tenían una réplica en un nodo perdido.
+    - De cada uno se encarga solo la primera de sus réplicas vivas: si es
+      este nodo, envía su copia local directamente al nodo que elija el
+      PlacementEngine (con espacio, vivo, sin el bloque). Los datos van de
+      nodo a nodo, sin pasar por ningún cliente.
+    - Los envíos no superan 'rate' bytes/s (un TokenBucket) y van de uno
+      en uno, para no quitar ancho de banda a las lecturas de los clientes.
+    - Cada 'interval' segundos, y al final de la pasada, los nodos nuevos
+      reemplazan a los perdidos en los metadatos y 'on_changed()' lo
+      propaga (Node.py publica el delta).
+
+    Si el nodo perdido vuelve, se borran de él los bloques que ya se
+    copiaron a otro sitio (solo los que reparó este proceso). Las piezas
+    de erasure coding no tienen copias: se reconstruyen al leerlas (ver
+    Erasure.StripeIndex).
+    """
+    def __init__(self, metadata_manager, dfs_client, placement, rate=REPAIR_RATE_MB * 1024 * 1024,
+                 grace=REPAIR_GRACE, interval=REPAIR_INTERVAL, metrics=None, on_log=None,
+                 on_changed=None):
+        self.metadata_manager = metadata_manager
+        self.dfs_client = dfs_client
+        self.placement = placement
+        self.bucket = TokenBucket(rate)
+        self.grace = grace
+        self.interval = interval
+        self.metrics = metrics if metrics is not None else dfs_client.metrics
+        self.on_log = on_log or print
+        self.on_changed = on_changed or (lambda: None)
+
+        self.stats = {"under_replicated": 0, "repaired": 0, "failed": 0, "bytes": 0, "lost": 0}
+        # Nodo perdido -> bloques que este proceso copió a otro sitio
+        self.movidos = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.metrics.gauge("repair_under_replicated", lambda: self.stats["under_replicated"])
+        self.metrics.gauge("repair_lost_blocks", lambda: self.stats["lost"])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._repair_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _repair_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.repair_once()
+            except Exception as e:
+                # Un error en una pasada no debe parar las siguientes
+                self.on_log(f"Error en la re-replicación: {e}")
+
+    # --- 1. Pasada de reparación ---
+
+    def repair_once(self):
+        """Busca y repara los bloques con réplicas perdidas. Devuelve cuántos se repararon."""
+        perdidos = set(self.placement.perdidos(self.grace))
+        self._limpiar_devueltos(perdidos)
+        if not perdidos:
+            self.stats["under_replicated"] = self.stats["lost"] = 0
+            return 0
+
+        bloques = self.metadata_manager.get_bloques_en_nodos(perdidos)
+        self.stats["under_replicated"] = len(bloques)
+        sin_copia = 0
+        cambios = {}
+        reparados = 0
+        ultimo_guardado = time.monotonic()
+        for nombre_bloque, replicas in bloques.items():
+            if self._stop.is_set():
+                break
+            vivas = [addr for addr in replicas if addr not in perdidos]
+            if not vivas:
+                sin_copia += 1
+                continue
+            # Solo repara la primera réplica viva: los demás nodos hacen el
+            # mismo cálculo y no copian el bloque otra vez
+            if vivas[0] != self.metadata_manager.host_addr:
+                continue
+            caidas = [addr for addr in replicas if addr in perdidos]
+            nuevas = self._replicar(nombre_bloque, replicas, len(caidas))
+            if nuevas:
+                cambios[nombre_bloque] = dict(zip(caidas, nuevas))
+                reparados += 1
+            if cambios and time.monotonic() - ultimo_guardado >= self.interval:
+                self._guardar(cambios)
+                cambios = {}
+                ultimo_guardado = time.monotonic()
+        if cambios:
+            self._guardar(cambios)
+
+        if sin_copia != self.stats["lost"] and sin_copia:
+            self.on_log(f"{sin_copia} bloque(s) sin ninguna réplica viva: no se pueden copiar")
+        self.stats["lost"] = sin_copia
+        return reparados
+
+    def _replicar(self, nombre_bloque, replicas, faltan):
+        """Envía la copia local a hasta 'faltan' nodos nuevos. Devuelve los que la guardaron."""
+        ruta = self.metadata_manager.get_local_storage_path(nombre_bloque)
+        try:
+            size = os.path.getsize(ruta)
+        except OSError:
+            # Este nodo debería tenerlo y no lo tiene: que lo copie otra réplica
+            # cuando el Scrubber o una lectura lo detecten
+            self.on_log(f"Bloque {nombre_bloque} no está en el disco local; no se puede re-replicar")
+            return []
+        destinos = self.placement.choose(faltan, size, exclude=replicas)
+        if not destinos:
+            self.metrics.inc("repair_blocks_total", result="no_target")
+            self.stats["failed"] += 1
+            return []
+
+        ref = self.metadata_manager.get_referencia_bloque(nombre_bloque)
+        nuevas = []
+        for i, addr in enumerate(destinos):
+            if not self.bucket.consume(size, self._stop):
+                for pendiente in destinos[i:]:
+                    self.placement.release(pendiente, size)
+                break
+            try:
+                with open(ruta, 'rb') as f:
+                    guardado = self.dfs_client.upload_block([addr], nombre_bloque,
+                                                            FileRange(f, 0, size), ref)
+            except OSError:
+                guardado = []
+            if guardado:
+                nuevas.append(addr)
+                self.stats["repaired"] += 1
+                self.stats["bytes"] += size
+                self.metrics.inc("repair_blocks_total", result="ok")
+                self.metrics.inc("repair_bytes_total", size)
+            else:
+                self.placement.release(addr, size)
+                self.stats["failed"] += 1
+                self.metrics.inc("repair_blocks_total", result="failed")
+                self.on_log(f"No se pudo copiar {nombre_bloque} a {addr[0]}:{addr[1]}")
+        return nuevas
+
+    def _guardar(self, cambios):
+        """Anota las réplicas nuevas en los metadatos y lo avisa para propagarlo."""
+        archivos = self.metadata_manager.mover_replicas(cambios)
+        for nombre_bloque, reemplazos in cambios.items():
+            for caida in reemplazos:
+                self.movidos.setdefault(caida, set()).add(nombre_bloque)
+        self.on_log(f"Re-replicados {len(cambios)} bloque(s) de {archivos} archivo(s)")
+        self.on_changed()
+
+    # --- 2. Nodos que vuelven ---
+
+    def _limpiar_devueltos(self, perdidos):
+        """
+        Borra de los nodos que vuelven a responder las copias que ya se
+        hicieron en otro sitio, si los metadatos ya no las sitúan en ellos.
+        """
+        vivos = set(self.placement.vivos())
+        for addr in [a for a in self.movidos if a in vivos and a not in perdidos]:
+            en_nodo = set(self.metadata_manager.get_bloques_en_nodo(addr))
+            sobrantes = [nombre_bloque for nombre_bloque in self.movidos.pop(addr) if nombre_bloque not in en_nodo]
+            borrados = self.dfs_client.delete_blocks({addr: sobrantes})[addr] if sobrantes else ()
+            if borrados:
+                self.on_log(f"{addr[0]}:{addr[1]} volvió: borradas {len(borrados)} copia(s) ya re-replicadas")
@@ -0,0 +1,139 @@
+# Scrubber.py
+
+import os
+import threading
+import time
+
+from Config import SCRUB_RATE_MB, SCRUB_INTERVAL
+from Protocol import STATUS_OK
+from Utils import bloque_integro
+
+# --- Verificación Periódica de los Bloques Locales ---
+
+class Scrubber:
+    """
+    Relee en segundo plano los bloques guardados en este nodo y comprueba
+    su integridad con el CRC32 de los metadatos (o, si no lo hay, con el
+    hash del contenido). Así un bloque dañado en disco se descubre antes
+    de que un cliente lo pida.
+
+    - Lee como mucho 'rate' bytes/s para no competir con las
+      transferencias del nodo, y repite la pasada cada 'interval' segundos.
+    - Un bloque dañado se reemplaza por una copia sana de otra réplica
+      (según los metadatos); si no hay ninguna, solo se informa.
+    - 'on_repaired(nombre)' avisa de cada bloque reescrito, por ejemplo
+      para que el servidor lo quite de su caché.
+    """
+    def __init__(self, metadata_manager, dfs_client, rate=SCRUB_RATE_MB * 1024 * 1024,
+                 interval=SCRUB_INTERVAL, on_log=None, on_repaired=None):
+        self.metadata_manager = metadata_manager
+        self.dfs_client = dfs_client
+        self.rate = rate
+        self.interval = interval
+        self.on_log = on_log or print
+        self.on_repaired = on_repaired or (lambda nombre_bloque: None)
+
+        self.stats = {"checked": 0, "bytes": 0, "corrupt": 0, "repaired": 0}
+        self._stop = threading.Event()
+        self._thread = None
+        self._inicio = 0.0
+        self._leidos = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._scrub_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _scrub_loop(self):
+        # La primera pasada espera un intervalo: al arrancar el nodo hay
+        # trabajo más urgente (sincronizar metadatos, atender clientes)
+        while not self._stop.wait(self.interval):
+            try:
+                self.scrub_once()
+            except Exception as e:
+                # Un error en una pasada (un archivo que desaparece a mitad,
+                # un disco que falla) no debe parar las siguientes
+                self.on_log(f"Error en la verificación de bloques: {e}")
+
+    # --- 1. Pasada de verificación ---
+
+    def scrub_once(self):
+        """Verifica todos los bloques locales. Devuelve los nombres de los dañados."""
+        danados = []
+        self._inicio = time.monotonic()
+        self._leidos = 0
+        for nombre_bloque in self._bloques_locales():
+            ruta = self.metadata_manager.get_local_storage_path(nombre_bloque)
+            data = self._leer(ruta)
+            if self._stop.is_set():
+                break
+            if data is None:
+                continue
+            self.stats["checked"] += 1
+            self.stats["bytes"] += len(data)
+            if bloque_integro(nombre_bloque, data, self.metadata_manager.get_block_checksum(nombre_bloque)):
+                continue
+            self.stats["corrupt"] += 1
+            danados.append(nombre_bloque)
+            self.on_log(f"Bloque dañado en disco: {nombre_bloque}")
+            if self._reparar(nombre_bloque, ruta):
+                self.stats["repaired"] += 1
+        return danados
+
+    def _bloques_locales(self):
+        with os.scandir(self.metadata_manager.storage_dir) as entradas:
+            return [e.name for e in entradas
+                    if e.is_file() and not e.name.startswith('.') and not e.name.endswith('.part')]
+
+    def _leer(self, ruta, trozo=1024 * 1024):
+        """Lee 'ruta' a trozos sin superar 'rate' bytes/s de media en la pasada."""
+        partes = []
+        try:
+            with open(ruta, 'rb') as f:
+                while True:
+                    data = f.read(trozo)
+                    if not data:
+                        break
+                    partes.append(data)
+                    self._leidos += len(data)
+                    espera = self._inicio + self._leidos / self.rate - time.monotonic()
+                    if espera > 0 and self._stop.wait(espera):
+                        return None
+        except OSError:
+            # Borrado mientras tanto
+            return None
+        return b''.join(partes)
+
+    # --- 2. Reparación ---
+
+    def _reparar(self, nombre_bloque, ruta):
+        """Reemplaza el bloque local por una copia sana de otra réplica."""
+        crc = self.metadata_manager.get_block_checksum(nombre_bloque)
+        for addr in self.metadata_manager.get_block_replicas(nombre_bloque):
+            if tuple(addr) == self.metadata_manager.host_addr:
+                continue
+            # Directo a la red: la caché del cliente leería la copia local dañada
+            future = self.dfs_client.request_block_async(addr, nombre_bloque)
+            try:
+                respuesta = future.result(self.dfs_client.timeout)
+            except Exception:
+                # Sin cancelarla, una respuesta que llegue tarde seguiría
+                # ocupando la conexión con ese nodo
+                self.dfs_client.cancel(future)
+                continue
+            if respuesta.status != STATUS_OK or not bloque_integro(nombre_bloque, respuesta.body, crc):
+                continue
+            # Nombre con '.' delante: el servidor no lo toma por un bloque
+            temporal = os.path.join(os.path.dirname(ruta), f".{nombre_bloque}.scrub")
+            with open(temporal, 'wb') as f:
+                f.write(respuesta.body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+            self.on_repaired(nombre_bloque)
+            self.on_log(f"Bloque {nombre_bloque} reparado con la copia de {addr[0]}:{addr[1]}")
+            return True
+        self.on_log(f"Bloque {nombre_bloque} sin ninguna copia sana disponible")
+        return False
@@ -0,0 +1,883 @@
+# Server.py
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from Cache import HotBlockCache
+from Config import (SERVER_BACKLOG, SERVER_MAX_CONCURRENT, SERVER_MAX_CONNECTIONS, SERVER_PEER_TIMEOUT,
+                    SERVER_CACHE_MB, SERVER_READAHEAD_BLOCKS, LOCAL_STORAGE_CAPACITY_MB)
+from Protocol import (OP_UPLOAD_BLOCK, OP_DOWNLOAD_BLOCK, OP_DELETE_BLOCK, OP_PING,
+                      OP_HAVE_BLOCKS, OP_METADATA_DELTA, OP_METADATA_PULL, OP_HEARTBEAT, OP_STATS,
+                      OP_DELETE_BLOCKS, OP_UPLOAD_BLOCKS, OP_STAT_BLOCKS, STATUS_NAMES,
+                      OPCODE_NAMES, HEADER_SIZE, CHUNK_SIZE, FLAG_RESPONSE, STATUS_OK,
+                      STATUS_NOT_FOUND, STATUS_ERROR, STATUS_BAD_REQUEST, STATUS_NO_SPACE, STATUS_CORRUPT,
+                      Message, ProtocolError,
+                      build_response, decode_args, decode_header, encode_args, encode_header)
+from Metrics import Metrics
+from Utils import crc_bloque
+
+# Petición recibida por el servidor. 'body_len' es la parte del cuerpo que
+# sigue en el socket: los comandos de STREAMING_OPCODES la leen ellos mismos
+# (directo a disco) en lugar de recibirla ya cargada en 'body'.
+Request = namedtuple('Request', Message._fields + ('body_len',))
+
+STREAMING_OPCODES = {OP_UPLOAD_BLOCK, OP_UPLOAD_BLOCKS}
+
+# --- Servidor del Nodo (asyncio, sin dependencias de la GUI) ---
+
+class NodeServer:
+    """
+    Servidor de un nodo basado en asyncio. Un único hilo atiende todas las
+    conexiones, así que miles de transferencias simultáneas no crean miles
+    de hilos.
+
+    - 'max_concurrent' limita cuántas peticiones se procesan a la vez. Con
+      el límite alcanzado el servidor deja de leer de los sockets y TCP
+      frena a los clientes (backpressure).
+    - 'max_connections' limita las conexiones abiertas; al llegar a él se
+      deja de aceptar y las nuevas esperan en el backlog.
+
+    - 'capacity' son los bytes que puede ocupar el almacenamiento local.
+      Un UPLOAD_BLOCK que no cabe se rechaza con STATUS_NO_SPACE.
+
+    - 'cache_bytes' es el tamaño de la caché de bloques calientes (ver
+      Cache.HotBlockCache). Al servir un bloque se leen por adelantado los
+      'readahead' siguientes del mismo archivo que guarde este nodo.
+
+    - 'metrics' (un Metrics.Metrics, compartido con el cliente del nodo)
+      recibe bytes recibidos y enviados, la duración de cada comando y el
+      estado de la caché; STATS lo devuelve entero.
+
+    La GUI no es necesaria: los eventos se notifican con los callbacks
+    'on_log' y 'on_metadata_changed' (ver QtAdapter.py para las señales Qt).
+    """
+    def __init__(self, host, port, metadata_manager, max_concurrent=SERVER_MAX_CONCURRENT,
+                 max_connections=SERVER_MAX_CONNECTIONS, backlog=SERVER_BACKLOG,
+                 capacity=LOCAL_STORAGE_CAPACITY_MB * 1024 * 1024,
+                 cache_bytes=SERVER_CACHE_MB * 1024 * 1024, readahead=SERVER_READAHEAD_BLOCKS,
+                 metrics=None, on_log=None, on_metadata_changed=None):
+        self.host = host
+        self.port = port
+        self.metadata_manager = metadata_manager
+        self.max_concurrent = max_concurrent
+        self.max_connections = max_connections
+        self.backlog = backlog
+        self.capacity = capacity
+        self.block_cache = HotBlockCache(cache_bytes)
+        self.readahead = readahead
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.on_log = on_log or print
+        self.on_metadata_changed = on_metadata_changed or (lambda: None)
+
+        self.handlers = {
+            OP_UPLOAD_BLOCK: self.handle_upload_block,
+            OP_DOWNLOAD_BLOCK: self.handle_download_block,
+            OP_DELETE_BLOCK: self.handle_delete_block,
+            OP_PING: self.handle_ping,
+            OP_HAVE_BLOCKS: self.handle_have_blocks,
+            OP_METADATA_DELTA: self.handle_metadata_delta,
+            OP_METADATA_PULL: self.handle_metadata_pull,
+            OP_HEARTBEAT: self.handle_heartbeat,
+            OP_STATS: self.handle_stats,
+            OP_DELETE_BLOCKS: self.handle_delete_blocks,
+            OP_UPLOAD_BLOCKS: self.handle_upload_blocks,
+            OP_STAT_BLOCKS: self.handle_stat_blocks,
+        }
+
+        # Estado que se informa en HEARTBEAT
+        self.used_bytes = 0
+        self.reserved_bytes = 0
+        self.in_flight = 0
+        self.bytes_transferred = 0
+
+        self.loop = None
+        self.ready = threading.Event()
+        self._accept_task = None
+        self._aceptando = False
+        self._stop_requested = False
+        self._connections = set()
+        self._prefetches = set()
+        # Conexiones libres hacia otros nodos (reenvío en cadena, etc.)
+        self._peer_sockets = {}
+        # Conexión -> bytes del cuerpo en streaming que aún siguen en el socket
+        self._sin_leer = {}
+
+        # El resto de medidas se evalúan solo al pedir STATS
+        self.metrics.gauge("server_in_flight", lambda: self.in_flight)
+        self.metrics.gauge("server_connections", lambda: len(self._connections))
+        self.metrics.gauge("server_used_bytes", lambda: self.used_bytes)
+        self.metrics.gauge("server_reserved_bytes", lambda: self.reserved_bytes)
+        self.metrics.gauge("server_capacity_bytes", lambda: self.capacity)
+        for clave in ("hits", "misses", "coalesced", "blocks", "bytes"):
+            self.metrics.gauge(f"server_cache_{clave}", lambda clave=clave: self.block_cache.stats()[clave])
+
+    def log(self, message):
+        self.on_log(message)
+
+    # --- 1. Ciclo de vida ---
+
+    def serve_forever(self):
+        """Bloquea el hilo actual hasta que se llame a stop()."""
+        asyncio.run(self._serve())
+
+    def stop(self):
+        """Puede llamarse desde cualquier hilo, y más de una vez."""
+        self._stop_requested = True
+        if self.loop is not None and self._accept_task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._cancelar_aceptacion)
+
+    def _cancelar_aceptacion(self):
+        # Solo mientras se aceptan conexiones: si el bucle ya salió (vio
+        # _stop_requested), la cancelación interrumpiría el cierre de las
+        # conexiones abiertas
+        if self._aceptando:
+            self._accept_task.cancel()
+
+    def invalidate_block(self, nombre_bloque):
+        """Quita un bloque de la caché de bloques calientes. Puede llamarse desde cualquier hilo."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.block_cache.invalidate, nombre_bloque)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.request_slots = asyncio.Semaphore(self.max_concurrent)
+        self.connection_slots = asyncio.Semaphore(self.max_connections)
+
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server_socket.bind((self.host, self.port))
+            server_socket.listen(self.backlog)
+            server_socket.setblocking(False)
+            self.log(f"Servidor escuchando en {self.host}:{self.port}")
+        except socket.error as e:
+            self.log(f"Error al iniciar servidor: {e}")
+            server_socket.close()
+            self.ready.set()
+            return
+
+        self.used_bytes = self._medir_almacenamiento()
+        self._accept_task = asyncio.current_task()
+        self._aceptando = True
+        self.ready.set()
+        try:
+            while not self._stop_requested:
+                await self.connection_slots.acquire()
+                try:
+                    conn, addr = await self.loop.sock_accept(server_socket)
+                except BaseException:
+                    self.connection_slots.release()
+                    raise
+                conn.setblocking(False)
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                task = self.loop.create_task(self._handle_connection(conn, addr))
+                self._connections.add(task)
+                task.add_done_callback(self._connections.discard)
+        except asyncio.CancelledError:
+            pass
+        except socket.error as e:
+            self.log(f"Error de socket: {e}")
+        finally:
+            self._aceptando = False
+            server_socket.close()
+            for task in list(self._connections) + list(self._prefetches):
+                task.cancel()
+            await asyncio.gather(*self._connections, *self._prefetches, return_exceptions=True)
+            for libres in self._peer_sockets.values():
+                for sock in libres:
+                    sock.close()
+            self._peer_sockets.clear()
+            self.log("Servidor detenido.")
+
+    def _medir_almacenamiento(self):
+        """Bytes que ocupan los bloques ya guardados (sin temporales ni archivos internos)."""
+        total = 0
+        with os.scandir(self.metadata_manager.storage_dir) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and _nombre_valido(entrada.name) \
+                        and not entrada.name.endswith('.part'):
+                    total += entrada.stat().st_size
+        return total
+
+    # --- 2. Lectura de mensajes ---
+
+    async def recv_exact(self, conn, n):
+        """
+        Lee exactamente 'n' bytes (sock_recv_into). Como en
+        Protocol.recv_exact, el buffer crece a medida que llegan los datos.
+        """
+        buffer = bytearray(min(n, CHUNK_SIZE))
+        recibidos = 0
+        while recibidos < n:
+            if recibidos == len(buffer):
+                buffer.extend(bytes(min(n, 2 * len(buffer)) - len(buffer)))
+            with memoryview(buffer) as view:
+                leidos = await self.loop.sock_recv_into(conn, view[recibidos:])
+            if leidos == 0:
+                raise ConnectionError(f"Conexión cerrada tras {recibidos} de {n} bytes")
+            recibidos += leidos
+        return buffer
+
+    async def _read_header(self, conn):
+        first = await self.loop.sock_recv(conn, HEADER_SIZE)
+        if not first:
+            return None
+        if len(first) < HEADER_SIZE:
+            first += await self.recv_exact(conn, HEADER_SIZE - len(first))
+        return decode_header(first)
+
+    async def read_message(self, sock):
+        """Lee un mensaje completo (usado para las respuestas de otros nodos)."""
+        header = await self._read_header(sock)
+        if header is None:
+            raise ConnectionError("El nodo cerró la conexión sin responder")
+        opcode, flags, status, request_id, args_len, body_len = header
+        args = decode_args(await self.recv_exact(sock, args_len)) if args_len else {}
+        body = await self.recv_exact(sock, body_len) if body_len else b''
+        return Message(opcode, flags, status, request_id, args, body)
+
+    async def _handle_connection(self, conn, addr):
+        try:
+            while True:
+                header = await self._read_header(conn)
+                if header is None:
+                    break
+                opcode, flags, status, request_id, args_len, body_len = header
+                self.metrics.inc("server_bytes_in_total", HEADER_SIZE + args_len + body_len)
+                # El cupo se toma antes de leer el cuerpo: así la memoria en
+                # uso queda acotada por 'max_concurrent' peticiones.
+                async with self.request_slots:
+                    args = decode_args(await self.recv_exact(conn, args_len)) if args_len else {}
+                    if opcode in STREAMING_OPCODES:
+                        peticion = Request(opcode, flags, status, request_id, args, b'', body_len)
+                        self._sin_leer[conn] = body_len
+                    else:
+                        body = await self.recv_exact(conn, body_len) if body_len else b''
+                        peticion = Request(opcode, flags, status, request_id, args, body, 0)
+                    await self.dispatch(conn, addr, peticion)
+        except ProtocolError as e:
+            self.log(f"Mensaje inválido de {addr}: {e}")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            self.log(f"Error manejando cliente {addr}: {e}")
+        finally:
+            self._sin_leer.pop(conn, None)
+            conn.close()
+            self.connection_slots.release()
+
+    async def send(self, conn, data):
+        await self.loop.sock_sendall(conn, data)
+        self.metrics.inc("server_bytes_out_total", len(data))
+
+    async def recv_to_file(self, conn, f, size, forward_sock=None):
+        """
+        Copia 'size' bytes del socket al archivo 'f' (None: se descartan)
+        a través de dos buffers reservados (sock_recv_into), sin acumular
+        el cuerpo en memoria. Cada trozo se escribe en el pool de hilos
+        mientras el siguiente llega al otro buffer: el disco no detiene el
+        bucle. Si se indica 'forward_sock', cada trozo se reenvía también al
+        siguiente nodo de la cadena mientras se recibe. Devuelve
+        (reenvío_ok, crc): reenvío_ok es False si el reenvío falló por el
+        camino (la copia local no se ve afectada) y crc es el CRC32 de lo
+        recibido, calculado por trozos sin volver a leer el archivo.
+        """
+        tamano_buffer = min(CHUNK_SIZE, size) or 1
+        buffers = [memoryview(bytearray(tamano_buffer)) for _ in range(2 if f is not None else 1)]
+        restantes = size
+        reenvio_ok = forward_sock is not None
+        crc = 0
+        escritura = None
+        try:
+            while restantes:
+                view = buffers[0]
+                leidos = await self.loop.sock_recv_into(conn, view[:min(restantes, tamano_buffer)])
+                if leidos == 0:
+                    raise ConnectionError(f"Conexión cerrada con {restantes} bytes pendientes")
+                restantes -= leidos
+                if conn in self._sin_leer:
+                    self._sin_leer[conn] -= leidos
+                trozo = view[:leidos]
+                if f is not None:
+                    # El buffer de la escritura anterior se reutiliza en la
+                    # siguiente lectura: hay que esperar a que termine
+                    if escritura is not None:
+                        await asyncio.shield(escritura)
+                    escritura = self.loop.run_in_executor(None, f.write, trozo)
+                    buffers.reverse()
+                crc = crc_bloque(trozo, crc)
+                if reenvio_ok:
+                    try:
+                        await self.loop.sock_sendall(forward_sock, trozo)
+                    except OSError:
+                        reenvio_ok = False
+            if escritura is not None:
+                await asyncio.shield(escritura)
+        finally:
+            # Si algo falló, el hilo no puede seguir escribiendo en un
+            # archivo que se va a cerrar
+            if escritura is not None and not escritura.done():
+                await asyncio.wait([escritura])
+        return reenvio_ok, crc
+
+    async def discard_body(self, conn, peticion):
+        """Consume del socket un cuerpo en streaming que no se va a usar."""
+        await self.discard(conn, peticion.body_len)
+
+    async def discard(self, conn, size):
+        """Consume 'size' bytes del socket sin guardarlos."""
+        if size:
+            await self.recv_to_file(conn, None, size)
+
+    async def _en_disco(self, funcion, *args):
+        """Ejecuta una operación de disco (bloqueante) en el pool de hilos del bucle."""
+        return await self.loop.run_in_executor(None, funcion, *args)
+
+    async def send_file(self, conn, peticion, ruta, size, offset=0):
+        """
+        Responde con 'size' bytes de 'ruta' desde 'offset'. El encabezado
+        anuncia el tamaño y el cuerpo sale con sendfile (copia en el kernel);
+        si la plataforma no lo permite, asyncio cae a un envío con buffer.
+        """
+        f = await self._en_disco(open, ruta, 'rb')
+        try:
+            await self.send(conn, encode_header(peticion.opcode, 0, size, peticion.request_id,
+                                                STATUS_OK, FLAG_RESPONSE))
+            await self.loop.sock_sendfile(conn, f, offset, size, fallback=True)
+        finally:
+            f.close()
+        self.metrics.inc("server_bytes_out_total", size)
+
+    async def send_view(self, conn, peticion, view):
+        """Responde con los bytes de 'view' (un bloque en caché) sin copiarlos."""
+        await self.send(conn, encode_header(peticion.opcode, 0, len(view), peticion.request_id,
+                                            STATUS_OK, FLAG_RESPONSE))
+        await self.send(conn, view)
+
+    async def dispatch(self, conn, addr, peticion):
+        """Ejecuta el comando de 'peticion' y envía su respuesta por 'conn'."""
+        handler = self.handlers.get(peticion.opcode)
+        if handler is None:
+            self.log(f"Opcode desconocido {peticion.opcode} desde {addr}")
+            await self.discard_body(conn, peticion)
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        op = OPCODE_NAMES[peticion.opcode]
+        inicio = time.perf_counter()
+        try:
+            await handler(conn, addr, peticion)
+        except OSError as e:
+            self.metrics.inc("server_errors_total", op=op)
+            self.log(f"Error en {op} desde {addr}: {e}")
+            # Un fallo a mitad de un cuerpo en streaming deja el resto en el
+            # socket: se descarta para que el siguiente encabezado se lea
+            # desde su principio.
+            await self.discard(conn, self._sin_leer.get(conn, 0))
+            await self.send(conn, build_response(peticion, STATUS_ERROR))
+        finally:
+            self._sin_leer.pop(conn, None)
+            self.metrics.observe("server_request_seconds", time.perf_counter() - inicio, op=op)
+
+    # --- 3. Conexiones hacia otros nodos ---
+
+    async def peer_connect(self, addr):
+        """Devuelve un socket no bloqueante conectado a 'addr' (reutiliza los libres)."""
+        addr = tuple(addr)
+        libres = self._peer_sockets.get(addr, [])
+        while libres:
+            sock = libres.pop()
+            if _socket_vivo(sock):
+                return sock
+            sock.close()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(self.loop.sock_connect(sock, addr), SERVER_PEER_TIMEOUT)
+        except BaseException:
+            sock.close()
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def peer_release(self, addr, sock):
+        """Devuelve al conjunto de libres un socket cuya última respuesta se leyó entera."""
+        libres = self._peer_sockets.setdefault(tuple(addr), [])
+        if len(libres) < 4:
+            libres.append(sock)
+        else:
+            sock.close()
+
+    async def _start_forward(self, peticion, nombre_bloque, cadena):
+        """
+        Abre la conexión con el siguiente nodo de la cadena y le envía el
+        encabezado de UPLOAD_BLOCK; el cuerpo se reenvía mientras llega.
+        Si un nodo no responde se salta y se prueba con el siguiente.
+        Devuelve (socket, nodo), o (None, None) si ninguno está disponible.
+        """
+        for i, siguiente in enumerate(cadena):
+            args_bytes = encode_args(dict(peticion.args, forward=cadena[i + 1:]))
+            try:
+                sock = await self.peer_connect(siguiente)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.log(f"No se pudo reenviar {nombre_bloque} a {siguiente}: {e}")
+                continue
+            try:
+                await self.send(sock, encode_header(OP_UPLOAD_BLOCK, len(args_bytes),
+                                                    peticion.body_len) + args_bytes)
+            except OSError as e:
+                sock.close()
+                self.log(f"No se pudo reenviar {nombre_bloque} a {siguiente}: {e}")
+                continue
+            return sock, siguiente
+        return None, None
+
+    async def _finish_forward(self, sock, siguiente, cadena, nombre_bloque, reenvio_ok):
+        """
+        Espera la respuesta del siguiente nodo y devuelve los nodos que
+        guardaron el bloque. Cada nodo de la cadena espera al suyo hasta
+        SERVER_PEER_TIMEOUT, así que el plazo es ese por cada nodo que queda
+        desde 'siguiente': si el último se atasca, su anterior deja de
+        esperarlo antes de que este nodo se rinda y las copias que sí se
+        guardaron llegan en la respuesta.
+        """
+        if not reenvio_ok:
+            sock.close()
+            self.log(f"Reenvío de {nombre_bloque} a {siguiente} interrumpido")
+            return []
+        plazo = SERVER_PEER_TIMEOUT * (len(cadena) - cadena.index(siguiente))
+        try:
+            respuesta = await asyncio.wait_for(self.read_message(sock), plazo)
+        except (OSError, ProtocolError, asyncio.TimeoutError) as e:
+            sock.close()
+            self.log(f"Sin respuesta de {siguiente} al reenviar {nombre_bloque}: {e}")
+            return []
+        self.peer_release(siguiente, sock)
+        if respuesta.status != STATUS_OK:
+            return []
+        return respuesta.args.get("stored", [])
+
+    def _block_path(self, peticion):
+        nombre_bloque = peticion.args.get("name")
+        if not _nombre_valido(nombre_bloque):
+            return None, None
+        return nombre_bloque, self.metadata_manager.get_local_storage_path(nombre_bloque)
+
+    # --- 4. Comandos ---
+
+    async def handle_upload_block(self, conn, addr, peticion):
+        nombre_bloque, ruta_guardado = self._block_path(peticion)
+        if ruta_guardado is None:
+            await self.discard_body(conn, peticion)
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        necesario = await self._espacio_necesario(ruta_guardado, peticion.body_len)
+        if necesario is None:
+            self.log(f"Sin espacio para {nombre_bloque} ({peticion.body_len} bytes) de {addr}")
+            await self.discard_body(conn, peticion)
+            self.metrics.inc("server_rejected_total", reason="no_space")
+            await self.send(conn, build_response(peticion, STATUS_NO_SPACE))
+            return
+        self.reserved_bytes += necesario
+        self.in_flight += 1
+        try:
+            await self._recibir_bloque(conn, addr, peticion, nombre_bloque, ruta_guardado)
+        finally:
+            self.reserved_bytes -= necesario
+            self.in_flight -= 1
+
+    async def _espacio_necesario(self, ruta_guardado, size):
+        """
+        Bytes que hay que reservar para guardar 'size' bytes en
+        'ruta_guardado', o None si no caben. Si el bloque ya existe se
+        sobrescribe: solo cuenta la diferencia.
+        """
+        previo = await self._en_disco(_tamano, ruta_guardado) or 0
+        necesario = max(0, size - previo)
+        if self.used_bytes + self.reserved_bytes + necesario > self.capacity:
+            return None
+        return necesario
+
+    async def _escribir_bloque(self, conn, nombre_bloque, ruta_guardado, size, crc_esperado,
+                               forward_sock=None):
+        """
+        Recibe 'size' bytes de 'conn' (reenviándolos a 'forward_sock', si
+        hay) y los guarda como 'ruta_guardado' si su CRC32 coincide con
+        'crc_esperado' (o no se indica). Devuelve (guardado, reenvío_ok).
+        """
+        # Se escribe en un temporal y se renombra al final: un bloque
+        # a medio recibir nunca queda visible con su nombre definitivo.
+        ruta_temporal = f"{ruta_guardado}.{id(conn)}.part"
+        f = await self._en_disco(open, ruta_temporal, 'wb')
+        try:
+            try:
+                reenvio_ok, crc = await self.recv_to_file(conn, f, size, forward_sock)
+            finally:
+                await self._en_disco(f.close)
+            self.bytes_transferred += size
+            if crc_esperado is not None and crc != crc_esperado:
+                return False, reenvio_ok
+            # Otra subida del mismo bloque pudo terminar mientras tanto
+            anterior = await self._en_disco(_reemplazar, ruta_temporal, ruta_guardado)
+            self.block_cache.invalidate(nombre_bloque)
+            self.used_bytes += size - anterior
+            return True, reenvio_ok
+        finally:
+            await self._en_disco(_borrar, ruta_temporal)
+
+    async def _recibir_bloque(self, conn, addr, peticion, nombre_bloque, ruta_guardado):
+        # Replicación en cadena: 'forward' lista los nodos que deben recibir
+        # también el bloque. Se reenvía al primero mientras llegan los datos
+        # y él continúa la cadena con el resto.
+        cadena = [tuple(a) for a in peticion.args.get("forward", [])]
+        forward_sock, siguiente = None, None
+        if cadena:
+            forward_sock, siguiente = await self._start_forward(peticion, nombre_bloque, cadena)
+
+        try:
+            guardado, reenvio_ok = await self._escribir_bloque(conn, nombre_bloque, ruta_guardado,
+                                                               peticion.body_len, peticion.args.get("crc"),
+                                                               forward_sock)
+        except BaseException:
+            if forward_sock is not None:
+                forward_sock.close()
+            raise
+        if not guardado:
+            # Llegó dañado: no se guarda. El siguiente de la cadena recibió
+            # los mismos bytes y los rechaza por su cuenta; su respuesta ya
+            # no interesa.
+            if forward_sock is not None:
+                forward_sock.close()
+            self.metrics.inc("server_rejected_total", reason="crc")
+            self.log(f"Bloque {nombre_bloque} de {addr} con CRC incorrecto; descartado")
+            await self.send(conn, build_response(peticion, STATUS_CORRUPT))
+            return
+
+        if "file" in peticion.args:
+            try:
+                await self._en_disco(self.metadata_manager.registrar_bloque_recibido, nombre_bloque,
+                                     peticion.args, peticion.body_len)
+            except (KeyError, OSError) as e:
+                self.log(f"No se pudo anotar el bloque {nombre_bloque}: {e}")
+
+        guardado_en = [[self.host, self.port]]
+        if forward_sock is not None:
+            guardado_en += await self._finish_forward(forward_sock, siguiente, cadena, nombre_bloque,
+                                                      reenvio_ok)
+        await self.send(conn, build_response(peticion, args={"stored": guardado_en}))
+        self.log(f"Bloque recibido: {nombre_bloque} de {addr}")
+
+    async def handle_upload_blocks(self, conn, addr, peticion):
+        """
+        Varios bloques en una sola petición, para subir muchos pequeños sin
+        una ida y vuelta por cada uno. 'blocks' es [{name, size, crc, ...}]
+        (cada uno con los mismos campos que UPLOAD_BLOCK) y el cuerpo, sus
+        datos seguidos en ese orden. Cada bloque se guarda o se rechaza por
+        separado; no hay reenvío en cadena (el cliente envía un lote a cada
+        réplica). Responde {"stored": [nombres], "failed": {nombre: estado}}.
+        Un fallo de disco en un bloque descarta lo que quede de él en el
+        socket y se pasa al siguiente: el lote se lee siempre entero.
+        """
+        bloques = peticion.args.get("blocks")
+        if not (isinstance(bloques, list)
+                and all(isinstance(b, dict) and _nombre_valido(b.get("name"))
+                        and isinstance(b.get("size"), int) and b["size"] >= 0 for b in bloques)
+                and sum(b["size"] for b in bloques) == peticion.body_len):
+            await self.discard_body(conn, peticion)
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        guardados, fallidos = [], {}
+        self.in_flight += 1
+        try:
+            for bloque in bloques:
+                nombre_bloque, size = bloque["name"], bloque["size"]
+                # Bytes del lote que deben quedar en el socket tras este bloque
+                despues = self._sin_leer[conn] - size
+                try:
+                    estado = await self._guardar_de_lote(conn, bloque)
+                except ConnectionError:
+                    raise
+                except OSError as e:
+                    self.metrics.inc("server_errors_total", op="UPLOAD_BLOCKS")
+                    self.log(f"Error guardando {nombre_bloque} de {addr}: {e}")
+                    await self.discard(conn, self._sin_leer[conn] - despues)
+                    estado = STATUS_ERROR
+                if estado == STATUS_OK:
+                    guardados.append(nombre_bloque)
+                else:
+                    fallidos[nombre_bloque] = STATUS_NAMES[estado]
+        finally:
+            self.in_flight -= 1
+        await self.send(conn, build_response(peticion, args={"stored": guardados, "failed": fallidos}))
+        self.log(f"Recibidos {len(guardados)} bloque(s) de {addr}"
+                 + (f"; {len(fallidos)} rechazados" if fallidos else ""))
+
+    async def _guardar_de_lote(self, conn, bloque):
+        """Recibe y guarda un bloque de UPLOAD_BLOCKS. Devuelve su estado."""
+        nombre_bloque, size = bloque["name"], bloque["size"]
+        ruta_guardado = self.metadata_manager.get_local_storage_path(nombre_bloque)
+        necesario = await self._espacio_necesario(ruta_guardado, size)
+        if necesario is None:
+            await self.discard(conn, size)
+            self.metrics.inc("server_rejected_total", reason="no_space")
+            return STATUS_NO_SPACE
+        self.reserved_bytes += necesario
+        try:
+            guardado, _ = await self._escribir_bloque(conn, nombre_bloque, ruta_guardado,
+                                                      size, bloque.get("crc"))
+        finally:
+            self.reserved_bytes -= necesario
+        if not guardado:
+            self.metrics.inc("server_rejected_total", reason="crc")
+            return STATUS_CORRUPT
+        if "file" in bloque:
+            try:
+                await self._en_disco(self.metadata_manager.registrar_bloque_recibido,
+                                     nombre_bloque, bloque, size)
+            except (KeyError, OSError) as e:
+                self.log(f"No se pudo anotar el bloque {nombre_bloque}: {e}")
+        return STATUS_OK
+
+    async def handle_download_block(self, conn, addr, peticion):
+        nombre_bloque, ruta_bloque = self._block_path(peticion)
+        if ruta_bloque is None:
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        total = await self._en_disco(_tamano, ruta_bloque)
+        if total is None:
+            self.log(f"Petición de bloque {nombre_bloque} no encontrado.")
+            await self.send(conn, build_response(peticion, STATUS_NOT_FOUND))
+            return
+        # Lectura parcial: 'offset' y 'length' (opcionales) delimitan el rango
+        offset = peticion.args.get("offset", 0)
+        length = peticion.args.get("length", total)
+        if not (isinstance(offset, int) and isinstance(length, int)
+                and 0 <= offset <= total and length >= 0):
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        size = min(length, total - offset)
+        self.in_flight += 1
+        try:
+            # Los bloques pequeños respecto a la caché se sirven desde memoria;
+            # uno enorme la vaciaría entera, así que va directo con sendfile.
+            # Lectura del disco y envío se miden por separado: así se ve si
+            # una descarga lenta es por el disco o por la red.
+            view = None
+            if total <= self.block_cache.budget // 8:
+                # "cache": ya en memoria o leyéndose para otra petición
+                origen = "cache" if nombre_bloque in self.block_cache else "disk"
+                inicio = time.perf_counter()
+                view = await self.block_cache.get(nombre_bloque, ruta_bloque)
+                self.metrics.observe("server_block_read_seconds", time.perf_counter() - inicio,
+                                     source=origen)
+            inicio = time.perf_counter()
+            if view is not None:
+                await self.send_view(conn, peticion, view[offset:offset + size])
+            else:
+                await self.send_file(conn, peticion, ruta_bloque, size, offset)
+            self.metrics.observe("server_block_send_seconds", time.perf_counter() - inicio,
+                                 path="memory" if view is not None else "sendfile")
+        finally:
+            self.in_flight -= 1
+        self.bytes_transferred += size
+        self.log(f"Enviando bloque: {nombre_bloque} a {addr}")
+        self._leer_por_adelantado(nombre_bloque)
+
+    def _leer_por_adelantado(self, nombre_bloque):
+        """Carga en la caché los bloques que siguen a 'nombre_bloque' en su archivo."""
+        if not self.readahead or not self.block_cache.budget:
+            return
+        siguientes = self.metadata_manager.get_bloques_siguientes(
+            nombre_bloque, self.readahead, self.metadata_manager.host_addr)
+        for siguiente in siguientes:
+            if siguiente in self.block_cache or not _nombre_valido(siguiente):
+                continue
+            ruta = self.metadata_manager.get_local_storage_path(siguiente)
+            task = self.loop.create_task(self._prefetch(siguiente, ruta))
+            self._prefetches.add(task)
+            task.add_done_callback(self._prefetches.discard)
+
+    async def _prefetch(self, nombre_bloque, ruta):
+        try:
+            await self.block_cache.prefetch(nombre_bloque, ruta)
+        except OSError as e:
+            self.log(f"No se pudo leer por adelantado {nombre_bloque}: {e}")
+
+    async def handle_metadata_delta(self, conn, addr, peticion):
+        """
+        Aplica las operaciones (o la instantánea) que envía otro nodo y
+        responde con el vector de versiones resultante, para que el emisor
+        sepa si aún nos falta algo. apply_delta espera al fsync del WAL (o
+        escribe una instantánea), así que va al pool de hilos: mientras
+        tanto el bucle sigue sirviendo bloques.
+        """
+        try:
+            cambio, hueco = await self._en_disco(self._aplicar_delta, peticion.body)
+        except (UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+            self.log(f"Delta de metadatos inválido desde {addr}: {e}")
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        await self.send(conn, build_response(peticion, args={
+            "vector": self.metadata_manager.get_vector(), "gap": hueco}))
+        if cambio:
+            self.log(f"Metadatos sincronizados desde {addr}")
+            self.on_metadata_changed()
+
+    def _aplicar_delta(self, body):
+        return self.metadata_manager.apply_delta(json.loads(bytes(body).decode('utf-8')))
+
+    async def handle_metadata_pull(self, conn, addr, peticion):
+        """Devuelve lo que le falta a quien pide, según el vector que envía."""
+        vector = peticion.args.get("vector")
+        if not isinstance(vector, dict):
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        # Puede ser la tabla completa: se serializa fuera del bucle
+        body = await self._en_disco(self._delta_para, vector)
+        await self.send(conn, build_response(peticion, body=body))
+
+    def _delta_para(self, vector):
+        return json.dumps(self.metadata_manager.delta_para(vector)).encode('utf-8')
+
+    async def handle_delete_block(self, conn, addr, peticion):
+        nombre_bloque, ruta_bloque = self._block_path(peticion)
+        if ruta_bloque is None:
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        size = await self._en_disco(_borrar, ruta_bloque)
+        if size is not None:
+            self.block_cache.invalidate(nombre_bloque)
+            self.used_bytes -= size
+            await self.send(conn, build_response(peticion))
+            self.log(f"Bloque eliminado localmente: {nombre_bloque}")
+        else:
+            await self.send(conn, build_response(peticion, STATUS_NOT_FOUND))
+
+    async def handle_delete_blocks(self, conn, addr, peticion):
+        """
+        Borra los bloques de 'names'. Responde {"deleted": [...], "missing":
+        [...]}: los que no estaban no son un error (ya no ocupan espacio).
+        """
+        nombres = peticion.args.get("names")
+        if not isinstance(nombres, list) or not all(_nombre_valido(nombre) for nombre in nombres):
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        rutas = [self.metadata_manager.get_local_storage_path(nombre) for nombre in nombres]
+        tamanos = await self._en_disco(lambda: [_borrar(ruta) for ruta in rutas])
+        borrados, ausentes = [], []
+        for nombre_bloque, size in zip(nombres, tamanos):
+            if size is None:
+                ausentes.append(nombre_bloque)
+                continue
+            self.block_cache.invalidate(nombre_bloque)
+            self.used_bytes -= size
+            borrados.append(nombre_bloque)
+        await self.send(conn, build_response(peticion, args={"deleted": borrados, "missing": ausentes}))
+        self.log(f"Bloques eliminados localmente: {len(borrados)} (pedidos por {addr})")
+
+    async def handle_ping(self, conn, addr, peticion):
+        await self.send(conn, build_response(peticion))
+
+    async def handle_heartbeat(self, conn, addr, peticion):
+        """
+        Estado del nodo para decidir dónde colocar bloques: capacidad,
+        espacio usado y reservado por subidas en curso, transferencias
+        activas y bytes transferidos (el cliente calcula el ritmo a partir
+        de dos respuestas consecutivas con 'time').
+        """
+        await self.send(conn, build_response(peticion, args={
+            "capacity": self.capacity, "used": self.used_bytes,
+            "reserved": self.reserved_bytes, "in_flight": self.in_flight,
+            "bytes": self.bytes_transferred, "time": time.monotonic()}))
+
+    async def handle_stats(self, conn, addr, peticion):
+        """Todas las métricas del nodo (ver Metrics.Metrics.snapshot)."""
+        await self.send(conn, build_response(peticion, args=self.metrics.snapshot()))
+
+    async def handle_have_blocks(self, conn, addr, peticion):
+        """Responde cuáles de los bloques de 'names' están guardados en este nodo."""
+        nombres = peticion.args.get("names")
+        if not isinstance(nombres, list):
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        presentes = await self._en_disco(self._presentes, nombres)
+        await self.send(conn, build_response(peticion, args={"have": presentes}))
+
+    def _presentes(self, nombres):
+        """Los bloques de 'nombres' que están en el disco (se ejecuta en el pool de hilos)."""
+        return [nombre for nombre in nombres
+                if _nombre_valido(nombre) and os.path.exists(self.metadata_manager.get_local_storage_path(nombre))]
+
+    async def handle_stat_blocks(self, conn, addr, peticion):
+        """
+        Como HAVE_BLOCKS, pero con los bytes guardados de cada bloque
+        presente: {"sizes": {nombre: tamaño}}. El cliente puede así tomar
+        por ausente un bloque truncado.
+        """
+        nombres = peticion.args.get("names")
+        if not isinstance(nombres, list):
+            await self.send(conn, build_response(peticion, STATUS_BAD_REQUEST))
+            return
+        tamanos = await self._en_disco(self._tamanos, nombres)
+        await self.send(conn, build_response(peticion, args={"sizes": tamanos}))
+
+    def _tamanos(self, nombres):
+        """{nombre: bytes} de los bloques de 'nombres' que están en el disco (en el pool de hilos)."""
+        tamanos = {}
+        for nombre in nombres:
+            if _nombre_valido(nombre):
+                size = _tamano(self.metadata_manager.get_local_storage_path(nombre))
+                if size is not None:
+                    tamanos[nombre] = size
+        return tamanos
+
+
+def _nombre_valido(nombre_bloque):
+    """
+    Un nombre de bloque no puede salir del directorio de almacenamiento ni
+    empezar por '.' (reservado para archivos internos del nodo).
+    """
+    return (isinstance(nombre_bloque, str) and bool(nombre_bloque)
+            and os.path.basename(nombre_bloque) == nombre_bloque
+            and not nombre_bloque.startswith('.'))
+
+
+def _tamano(ruta):
+    """Tamaño de 'ruta' en bytes, o None si no existe."""
+    try:
+        return os.path.getsize(ruta)
+    except FileNotFoundError:
+        return None
+
+
+def _borrar(ruta):
+    """Borra 'ruta' si existe. Devuelve los bytes que ocupaba, o None si no existía."""
+    try:
+        size = os.path.getsize(ruta)
+        os.remove(ruta)
+        return size
+    except FileNotFoundError:
+        return None
+
+
+def _reemplazar(ruta_temporal, ruta):
+    """Renombra 'ruta_temporal' como 'ruta'. Devuelve el tamaño del archivo reemplazado (0 si no había)."""
+    anterior = _tamano(ruta) or 0
+    os.replace(ruta_temporal, ruta)
+    return anterior
+
+
+def _socket_vivo(sock):
+    """Un socket libre no debería tener nada que leer: si lo tiene, o está cerrado, no sirve."""
+    try:
+        sock.recv(1, socket.MSG_PEEK)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
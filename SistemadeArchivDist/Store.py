@@ -0,0 +1,198 @@
+# Store.py
+
+import json
+import os
+import threading
+
+from Config import METADATA_FSYNC_INTERVAL
+
+# --- Almacenamiento Persistente de Metadatos ---
+
+class MetadataStore:
+    """
+    Persistencia de la tabla de metadatos de un nodo:
+
+    - metadata.wal: registro de solo-añadir, una operación JSON por línea.
+      Las escrituras se agrupan y un hilo hace un único fsync cada
+      'fsync_interval' segundos para todas las que estén pendientes
+      (group commit); quien necesite durabilidad espera con wait_durable().
+    - metadata.snapshot.json: instantánea compacta del estado. Al escribirla
+      el WAL se vacía, así que arrancar solo cuesta leer la instantánea y
+      las operaciones posteriores a ella.
+    - 'blocks_path': a qué archivo y offsets corresponde cada bloque recibido
+      por este nodo. Vive junto a los bloques y no con el resto, porque se
+      usa justamente para reconstruir la tabla si se pierden los metadatos.
+      Solo crece al añadir; compact_blocks quita lo que ya no sirve.
+    """
+    def __init__(self, directorio, blocks_path, fsync_interval=METADATA_FSYNC_INTERVAL):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.wal_path = os.path.join(directorio, "metadata.wal")
+        self.snapshot_path = os.path.join(directorio, "metadata.snapshot.json")
+        self.blocks_path = blocks_path
+        self.fsync_interval = fsync_interval
+
+        self.cond = threading.Condition()
+        self.wal = open(self.wal_path, 'ab')
+        # Se abre al anotar el primer bloque y queda abierto
+        self.blocks = None
+        self.registros_wal = 0
+        self._escritos = 0
+        self._durables = 0
+        self._cerrado = False
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def existe(self):
+        """True si hay metadatos guardados de una ejecución anterior."""
+        return os.path.exists(self.snapshot_path) or os.path.getsize(self.wal_path) > 0
+
+    def load(self):
+        """
+        Devuelve (instantánea o None, [operaciones del WAL posteriores]).
+        Una última línea cortada (caída a mitad de escritura) se ignora.
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = json.loads(f.read().decode('utf-8'))
+
+        ops = []
+        with open(self.wal_path, 'rb') as f:
+            for linea in f:
+                try:
+                    ops.append(json.loads(linea.decode('utf-8')))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    break
+        self.registros_wal = len(ops)
+        return snapshot, ops
+
+    # --- 1. WAL con fsync agrupado ---
+
+    def append(self, op):
+        """Escribe una operación en el WAL y devuelve su número de registro."""
+        linea = json.dumps(op, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self.cond:
+            self.wal.write(linea)
+            self._escritos += 1
+            self.registros_wal += 1
+            self.cond.notify_all()
+            return self._escritos
+
+    def wait_durable(self, registro):
+        """Bloquea hasta que el registro 'registro' (y los anteriores) estén en disco."""
+        with self.cond:
+            while self._durables < registro and not self._cerrado:
+                self.cond.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while self._durables == self._escritos and not self._cerrado:
+                    self.cond.wait()
+                if self._cerrado:
+                    return
+                # Se deja acumular más escrituras para cubrirlas con un solo fsync
+                self.cond.wait(self.fsync_interval)
+                objetivo = self._escritos
+                self.wal.flush()
+                fd = self.wal.fileno()
+            os.fsync(fd)
+            with self.cond:
+                self._durables = max(self._durables, objetivo)
+                self.cond.notify_all()
+
+    # --- 2. Instantáneas ---
+
+    def write_snapshot(self, estado):
+        """
+        Guarda 'estado' de forma atómica (temporal + fsync + rename) y vacía
+        el WAL. Quien llama debe impedir que se apliquen operaciones nuevas
+        mientras tanto, para que ninguna quede fuera de ambos.
+        """
+        temporal = self.snapshot_path + ".tmp"
+        with open(temporal, 'wb') as f:
+            f.write(json.dumps(estado, separators=(',', ':')).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.snapshot_path)
+
+        with self.cond:
+            self.wal.flush()
+            self.wal.truncate(0)
+            self.wal.seek(0)
+            os.fsync(self.wal.fileno())
+            self.registros_wal = 0
+            self._durables = self._escritos
+            self.cond.notify_all()
+
+    # --- 3. Registro de bloques locales ---
+
+    def record_block(self, nombre_bloque, archivo, file_size, offsets, size, stored=None, crc=None):
+        """
+        Anota en qué offsets de qué archivo va un bloque recibido (sin fsync:
+        es solo una ayuda). 'stored' son los bytes en disco si difieren de
+        'size' (bloque comprimido) y 'crc' su suma de verificación.
+        """
+        registro = {"block": nombre_bloque, "file": archivo, "file_size": file_size,
+                    "offsets": offsets, "size": size}
+        if stored is not None and stored != size:
+            registro["stored"] = stored
+        if crc is not None:
+            registro["crc"] = crc
+        linea = json.dumps(registro, separators=(',', ':'))
+        with self.cond:
+            if self.blocks is None:
+                # Con búfer de línea cada registro llega al sistema al escribirlo
+                self.blocks = open(self.blocks_path, 'a', encoding='utf-8', buffering=1)
+            self.blocks.write(linea + "\n")
+
+    def compact_blocks(self, conservar):
+        """
+        Reescribe el registro de bloques con un solo registro por par
+        (bloque, archivo), el último, y solo los que cumplen
+        conservar(registro). Si no sobra ninguno, no se toca el archivo.
+        """
+        with self.cond:
+            registros = self.block_records()
+            vigentes = {}
+            for registro in registros:
+                # Cada par queda en la posición de su último registro
+                clave = (registro["block"], registro["file"])
+                vigentes.pop(clave, None)
+                vigentes[clave] = registro
+            conservados = [registro for registro in vigentes.values() if conservar(registro)]
+            if len(conservados) == len(registros):
+                return
+            temporal = self.blocks_path + ".tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                for registro in conservados:
+                    f.write(json.dumps(registro, separators=(',', ':')) + "\n")
+            if self.blocks is not None:
+                self.blocks.close()
+                self.blocks = None
+            os.replace(temporal, self.blocks_path)
+
+    def block_records(self):
+        if not os.path.exists(self.blocks_path):
+            return []
+        registros = []
+        with open(self.blocks_path, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registros.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    continue
+        return registros
+
+    def close(self):
+        with self.cond:
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+            self._durables = self._escritos
+            self._cerrado = True
+            self.cond.notify_all()
+            if self.blocks is not None:
+                self.blocks.close()
+        self._flusher.join()
+        self.wal.close()
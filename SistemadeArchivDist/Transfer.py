@@ -0,0 +1,807 @@
+# Transfer.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from contextlib import ExitStack
+
+from Compression import (codec_de_bloque, comprimir, decodificar_bloque, elegir_codec, muestrear,
+                         nombre_almacenado)
+from Config import (BLOCK_SIZE, UPLOAD_MAX_IN_FLIGHT, DOWNLOAD_CONCURRENCY, REPLICATION_FACTOR,
+                    REPLICATION_MODE, COMPRESSION_CODEC, CHUNKING, BATCH_MAX_BLOCKS, UPLOAD_BATCH_BYTES,
+                    UPLOAD_BATCH_BLOCK_MAX)
+from Erasure import StripeIndex
+from Protocol import STATUS_OK, FileRange
+from Utils import (calcular_rangos_bloques, calcular_hashes_bloques, desempaquetar_bloque,
+                   replicas_de_bloque, crear_entrada_bloque, crc_bloque, bloque_integro, hash_bloque,
+                   es_paridad)
+
+# --- 1. Subida en Streaming ---
+
+class StreamingUploader:
+    """
+    Sube un archivo leyendo cada bloque directamente de su offset en el
+    archivo original y enviándolo con sendfile a los nodos asignados.
+    No crea archivos temporales ni carga bloques en memoria; como mucho
+    hay 'max_in_flight' bloques transfiriéndose a la vez. El archivo se
+    parte en bloques de 'block_size' bytes; la descarga no necesita
+    saberlo, porque cada entrada de la tabla guarda su offset y tamaño.
+
+    Con 'chunking' = "cdc" los cortes se deciden por el contenido (ver
+    Chunking.py), con bloques de 'block_size' de media, entre la cuarta
+    parte y el cuádruple. Una versión editada de un archivo comparte
+    entonces casi todos sus bloques con la anterior, y esos no se envían.
+
+    Cada bloque se guarda en 'replication_factor' nodos, según 'replication_mode':
+    - "chain": el cliente envía el bloque una sola vez al primario, que lo
+      reenvía al secundario mientras lo recibe (y así sucesivamente). El
+      ancho de banda de subida del cliente se gasta una vez por bloque.
+    - "fanout": el cliente envía a todos los nodos a la vez.
+
+    Con 'placement' (un PlacementEngine) los nodos nuevos se eligen según
+    su espacio libre y su carga; sin él, al azar entre los configurados.
+
+    Con 'compression' (un códec de Compression.CODECS) cada bloque cuya
+    muestra se comprime bien se envía y se guarda comprimido; el resto
+    sigue saliendo con sendfile tal cual.
+
+    Los bloques de hasta 'batch_block_max' bytes no se envían uno a uno:
+    se agrupan por nodo en peticiones UPLOAD_BLOCKS de hasta 'batch_bytes'
+    bytes (ver upload_many).
+
+    Con 'erasure' (un Erasure.ErasureCode) el archivo no se replica: cada
+    franja de 'k' bloques consecutivos se guarda con 'm' piezas de
+    paridad, una pieza por nodo (ver _upload_erasure). Pensado para
+    archivos fríos, que se leen poco y ocupan mucho.
+
+    Este código no toca la GUI: se ejecuta en un hilo de trabajo y
+    notifica con los callbacks 'on_progress(bytes_enviados, total)' y
+    'on_log(mensaje)'.
+    """
+    def __init__(self, dfs_client, metadata_manager, max_in_flight=UPLOAD_MAX_IN_FLIGHT,
+                 replication_factor=REPLICATION_FACTOR, replication_mode=REPLICATION_MODE,
+                 placement=None, compression=COMPRESSION_CODEC, erasure=None,
+                 block_size=BLOCK_SIZE, chunking=CHUNKING, batch_block_max=UPLOAD_BATCH_BLOCK_MAX,
+                 batch_bytes=UPLOAD_BATCH_BYTES, on_progress=None, on_log=None):
+        self.dfs_client = dfs_client
+        self.metadata_manager = metadata_manager
+        self.block_size = block_size
+        self.chunking = chunking
+        self.batch_block_max = batch_block_max
+        self.batch_bytes = batch_bytes
+        self.placement = placement
+        self.compression = compression
+        self.erasure = erasure
+        self.max_in_flight = max_in_flight
+        self.replication_factor = replication_factor
+        self.replication_mode = replication_mode
+        self.on_progress = on_progress or (lambda enviados, total: None)
+        self.on_log = on_log or print
+
+        self._lock = threading.Lock()
+        self._enviados = 0
+        # Bytes del archivo que hubo que enviar: los bloques que ya estaban
+        # en sus nodos no cuentan
+        self.bytes_transferidos = 0
+        self._fanout_executor = None
+        # Nodos elegidos por el motor de ubicación para cada bloque
+        self._reservas = {}
+        # CRC32 de los bytes que se guardan de cada bloque (ver Utils.crc_bloque)
+        self._crcs = {}
+        # Nodo de cada pieza nueva de erasure coding ya asignada en esta subida
+        self._ubicacion_ec = {}
+
+    def upload(self, filepath):
+        """
+        Sube 'filepath' y devuelve (nombre_archivo, tamaño, block_map) para
+        registrarlo en los metadatos. Lanza IOError si algún bloque no quedó
+        guardado en ningún nodo.
+
+        Los bloques se nombran por el hash de su contenido. Antes de enviar
+        nada se pregunta en lote (STAT_BLOCKS) a los nodos candidatos qué
+        bloques ya tienen, y solo se transfieren los que faltan.
+
+        El CRC32 de cada bloque se calcula en la misma lectura que el hash
+        (o al comprimirlo), viaja con UPLOAD_BLOCK para que el nodo lo
+        compruebe mientras recibe y queda en la entrada del bloque ('crc').
+        """
+        if self.erasure is not None:
+            filename = os.path.basename(filepath)
+            file_size = os.path.getsize(filepath)
+            return self._upload_erasure(filepath, filename, file_size,
+                                        self._posiciones(filepath, filename, file_size))
+        return self.upload_many([filepath])[0]
+
+    def upload_many(self, filepaths):
+        """
+        Sube varios archivos con réplicas en una sola pasada y devuelve
+        [(nombre_archivo, tamaño, block_map)] en el mismo orden. La consulta
+        de bloques existentes es una sola para todos, y los bloques de hasta
+        'batch_block_max' bytes viajan agrupados por nodo en peticiones
+        UPLOAD_BLOCKS (ver _upload_lotes): con muchos archivos pequeños el
+        coste ya no es una ida y vuelta por bloque. El resto se envía uno a
+        uno, en cadena o en abanico.
+        """
+        archivos = []
+        # Un mismo contenido repetido (en un archivo o entre varios) se sube
+        # una sola vez, desde el primer sitio donde aparece
+        unicos = {}
+        refs = {}
+        for filepath in filepaths:
+            filename = os.path.basename(filepath)
+            file_size = os.path.getsize(filepath)
+            posiciones = self._posiciones(filepath, filename, file_size)
+            firmas = calcular_hashes_bloques(filepath, posiciones)
+            codecs = self._elegir_codecs(filepath, [h for h, _ in firmas], posiciones)
+            hashes = [nombre_almacenado(h, codecs[h]) for h, _ in firmas]
+            # El CRC de un bloque comprimido se conoce al comprimirlo
+            self._crcs.update((nombre_bloque, crc) for nombre_bloque, (h, crc) in zip(hashes, firmas)
+                              if not codecs[h])
+            nuevos = set()
+            for nombre_bloque, (offset, size) in zip(hashes, posiciones):
+                if nombre_bloque not in unicos:
+                    unicos[nombre_bloque] = (filepath, offset, size)
+                    refs[nombre_bloque] = {"file": filename, "file_size": file_size,
+                                           "offsets": [], "size": size}
+                    nuevos.add(nombre_bloque)
+                if nombre_bloque in nuevos:
+                    refs[nombre_bloque]["offsets"].append(offset)
+            archivos.append((filename, file_size, hashes, posiciones))
+
+        self._enviados = 0
+        total_unico = sum(size for _, _, size in unicos.values())
+        self.on_progress(0, total_unico)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight * self.replication_factor) as fanout, \
+             ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            self._fanout_executor = fanout
+            candidatos = {nombre_bloque: self._candidatos(nombre_bloque, size)
+                          for nombre_bloque, (_, _, size) in unicos.items()}
+            presentes = self._consultar_existentes(candidatos, unicos)
+
+            pequenos = [nombre_bloque for nombre_bloque, (_, _, size) in unicos.items()
+                        if size <= self.batch_block_max]
+            futures = {nombre_bloque: executor.submit(self._upload_block, filepath, total_unico,
+                                                      nombre_bloque, offset, size,
+                                                      candidatos[nombre_bloque],
+                                                      presentes[nombre_bloque], refs[nombre_bloque])
+                       for nombre_bloque, (filepath, offset, size) in unicos.items()
+                       if size > self.batch_block_max}
+            try:
+                replicas = self._upload_lotes(executor, total_unico, pequenos, unicos, candidatos,
+                                              presentes, refs)
+                replicas.update((nombre_bloque, future.result()) for nombre_bloque, future in futures.items())
+            except Exception:
+                # No tiene sentido seguir enviando bloques de una subida fallida
+                for future in futures.values():
+                    future.cancel()
+                raise
+
+        subidos = []
+        for filename, file_size, hashes, posiciones in archivos:
+            block_map = []
+            for nombre_bloque, (offset, size) in zip(hashes, posiciones):
+                attrs = {"offset": offset, "size": size}
+                if codec_de_bloque(nombre_bloque):
+                    attrs["codec"] = codec_de_bloque(nombre_bloque)
+                if self._crcs.get(nombre_bloque) is not None:
+                    attrs["crc"] = self._crcs[nombre_bloque]
+                block_map.append(crear_entrada_bloque(nombre_bloque, replicas[nombre_bloque], **attrs))
+            subidos.append((filename, file_size, block_map))
+        return subidos
+
+    def _posiciones(self, filepath, filename, file_size):
+        """[(offset, tamaño)] de los bloques del archivo, según 'chunking'."""
+        if self.chunking == "cdc":
+            from Chunking import calcular_rangos_cdc
+            return calcular_rangos_cdc(filepath, self.block_size // 4, self.block_size,
+                                       self.block_size * 4)
+        return [(offset, size) for _, offset, size
+                in calcular_rangos_bloques(filename, file_size, self.block_size)]
+
+    def _elegir_codecs(self, filepath, hashes, posiciones):
+        """
+        {hash: códec o None} de cada bloque distinto, probando a comprimir
+        una muestra de cada uno (ver Compression.elegir_codec). El códec
+        pasa a formar parte del nombre del bloque guardado.
+        """
+        codecs = dict.fromkeys(hashes)
+        if not self.compression:
+            return codecs
+        with open(filepath, 'rb') as f:
+            for nombre_bloque, (offset, size) in zip(hashes, posiciones):
+                if codecs[nombre_bloque] is None:
+                    codecs[nombre_bloque] = elegir_codec(muestrear(f, offset, size), self.compression) or ""
+        return {nombre_bloque: codec or None for nombre_bloque, codec in codecs.items()}
+
+    def _candidatos(self, nombre_bloque, size):
+        """
+        Nodos donde debería quedar el bloque: primero los que ya lo guardan
+        según los metadatos (otro archivo con el mismo contenido) y, si no
+        llegan al factor de replicación, nodos nuevos elegidos por el motor
+        de ubicación (o al azar si no hay).
+        """
+        candidatos = list(self.metadata_manager.get_block_replicas(nombre_bloque))
+        if len(candidatos) < self.replication_factor and self.placement is not None:
+            reservados = self.placement.choose(self.replication_factor - len(candidatos), size,
+                                               exclude=candidatos)
+            self._reservas[nombre_bloque] = reservados
+            candidatos += reservados
+        elif len(candidatos) < self.replication_factor:
+            for addr in self.metadata_manager.get_nodos_para_bloque(n=self.replication_factor):
+                addr = tuple(addr)
+                if addr not in candidatos and len(candidatos) < self.replication_factor:
+                    candidatos.append(addr)
+        return candidatos
+
+    def _consultar_existentes(self, candidatos, unicos):
+        """
+        Pregunta a cada nodo, con peticiones STAT_BLOCKS en lotes y en
+        paralelo, por todos los bloques que se le podrían enviar. Devuelve
+        {nombre_bloque: [nodos que ya lo tienen]}. Un bloque sin comprimir
+        guardado con otro tamaño (por ejemplo, truncado) se vuelve a enviar.
+        """
+        por_nodo = {}
+        for nombre_bloque, nodos in candidatos.items():
+            for addr in nodos:
+                por_nodo.setdefault(addr, []).append(nombre_bloque)
+
+        existentes = self.dfs_client.stat_blocks(por_nodo)
+
+        def guardado(addr, nombre_bloque):
+            size = existentes[addr].get(nombre_bloque)
+            return size is not None and (codec_de_bloque(nombre_bloque) or size == unicos[nombre_bloque][2])
+
+        return {nombre_bloque: [addr for addr in nodos if guardado(addr, nombre_bloque)]
+                for nombre_bloque, nodos in candidatos.items()}
+
+    def _upload_block(self, filepath, total, nombre_bloque, offset, size, candidatos, presentes, ref):
+        faltan = max(0, self.replication_factor - len(presentes))
+        destinos = [addr for addr in candidatos if addr not in presentes][:faltan]
+        if not candidatos:
+            raise IOError(f"No hay nodos disponibles con espacio para el bloque {nombre_bloque}.")
+
+        guardado_en = list(presentes)
+        codec = codec_de_bloque(nombre_bloque)
+        if destinos:
+            with open(filepath, 'rb') as f:
+                # Los bloques comprimidos se leen y comprimen aquí, en el hilo
+                # del bloque (zlib, lzma y bz2 liberan el GIL mientras trabajan)
+                if codec:
+                    f.seek(offset)
+                    body = comprimir(codec, f.read(size))
+                    self._crcs[nombre_bloque] = crc_bloque(body)
+                else:
+                    body = FileRange(f, offset, size)
+                ref = dict(ref, crc=self._crcs[nombre_bloque])
+                if self.replication_mode == "chain":
+                    guardado_en += self._send_chain(nombre_bloque, body, destinos, ref)
+                else:
+                    guardado_en += self._send_fanout(filepath, nombre_bloque, body, destinos, ref)
+        return self._registrar_resultado(nombre_bloque, size, total, presentes, destinos, guardado_en)
+
+    def _registrar_resultado(self, nombre_bloque, size, total, presentes, destinos, guardado_en):
+        """
+        Cierra la subida de un bloque: libera el espacio apartado que no se
+        usó, avisa si quedó con menos réplicas de las previstas y anota el
+        progreso. Devuelve 'guardado_en'; lanza IOError si está vacío.
+        """
+        if codec_de_bloque(nombre_bloque) and not destinos:
+            # Ya guardado por otro archivo: su suma está en los metadatos
+            self._crcs[nombre_bloque] = self.metadata_manager.get_block_checksum(nombre_bloque)
+
+        # El espacio apartado en nodos que no recibieron el bloque queda libre
+        for addr in self._reservas.pop(nombre_bloque, []):
+            if addr in presentes or addr not in guardado_en:
+                self.placement.release(addr, size)
+
+        if not guardado_en:
+            raise IOError(f"El bloque {nombre_bloque} no se pudo guardar en ningún nodo.")
+        if len(guardado_en) < len(presentes) + len(destinos):
+            self.on_log(f"Bloque {nombre_bloque} guardado solo en {len(guardado_en)} "
+                        f"de {len(presentes) + len(destinos)} nodos")
+
+        with self._lock:
+            self._enviados += size
+            if destinos:
+                self.bytes_transferidos += size
+            self.on_progress(self._enviados, total)
+        return guardado_en
+
+    def _upload_lotes(self, executor, total, nombres, unicos, candidatos, presentes, refs):
+        """
+        Sube los bloques pequeños 'nombres' agrupados por nodo de destino:
+        cada lote es una petición UPLOAD_BLOCKS de hasta 'batch_bytes' bytes
+        y BATCH_MAX_BLOCKS bloques, y los lotes se envían en paralelo en
+        'executor'. Devuelve {nombre_bloque: nodos que lo guardaron}.
+        """
+        destinos = {}
+        por_nodo = {}
+        for nombre_bloque in nombres:
+            if not candidatos[nombre_bloque]:
+                raise IOError(f"No hay nodos disponibles con espacio para el bloque {nombre_bloque}.")
+            faltan = max(0, self.replication_factor - len(presentes[nombre_bloque]))
+            destinos[nombre_bloque] = [addr for addr in candidatos[nombre_bloque]
+                                       if addr not in presentes[nombre_bloque]][:faltan]
+            for addr in destinos[nombre_bloque]:
+                por_nodo.setdefault(addr, []).append(nombre_bloque)
+
+        lotes = []
+        for addr, pendientes in por_nodo.items():
+            lote, bytes_lote = [], 0
+            for nombre_bloque in pendientes:
+                size = unicos[nombre_bloque][2]
+                if lote and (bytes_lote + size > self.batch_bytes or len(lote) >= BATCH_MAX_BLOCKS):
+                    lotes.append((addr, lote))
+                    lote, bytes_lote = [], 0
+                lote.append(nombre_bloque)
+                bytes_lote += size
+            if lote:
+                lotes.append((addr, lote))
+
+        guardado_en = {nombre_bloque: list(presentes[nombre_bloque]) for nombre_bloque in nombres}
+        # Un bloque termina cuando llegan las respuestas de todos sus lotes
+        restantes = {nombre_bloque: len(destinos[nombre_bloque]) for nombre_bloque in nombres}
+        replicas = {}
+
+        def terminar(nombre_bloque):
+            replicas[nombre_bloque] = self._registrar_resultado(
+                nombre_bloque, unicos[nombre_bloque][2], total, presentes[nombre_bloque],
+                destinos[nombre_bloque], guardado_en[nombre_bloque])
+
+        for nombre_bloque in nombres:
+            if not restantes[nombre_bloque]:
+                terminar(nombre_bloque)
+        futures = {executor.submit(self._send_lote, addr, lote, unicos, refs): (addr, lote)
+                   for addr, lote in lotes}
+        try:
+            for future in as_completed(futures):
+                addr, lote = futures[future]
+                guardados = future.result()
+                if len(guardados) < len(lote):
+                    self.on_log(f"Fallo al enviar {len(lote) - len(guardados)} de {len(lote)} "
+                                f"bloques a {addr}")
+                for nombre_bloque in lote:
+                    if nombre_bloque in guardados:
+                        guardado_en[nombre_bloque].append(addr)
+                    restantes[nombre_bloque] -= 1
+                    if not restantes[nombre_bloque]:
+                        terminar(nombre_bloque)
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return replicas
+
+    def _send_lote(self, addr, lote, unicos, refs):
+        """Lee (y comprime) los bloques de 'lote' y los envía a 'addr' en un UPLOAD_BLOCKS."""
+        bloques = []
+        with ExitStack() as pila:
+            abiertos = {}
+            for nombre_bloque in lote:
+                filepath, offset, size = unicos[nombre_bloque]
+                if filepath not in abiertos:
+                    abiertos[filepath] = pila.enter_context(open(filepath, 'rb'))
+                f = abiertos[filepath]
+                f.seek(offset)
+                data = f.read(size)
+                codec = codec_de_bloque(nombre_bloque)
+                if codec:
+                    # La compresión es determinista: cada réplica recibe los mismos bytes
+                    data = comprimir(codec, data)
+                    with self._lock:
+                        self._crcs[nombre_bloque] = crc_bloque(data)
+                bloques.append((nombre_bloque, data, dict(refs[nombre_bloque], crc=self._crcs[nombre_bloque])))
+        return self.dfs_client.upload_blocks(addr, bloques)
+
+    def _send_chain(self, nombre_bloque, body, destinos, ref=None):
+        # Si el primario no responde, el siguiente pasa a encabezar la cadena.
+        # Si la cadena se corta más adelante, los nodos que ya confirmaron
+        # no se repiten: se reintenta solo con los que faltan.
+        guardado_en = []
+        pendientes = [tuple(addr) for addr in destinos]
+        while pendientes:
+            guardados = [addr for addr in self.dfs_client.upload_block(pendientes, nombre_bloque, body, ref)
+                         if addr in pendientes]
+            if guardados:
+                guardado_en += guardados
+                pendientes = [addr for addr in pendientes if addr not in guardados]
+                if pendientes:
+                    self.on_log(f"Bloque {nombre_bloque} sin confirmar en {len(pendientes)} nodos; "
+                                "reintentando con ellos")
+            else:
+                self.on_log(f"Fallo al enviar bloque {nombre_bloque} a {pendientes[0]}")
+                pendientes = pendientes[1:]
+            if pendientes:
+                self.dfs_client.metrics.inc("client_upload_retries_total")
+        return guardado_en
+
+    def _send_fanout(self, filepath, nombre_bloque, body, destinos, ref=None):
+        def enviar(addr):
+            # Cada transferencia usa su propio descriptor: sendfile (o su
+            # alternativa con buffer) mueve la posición del archivo.
+            with open(filepath, 'rb') as f:
+                cuerpo = FileRange(f, body.offset, body.count) if isinstance(body, FileRange) else body
+                if self.dfs_client.upload_block([addr], nombre_bloque, cuerpo, ref):
+                    return addr
+            self.on_log(f"Fallo al enviar bloque {nombre_bloque} a {addr}")
+            return None
+
+        futures = [self._fanout_executor.submit(enviar, addr) for addr in destinos]
+        return [addr for addr in (future.result() for future in futures) if addr is not None]
+
+    # --- 1.1. Erasure coding ---
+
+    def _upload_erasure(self, filepath, filename, file_size, posiciones):
+        """
+        Sube el archivo en franjas de 'k' bloques más 'm' piezas de paridad,
+        cada pieza en un único nodo. Ocupa (k+m)/k veces el archivo en lugar
+        de REPLICATION_FACTOR veces y sobrevive a la pérdida de 'm' piezas
+        de cada franja.
+
+        Las piezas se nombran por el hash de su contenido como el resto de
+        bloques y no se comprimen. Su entrada en el block_map lleva
+        attrs['ec'] = {"scheme", "k", "m", "stripe", "index"}; las de
+        paridad no tienen offset. Lanza IOError si no hay nodos suficientes
+        para que la caída de uno no se lleve más de 'm' piezas de una franja.
+        """
+        k = self.erasure.k
+        franjas = [posiciones[i:i + k] for i in range(0, len(posiciones), k)]
+
+        self._enviados = 0
+        self._ubicacion_ec = {}
+        self.on_progress(0, file_size)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight * (k + self.erasure.m)) as fanout, \
+             ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            self._fanout_executor = fanout
+            futures = [executor.submit(self._upload_franja, filepath, filename, file_size, s, franja)
+                       for s, franja in enumerate(franjas)]
+            try:
+                entradas = [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return filename, file_size, [entrada for franja in entradas for entrada in franja]
+
+    def _nodos_franja(self, n, size):
+        if self.placement is not None:
+            return self.placement.choose(n, size)
+        return [tuple(addr) for addr in self.metadata_manager.get_nodos_para_bloque(n=n)]
+
+    def _upload_franja(self, filepath, filename, file_size, s, franja):
+        codigo = self.erasure
+        with open(filepath, 'rb') as f:
+            datos = []
+            for offset, size in franja:
+                f.seek(offset)
+                datos.append(f.read(size))
+        piezas = datos + codigo.encode(datos)
+        # En la última franja los datos que faltan hasta 'k' son ceros
+        # implícitos: no se guardan, y la paridad conserva los índices k..k+m-1
+        indices = list(range(len(datos))) + list(range(codigo.k, codigo.k + codigo.m))
+        nombres = [hash_bloque(pieza) for pieza in piezas]
+
+        nodos = self._nodos_franja(len(piezas), len(piezas[-1]))
+        if not nodos:
+            raise IOError(f"No hay nodos disponibles con espacio para la franja {s + 1} de {filename}.")
+        with self._lock:
+            # Un contenido que ya está guardado (antes en este archivo o en
+            # otro) se queda donde está: los metadatos tienen una sola lista
+            # de nodos por bloque. El resto se reparte por turnos.
+            ubicacion = {}
+            nuevos = []
+            for nombre_bloque in nombres:
+                if nombre_bloque in ubicacion:
+                    continue
+                previa = (self._ubicacion_ec.get(nombre_bloque)
+                          or self.metadata_manager.get_block_replicas(nombre_bloque))
+                if previa:
+                    ubicacion[nombre_bloque] = [tuple(addr) for addr in previa]
+                else:
+                    ubicacion[nombre_bloque] = [nodos[len(nuevos) % len(nodos)]]
+                    self._ubicacion_ec[nombre_bloque] = ubicacion[nombre_bloque]
+                    nuevos.append(nombre_bloque)
+        if self.placement is not None:
+            usados = {ubicacion[nombre_bloque][0] for nombre_bloque in nuevos}
+            for addr in nodos:
+                if addr not in usados:
+                    self.placement.release(addr, len(piezas[-1]))
+
+        # La caída de un nodo no puede llevarse más de 'm' piezas de la franja
+        perdidas = {}
+        for nombre_bloque in nombres:
+            if len(ubicacion[nombre_bloque]) == 1:
+                addr = ubicacion[nombre_bloque][0]
+                perdidas[addr] = perdidas.get(addr, 0) + 1
+        if max(perdidas.values(), default=0) > codigo.m:
+            raise IOError(f"La franja {s + 1} de {filename} dejaría {max(perdidas.values())} piezas en un "
+                          f"mismo nodo con {codigo.k}+{codigo.m} ({len(nodos)} nodos disponibles; hacen "
+                          f"falta al menos {-(-len(piezas) // codigo.m)}, y contenido repetido cuenta "
+                          f"como una sola pieza). Súbelo con replicación.")
+
+        def enviar(i):
+            nombre_bloque, pieza = nombres[i], piezas[i]
+            crc = crc_bloque(pieza)
+            if nombre_bloque in nuevos and nombres.index(nombre_bloque) == i:
+                ref = {"crc": crc}
+                if i < len(datos):
+                    # Solo los datos sirven para reconstruir el archivo desde los nodos
+                    ref.update({"file": filename, "file_size": file_size,
+                                "offsets": [franja[i][0]], "size": len(pieza)})
+                addr = ubicacion[nombre_bloque][0]
+                if not self.dfs_client.upload_block([addr], nombre_bloque, pieza, ref):
+                    raise IOError(f"La pieza {indices[i] + 1} de la franja {s + 1} ({nombre_bloque}) "
+                                  f"no se pudo guardar en {addr[0]}:{addr[1]}.")
+                if i < len(datos):
+                    with self._lock:
+                        self.bytes_transferidos += franja[i][1]
+            attrs = {"size": len(pieza), "crc": crc,
+                     "ec": {"scheme": codigo.scheme, "k": codigo.k, "m": codigo.m,
+                            "stripe": s, "index": indices[i]}}
+            if i < len(datos):
+                attrs["offset"] = franja[i][0]
+            return crear_entrada_bloque(nombre_bloque, ubicacion[nombre_bloque], **attrs)
+
+        futures = [self._fanout_executor.submit(enviar, i) for i in range(len(piezas))]
+        entradas = [future.result() for future in futures]
+
+        with self._lock:
+            self._enviados += sum(len(d) for d in datos)
+            self.on_progress(self._enviados, file_size)
+        return entradas
+
+
+# --- 2. Lectura de Bloques con Réplicas ---
+
+class BlockFetcher:
+    """
+    Lee bloques eligiendo réplica. Cada bloque se pide primero a la
+    réplica que se espera más rápida, según los tiempos de lecturas
+    anteriores (dfs_client.latency) y las lecturas que este objeto ya tiene
+    en curso con cada nodo. Si no responde antes del percentil
+    HEDGE_PERCENTILE de sus tiempos, se pide también a la siguiente réplica
+    y se queda la primera respuesta; la otra petición se cancela. Si una
+    réplica falla, o entrega un bloque que no pasa la comprobación de
+    integridad (CRC32 o hash del contenido), se prueba con las demás.
+    """
+    def __init__(self, dfs_client, on_log=None):
+        self.dfs_client = dfs_client
+        self.latency = dfs_client.latency
+        self.metrics = dfs_client.metrics
+        self.on_log = on_log or print
+        self._lock = threading.Lock()
+        self._activos = {}
+
+    def _elegir_orden(self, replicas):
+        with self._lock:
+            return self.latency.rank(replicas, self._activos)
+
+    def _lanzar(self, pendientes, addr, nombre_bloque, offset, length):
+        with self._lock:
+            self._activos[addr] = self._activos.get(addr, 0) + 1
+        future = self.dfs_client.request_block_async(addr, nombre_bloque, offset, length)
+        pendientes[future] = (addr, time.monotonic())
+
+    def _terminar(self, addr):
+        with self._lock:
+            self._activos[addr] -= 1
+
+    def fetch(self, nombre_bloque, replicas, offset=None, length=None, crc=None):
+        """
+        Lee un bloque (o solo 'length' bytes desde 'offset'). Primero se
+        busca en la caché del cliente (que incluye el almacenamiento de este
+        mismo nodo); si no está, se pide a la red y el bloque completo queda
+        en la caché. Un bloque comprimido se pide entero (un rango de los
+        bytes comprimidos no sirve) y se descomprime en el hilo que lo pidió.
+        'crc' es la suma de los metadatos; solo se comprueban bloques enteros.
+        Devuelve los bytes, o None si ninguna réplica los entregó.
+        """
+        cache = self.dfs_client.cache
+        data = cache.get(nombre_bloque, replicas)
+        if data is None and codec_de_bloque(nombre_bloque):
+            data = self._fetch_red(nombre_bloque, replicas, None, None, crc)
+            try:
+                data = decodificar_bloque(nombre_bloque, data) if data is not None else None
+            except IOError as e:
+                self.on_log(str(e))
+                return None
+            if data is not None:
+                cache.put(nombre_bloque, data)
+        if data is not None:
+            if offset is None:
+                return data
+            return data[offset:] if length is None else data[offset:offset + length]
+        data = self._fetch_red(nombre_bloque, replicas, offset, length, crc)
+        if data is not None and offset is None and length is None:
+            cache.put(nombre_bloque, data)
+        return data
+
+    def _fetch_red(self, nombre_bloque, replicas, offset, length, crc=None):
+        """
+        Pide el bloque a la réplica más rápida, con una lectura duplicada
+        (hedged) en la siguiente si la primera se retrasa.
+        """
+        completo = offset is None and length is None
+        restantes = self._elegir_orden(replicas)
+        pendientes = {}
+        duplicada = False
+        plazo_max = self.dfs_client.timeout
+        try:
+            while pendientes or restantes:
+                if not pendientes:
+                    if len(restantes) < len(replicas):
+                        self.metrics.inc("client_replica_fallbacks_total")
+                        self.on_log(f"¡Fallo! Intentando con copia de {restantes[0]}...")
+                    self._lanzar(pendientes, restantes.pop(0), nombre_bloque, offset, length)
+
+                ahora = time.monotonic()
+                addr, inicio = next(iter(pendientes.values()))
+                if not duplicada and restantes and len(pendientes) == 1:
+                    espera = inicio + self.latency.deadline(addr) - ahora
+                else:
+                    espera = min(t + plazo_max for _, t in pendientes.values()) - ahora
+                hechos, _ = wait(list(pendientes), max(0.0, espera), return_when=FIRST_COMPLETED)
+
+                if not hechos:
+                    ahora = time.monotonic()
+                    if not duplicada and restantes and len(pendientes) == 1:
+                        duplicada = True
+                        self.metrics.inc("client_hedged_reads_total")
+                        self._lanzar(pendientes, restantes.pop(0), nombre_bloque, offset, length)
+                        continue
+                    # Peticiones que agotaron el plazo
+                    for future, (addr, inicio) in list(pendientes.items()):
+                        if ahora - inicio >= plazo_max:
+                            del pendientes[future]
+                            self.dfs_client.cancel(future)
+                            self._terminar(addr)
+                            self.latency.record_failure(addr)
+                    continue
+
+                for future in hechos:
+                    addr, inicio = pendientes.pop(future)
+                    self._terminar(addr)
+                    duracion = time.monotonic() - inicio
+                    try:
+                        respuesta = future.result()
+                    except Exception:
+                        # Conexión rechazada o caída
+                        self.latency.record_failure(addr)
+                        continue
+                    if respuesta.status != STATUS_OK:
+                        # El nodo contestó (p. ej. NOT_FOUND): no es lento ni
+                        # está caído, solo no tiene el bloque
+                        continue
+                    if not completo or bloque_integro(nombre_bloque, respuesta.body, crc):
+                        self.latency.record(addr, duracion)
+                        return respuesta.body
+                    self.metrics.inc("client_corrupt_blocks_total", peer=f"{addr[0]}:{addr[1]}")
+                    self.on_log(f"Bloque {nombre_bloque} corrupto en {addr}; se pide a otra réplica")
+                    self.latency.record_failure(addr)
+            return None
+        finally:
+            # La lectura que perdió la carrera se cancela. Solo cuenta como
+            # lenta si ya llevaba más de lo que suele tardar ese nodo.
+            ahora = time.monotonic()
+            for future, (addr, inicio) in pendientes.items():
+                self.dfs_client.cancel(future)
+                self._terminar(addr)
+                if ahora - inicio > self.latency.expected(addr):
+                    self.latency.record_slow(addr, ahora - inicio)
+
+
+# --- 3. Descarga en Paralelo ---
+
+class ParallelDownloader:
+    """
+    Descarga varios bloques a la vez y escribe cada uno directamente en su
+    offset del archivo de destino (pwrite), sin temporales ni paso final
+    de combinación.
+
+    La réplica de cada bloque la elige un BlockFetcher (la más rápida, con
+    lecturas duplicadas si se retrasa). En los archivos con erasure coding,
+    un bloque de datos que no se puede leer se reconstruye con otras
+    piezas de su franja (Erasure.StripeIndex).
+    """
+    def __init__(self, dfs_client, concurrency=DOWNLOAD_CONCURRENCY,
+                 on_progress=None, on_log=None):
+        self.dfs_client = dfs_client
+        self.concurrency = concurrency
+        self.on_progress = on_progress or (lambda recibidos, total: None)
+        self.on_log = on_log or print
+        self.fetcher = BlockFetcher(dfs_client, self.on_log)
+        self.franjas = StripeIndex()
+
+        self._lock = threading.Lock()
+        self._recibidos = 0
+
+    def download(self, bloques_info, save_path, file_size=None):
+        """Descarga los bloques de 'bloques_info' en 'save_path'. Lanza IOError si falla."""
+        # Un bloque que aparece varias veces en el archivo (mismo contenido)
+        # se descarga una vez y se escribe en todos sus offsets.
+        bloques = {}
+        offset_siguiente = 0
+        self.franjas.add(bloques_info)
+        for i, entrada in enumerate(bloques_info):
+            nombre_bloque, _, _, attrs = desempaquetar_bloque(entrada)
+            if es_paridad(attrs):
+                continue
+            # Las entradas antiguas no guardan offset: todos sus bloques
+            # salvo el último miden BLOCK_SIZE.
+            offset = attrs.get('offset', i * BLOCK_SIZE)
+            bloque = bloques.setdefault(nombre_bloque, (replicas_de_bloque(entrada), [], attrs.get('crc')))
+            bloque[1].append(offset)
+            offset_siguiente = offset + attrs.get('size', 0)
+        if file_size is None:
+            file_size = offset_siguiente
+
+        self._recibidos = 0
+        self.on_progress(0, file_size)
+
+        fd = os.open(save_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+        try:
+            _preallocate(fd, file_size)
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [executor.submit(self._download_block, fd, file_size, nombre_bloque, *bloque)
+                           for nombre_bloque, bloque in bloques.items()]
+                try:
+                    for future in futures:
+                        future.result()
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except Exception:
+            os.close(fd)
+            os.remove(save_path)
+            raise
+        os.close(fd)
+        return save_path
+
+    def _download_block(self, fd, file_size, nombre_bloque, replicas, offsets, crc=None):
+        block_data = self.fetcher.fetch(nombre_bloque, replicas, crc=crc)
+        if block_data is None and nombre_bloque in self.franjas:
+            self.on_log(f"Bloque {nombre_bloque} ilegible: reconstruyéndolo con su franja")
+            self.fetcher.metrics.inc("client_stripe_recoveries_total")
+            block_data = self.franjas.recover(nombre_bloque, self.fetcher)
+        if block_data is None:
+            raise IOError(f"No se pudo recuperar el bloque {nombre_bloque} ni su copia. "
+                          "La descarga ha fallado.")
+
+        for offset in offsets:
+            _pwrite(fd, block_data, offset)
+        with self._lock:
+            self._recibidos += len(block_data) * len(offsets)
+            self.on_progress(self._recibidos, file_size)
+
+
+_write_lock = threading.Lock()
+
+def _pwrite(fd, data, offset):
+    """Escribe 'data' en 'offset' sin mover un cursor compartido entre hilos."""
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            escritos = os.pwrite(fd, view, offset)
+            view = view[escritos:]
+            offset += escritos
+    else:
+        # Windows no tiene pwrite: se serializa el par seek + write
+        with _write_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+
+
+def _preallocate(fd, size):
+    """Reserva el tamaño final del archivo de destino antes de escribir bloques."""
+    if hasattr(os, 'posix_fallocate') and size:
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
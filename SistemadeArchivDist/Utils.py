@@ -4,8 +4,17 @@ import os
 import shutil
 import json
 import random
+import hashlib
+import threading
+import time
+import zlib
+from collections import deque
 from datetime import datetime
-from Config import BLOCK_SIZE, NODOS_CONOCIDOS, LOCAL_STORAGE_DIR
+from Config import (BLOCK_SIZE, NODOS_CONOCIDOS, LOCAL_STORAGE_DIR, REPLICATION_FACTOR,
+                    METADATA_OPLOG_MAX, METADATA_SNAPSHOT_EVERY)
+from Store import MetadataStore
+from Catalog import Catalog
+from Compression import codec_de_bloque, decodificar_bloque, nombre_contenido
 
 # --- 1. Lógica de Partición y Combinación ---
 def particionar_archivo(archivo_entrada, directorio_salida_temp):
@@ -64,78 +73,652 @@ def combinar_bloques(bloques_temp, archivo_salida):
         print(f"Error al combinar bloques: {e}")
         return False
 
+def calcular_rangos_bloques(nombre_base, file_size, block_size=BLOCK_SIZE):
+    """
+    Describe cómo se parte un archivo sin escribir nada a disco.
+    Devuelve [(nombre_bloque, offset, tamaño)] con los mismos nombres que
+    usaría particionar_archivo.
+    """
+    rangos = []
+    for parte_actual, offset in enumerate(range(0, file_size, block_size), start=1):
+        nombre_bloque = f"{nombre_base}_b{parte_actual}.bin"
+        rangos.append((nombre_bloque, offset, min(block_size, file_size - offset)))
+    return rangos
+
+def hash_bloque(data):
+    """
+    Nombre de un bloque direccionado por contenido: el SHA-256 de sus bytes.
+    Dos bloques con el mismo contenido tienen el mismo nombre, sin importar
+    de qué archivo provengan.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def crc_bloque(data, crc=0):
+    """
+    Suma de verificación (CRC32) de los bytes de un bloque tal como viajan
+    y se guardan. Es mucho más barata que el SHA-256 y se puede calcular
+    por trozos mientras se transfiere ('crc' es el valor acumulado).
+    """
+    return zlib.crc32(data, crc)
+
+def bloque_integro(nombre_bloque, data, crc=None):
+    """
+    True si 'data' (los bytes guardados, quizá comprimidos) es el bloque
+    correcto. Con 'crc' se compara la suma; sin ella, en un bloque
+    direccionado por contenido se recalcula el hash del contenido. Los
+    nombres antiguos (archivo_bN.bin) sin suma no se pueden comprobar.
+    """
+    if crc is not None:
+        return crc_bloque(data) == crc
+    contenido = nombre_contenido(nombre_bloque)
+    if len(contenido) != 64 or contenido.strip("0123456789abcdef"):
+        return True
+    try:
+        return hash_bloque(decodificar_bloque(nombre_bloque, data)) == contenido
+    except IOError:
+        return False
+
+def calcular_hashes_bloques(archivo_entrada, rangos):
+    """
+    Lee el archivo una sola vez, con un único buffer reutilizado, y
+    devuelve el hash de contenido y el CRC32 de cada rango (offset,
+    tamaño): [(hash, crc)].
+    """
+    buffer = bytearray(max((size for _, size in rangos), default=0))
+    hashes = []
+    with open(archivo_entrada, 'rb') as f:
+        for offset, size in rangos:
+            f.seek(offset)
+            view = memoryview(buffer)[:size]
+            leidos = f.readinto(view)
+            if leidos != size:
+                raise IOError(f"Lectura corta en {archivo_entrada} (offset {offset})")
+            hashes.append((hash_bloque(view), crc_bloque(view)))
+    return hashes
+
+def desempaquetar_bloque(entrada):
+    """
+    Normaliza una entrada del block_map a (nombre, original, copia, attrs).
+    Las entradas nuevas llevan un cuarto elemento con atributos del bloque
+    ('offset', 'size'); las antiguas de 3 elementos devuelven attrs vacío.
+    """
+    nombre_bloque, original, copia = entrada[0], tuple(entrada[1]), tuple(entrada[2])
+    attrs = entrada[3] if len(entrada) > 3 else {}
+    return nombre_bloque, original, copia, attrs
+
+def replicas_de_bloque(entrada):
+    """
+    Todos los nodos que guardan el bloque, sin repetir: el original, la
+    copia y las réplicas extra (attrs['replicas']) si el factor de
+    replicación es mayor que 2.
+    """
+    _, original, copia, attrs = desempaquetar_bloque(entrada)
+    replicas = []
+    for addr in [original, copia] + [tuple(a) for a in attrs.get('replicas', [])]:
+        if addr not in replicas:
+            replicas.append(addr)
+    return replicas
+
+def es_paridad(attrs):
+    """
+    True si la entrada es una pieza de paridad de un archivo guardado con
+    erasure coding (attrs['ec'], ver Erasure.py): no forma parte de los
+    datos del archivo y solo se lee para reconstruir otro bloque.
+    """
+    ec = attrs.get('ec')
+    return ec is not None and ec['index'] >= ec['k']
+
+def disposicion_bloques(block_map, file_size):
+    """
+    Devuelve [(offset, tamaño, nombre, réplicas, crc)] de cada bloque del
+    archivo, ordenado por offset ('crc' es None si la entrada no lo lleva). Las entradas antiguas no guardan offset
+    ni tamaño: sus bloques miden BLOCK_SIZE salvo el último. Las piezas de
+    paridad no se incluyen.
+    """
+    bloques = []
+    for i, entrada in enumerate(block_map):
+        nombre_bloque, _, _, attrs = desempaquetar_bloque(entrada)
+        if es_paridad(attrs):
+            continue
+        bloques.append([attrs.get('offset', i * BLOCK_SIZE), attrs.get('size'),
+                        nombre_bloque, replicas_de_bloque(entrada), attrs.get('crc')])
+    bloques.sort(key=lambda b: b[0])
+    for i, bloque in enumerate(bloques):
+        if bloque[1] is None:
+            fin = bloques[i + 1][0] if i + 1 < len(bloques) else file_size
+            bloque[1] = fin - bloque[0]
+    return [tuple(b) for b in bloques]
+
+def crear_entrada_bloque(nombre_bloque, replicas, **attrs):
+    """
+    Construye una entrada del block_map a partir de la lista de nodos que
+    guardan el bloque. Con un único nodo, original y copia coinciden.
+    """
+    replicas = [tuple(addr) for addr in replicas]
+    original = replicas[0]
+    copia = replicas[1] if len(replicas) > 1 else original
+    if len(replicas) > 2:
+        attrs['replicas'] = replicas[2:]
+    return [nombre_bloque, original, copia, attrs]
+
+def _stamp_key(stamp):
+    """Orden total de las marcas [lamport, origen]; sin marca va primero."""
+    return (stamp[0], stamp[1]) if stamp else (0, "")
+
 # --- 2. Lógica de Metadatos (Tabla de Bloques) ---
 
 class MetadataManager:
     """
-    Gestiona la 'Tabla de Bloques' (en este caso, un 'file_table').
+    Gestiona la 'Tabla de Bloques' (en memoria, un Catalog).
     Esta clase es la responsable de mantener el estado del sistema sincronizado.
+
+    Cada cambio (añadir o quitar un archivo, o mover réplicas de sus
+    bloques) se registra como una operación con un número de secuencia por
+    nodo de origen ('seq') y un reloj de Lamport ('ts'). Los nodos intercambian solo las operaciones que al otro
+    le faltan según su vector de versiones ({origen: último seq}); si un
+    nodo está tan atrasado que el registro ya no las conserva, recibe una
+    instantánea completa. Si dos nodos cambian el mismo archivo a la vez,
+    gana la operación con mayor (ts, origen) en todos los nodos.
+
+    Con 'persistir' la tabla sobrevive a reinicios (ver Store.py): cada
+    operación aplicada se escribe en el WAL y al arrancar se carga la
+    última instantánea más las operaciones posteriores.
+
+    Con 'port' 0 es un cliente sin almacenamiento propio (ver Node.py): no
+    crea el directorio de bloques y no puede persistir.
     """
-    def __init__(self, nodo_id, host_ip, port):
+    def __init__(self, nodo_id, host_ip, port, persistir=True):
         self.nodo_id = nodo_id
         self.host_addr = (host_ip, port)
         
         self.storage_dir = f"{LOCAL_STORAGE_DIR}_{port}"
-        if not os.path.exists(self.storage_dir):
+        if port and not os.path.exists(self.storage_dir):
             os.makedirs(self.storage_dir)
 
-        self.file_table = {}
+        # Archivos, bloques e índices secundarios (ver Catalog.py)
+        self.catalogo = Catalog()
+
+        # Registro de operaciones versionado
+        self.lock = threading.RLock()
+        # El origen incluye la 'encarnación' del nodo: si pierde sus
+        # metadatos y vuelve a numerar desde 1, los demás no confunden sus
+        # operaciones nuevas con las que ya aplicaron.
+        self.origin = f"{host_ip}:{port}@{int(time.time() * 1000)}"
+        self.clock = 0
+        self.vector = {}
+        self.stamps = {}
+        self.oplog = deque()
+        self.truncated = {}
+
+        self.store = None
+        if persistir:
+            self.store = MetadataStore(f"{self.storage_dir}_meta",
+                                       os.path.join(self.storage_dir, ".blocks.jsonl"))
+        self._ultimo_registro = 0
+        if self.store is not None:
+            if self.store.existe():
+                self._cargar()
+            else:
+                # La primera instantánea fija el origen de este nodo
+                with self.lock:
+                    self._compactar()
+                self.reconstruir_desde_bloques()
+
+    def _reindexar(self, tabla):
+        """Reemplaza toda la tabla por 'tabla' (formato de la red)."""
+        self.catalogo.clear()
+        for nombre, data in tabla.items():
+            self.catalogo.put(nombre, data)
+
+    def get_block_refs(self, nombre_bloque):
+        return self.catalogo.block_refs.get(nombre_bloque, 0)
+
+    def get_block_replicas(self, nombre_bloque):
+        """Nodos que guardan un bloque ya conocido, o [] si ningún archivo lo usa."""
+        return self.catalogo.block_replicas(nombre_bloque)
+
+    def get_bloques_en_nodo(self, addr):
+        """Bloques que, según los metadatos, guarda el nodo 'addr'."""
+        with self.lock:
+            return self.catalogo.blocks_on_node(addr)
+
+    def get_bloques_en_nodos(self, nodos):
+        """
+        {bloque: réplicas} de los bloques que, según los metadatos, guarda
+        alguno de 'nodos'. No incluye piezas de erasure coding (no tienen
+        copias que re-replicar).
+        """
+        bloques = {}
+        with self.lock:
+            for addr in nodos:
+                for nombre_bloque in self.catalogo.blocks_on_node(addr):
+                    if nombre_bloque in bloques:
+                        continue
+                    bloque = self.catalogo.block_record(nombre_bloque)
+                    if bloque is not None and bloque.extra and 'ec' in bloque.extra:
+                        continue
+                    bloques[nombre_bloque] = self.catalogo.block_replicas(nombre_bloque)
+        return bloques
+
+    def get_referencia_bloque(self, nombre_bloque):
+        """'ref' de UPLOAD_BLOCK (archivo, offsets, CRC) para copiar un bloque ya conocido."""
+        with self.lock:
+            ref = self.catalogo.block_ref(nombre_bloque) or {}
+            crc = self.get_block_checksum(nombre_bloque)
+        if crc is not None:
+            ref["crc"] = crc
+        return ref
+
+    def get_bytes_en_nodo(self, addr):
+        """Bytes de bloques distintos que, según los metadatos, guarda el nodo 'addr'."""
+        with self.lock:
+            return self.catalogo.bytes_on_node(addr)
+
+    def get_block_checksum(self, nombre_bloque):
+        """CRC32 del bloque según los metadatos, o None si no se conoce."""
+        with self.lock:
+            bloque = self.catalogo.block_record(nombre_bloque)
+            return bloque.extra.get('crc') if bloque is not None and bloque.extra else None
+
+    def get_bloques_siguientes(self, nombre_bloque, n, addr=None):
+        """Los 'n' bloques que siguen a 'nombre_bloque' en su archivo (y están en 'addr')."""
+        with self.lock:
+            return self.catalogo.next_blocks(nombre_bloque, n, addr)
+
+    def get_archivos_con_prefijo(self, prefijo):
+        with self.lock:
+            return self.catalogo.names_with_prefix(prefijo)
+
+    def get_archivos_mas_grandes(self, n=10):
+        """[(tamaño, nombre)] de los 'n' archivos más grandes."""
+        with self.lock:
+            return self.catalogo.largest(n)
+
+    def get_lista_archivos(self):
+        """[(nombre, tamaño, fecha)] de todos los archivos, por nombre."""
+        with self.lock:
+            return [(nombre, self.catalogo.files[nombre].size, self.catalogo.files[nombre].date)
+                    for nombre in self.catalogo.names]
 
     def get_lista_archivos_formateada(self):
-        lista = []
-        for nombre, data in self.file_table.items():
-            kb_size = data['size'] / 1024
-            fecha_str = data.get('date', 'N/A')
-            lista.append(f"{nombre:<30} {fecha_str:<15} {kb_size:,.0f} KB")
-        return lista
+        return [f"{nombre:<30} {date:<15} {size / 1024:,.0f} KB"
+                for nombre, size, date in self.get_lista_archivos()]
 
     def add_file_entry(self, nombre_original, size, block_map):
-        self.file_table[nombre_original] = {
+        """
+        Añade el archivo, o reemplaza la versión anterior. Devuelve las
+        entradas de bloques de esa versión que ya no usa ningún archivo
+        (vacía si el archivo es nuevo).
+        """
+        data = {
             'size': size,
             'date': datetime.now().strftime("%d/%m/%Y"),
             'blocks': block_map
         }
+        with self.lock:
+            sin_referencias = self._registrar_op("add", nombre_original, data)
+        self._esperar_disco()
+        return sin_referencias
         
     def remove_file_entry(self, nombre_original):
-        if nombre_original in self.file_table:
-            entry = self.file_table.pop(nombre_original)
-            return entry['blocks']
-        return []
+        """
+        Quita el archivo de la tabla. Devuelve solo las entradas de bloques
+        que ningún otro archivo referencia (las que se pueden borrar de los
+        nodos), o None si el archivo no existía.
+        """
+        with self.lock:
+            if nombre_original not in self.catalogo:
+                return None
+            sin_referencias = self._registrar_op("remove", nombre_original)
+        self._esperar_disco()
+        return sin_referencias
+
+    def mover_replicas(self, cambios):
+        """
+        Cambia nodos de bloques ya guardados en todos los archivos que los
+        usan. 'cambios' es {bloque: {nodo_viejo: nodo_nuevo}} (ver
+        Repair.py). Cada archivo afectado genera una operación 'replicas'
+        que solo se aplica sobre la versión en la que se calculó: si otro
+        nodo sube entretanto una versión nueva, el cambio se descarta en
+        lugar de resucitar la anterior. Devuelve cuántos archivos cambiaron.
+        """
+        with self.lock:
+            ops = []
+            for nombre, registro in self.catalogo.files.items():
+                bloques = {}
+                for bloque in registro.blocks:
+                    reemplazos = cambios.get(bloque.name)
+                    if reemplazos is None or bloque.name in bloques:
+                        continue
+                    addrs = [self.catalogo.nodes.addr(node_id) for node_id in bloque.nodes]
+                    bloques[bloque.name] = [reemplazos.get(addr, addr) for addr in addrs]
+                if bloques:
+                    ops.append((nombre, {"version": self.stamps.get(nombre), "blocks": bloques}))
+            for nombre, data in ops:
+                self._registrar_op("replicas", nombre, data)
+        self._esperar_disco()
+        return len(ops)
+
+    # --- Registro de operaciones y sincronización por deltas ---
+
+    def _reemplazar_archivo(self, nombre, nuevo):
+        """
+        Pone 'nuevo' (o nada, si es None) como contenido de 'nombre' y
+        devuelve los bloques de la versión anterior que quedaron sin uso.
+        """
+        return self.catalogo.put(nombre, nuevo)
+
+    def _registrar_op(self, tipo, nombre, data=None):
+        self.clock += 1
+        op = {"origin": self.origin, "seq": self.vector.get(self.origin, 0) + 1,
+              "ts": self.clock, "op": tipo, "name": nombre}
+        if tipo == "replicas":
+            op.update(data)
+        elif data is not None:
+            op["file"] = data
+        return self._aplicar_op(op)
+
+    def _aplicar_op(self, op, registrar=True):
+        """
+        Anota una operación (local o remota) y la aplica si es la más
+        reciente para su archivo. Con 'registrar' se escribe además en el
+        WAL (no al reproducirlo durante el arranque).
+        """
+        if registrar and self.store is not None:
+            self._ultimo_registro = self.store.append(op)
+
+        self.vector[op["origin"]] = op["seq"]
+        self.clock = max(self.clock, op["ts"])
+        self.oplog.append(op)
+        while len(self.oplog) > METADATA_OPLOG_MAX:
+            vieja = self.oplog.popleft()
+            self.truncated[vieja["origin"]] = max(self.truncated.get(vieja["origin"], 0), vieja["seq"])
+
+        sin_referencias = []
+        stamp = [op["ts"], op["origin"]]
+        if op["op"] == "replicas":
+            # No es una versión nueva del archivo: no cambia su marca
+            if self.stamps.get(op["name"]) == op["version"]:
+                self.catalogo.set_block_nodes(op["name"], op["blocks"])
+        elif _stamp_key(stamp) > _stamp_key(self.stamps.get(op["name"])):
+            self.stamps[op["name"]] = stamp
+            sin_referencias = self._reemplazar_archivo(
+                op["name"], op.get("file") if op["op"] == "add" else None)
+
+        if registrar and self.store is not None and self.store.registros_wal >= METADATA_SNAPSHOT_EVERY:
+            self._compactar()
+        return sin_referencias
+
+    def get_vector(self):
+        with self.lock:
+            return dict(self.vector)
+
+    def tiene_pendientes(self, vector):
+        """True si este nodo conoce operaciones que el dueño de 'vector' no tiene."""
+        with self.lock:
+            return any(seq > vector.get(origen, 0) for origen, seq in self.vector.items())
+
+    def ops_desde(self, vector):
+        """
+        Operaciones posteriores a 'vector', o None si el registro ya no
+        conserva alguna de ellas (hace falta una instantánea).
+        """
+        with self.lock:
+            for origen, truncado in self.truncated.items():
+                if vector.get(origen, 0) < truncado:
+                    return None
+            return [op for op in self.oplog if op["seq"] > vector.get(op["origin"], 0)]
+
+    def snapshot(self):
+        with self.lock:
+            return {"files": self.catalogo.to_dict(), "stamps": dict(self.stamps),
+                    "vector": dict(self.vector), "clock": self.clock}
+
+    def delta_para(self, vector):
+        """
+        Lo que hay que enviar a un nodo cuyo vector es 'vector':
+        {"ops": [...]} o, si está demasiado atrasado, {"snapshot": {...}}.
+        Con vector desconocido (None) se envía un delta vacío para conocerlo.
+        """
+        if vector is None:
+            return {"ops": []}
+        ops = self.ops_desde(vector)
+        if ops is None:
+            return {"snapshot": self.snapshot()}
+        return {"ops": ops}
+
+    def apply_delta(self, delta):
+        """
+        Aplica un delta recibido de otro nodo. Devuelve (cambió_la_tabla, hueco):
+        'hueco' indica que faltan operaciones anteriores y no se aplicaron
+        las que venían después de ellas.
+        """
+        with self.lock:
+            if "snapshot" in delta:
+                return self._fusionar_snapshot(delta["snapshot"]), False
+
+            cambio = False
+            hueco = False
+            for op in delta.get("ops", []):
+                ultimo = self.vector.get(op["origin"], 0)
+                if op["seq"] <= ultimo:
+                    continue # Ya aplicada
+                if op["seq"] > ultimo + 1:
+                    hueco = True
+                    continue
+                antes = self.stamps.get(op["name"])
+                self._aplicar_op(op)
+                cambio = cambio or op["op"] == "replicas" or self.stamps.get(op["name"]) != antes
+        # Se confirma al emisor solo cuando las operaciones están en disco
+        self._esperar_disco()
+        return cambio, hueco
+
+    def _fusionar_snapshot(self, snap):
+        """Fusiona una instantánea archivo por archivo (gana la marca más reciente)."""
+        cambio = False
+        for nombre, stamp in snap.get("stamps", {}).items():
+            if _stamp_key(stamp) > _stamp_key(self.stamps.get(nombre)):
+                self.stamps[nombre] = stamp
+                self._reemplazar_archivo(nombre, snap["files"].get(nombre))
+                cambio = True
+        for origen, seq in snap.get("vector", {}).items():
+            if seq > self.vector.get(origen, 0):
+                self.vector[origen] = seq
+                # Esas operaciones llegaron dentro de la instantánea y no están
+                # en nuestro registro: a quien las pida habrá que darle otra.
+                self.truncated[origen] = max(self.truncated.get(origen, 0), seq)
+        self.clock = max(self.clock, snap.get("clock", 0))
+        # La fusión no genera operaciones para el WAL: se guarda el estado entero
+        if self.store is not None:
+            self._compactar()
+        return cambio
+
+    # --- Persistencia (WAL + instantáneas) ---
+
+    def _esperar_disco(self):
+        """Espera a que la última operación escrita en el WAL llegue a disco."""
+        if self.store is not None:
+            self.store.wait_durable(self._ultimo_registro)
+
+    def _compactar(self):
+        """
+        Escribe una instantánea y vacía el WAL, y quita del registro de
+        bloques locales los que ya no sirven (ver _bloque_vigente). Se llama
+        con self.lock tomado.
+        """
+        self.store.write_snapshot({"origin": self.origin, "files": self.catalogo.to_dict(),
+                                   "stamps": self.stamps, "vector": self.vector,
+                                   "clock": self.clock})
+        self.store.compact_blocks(self._bloque_vigente)
+
+    def _bloque_vigente(self, registro):
+        """
+        True si el registro de bloque local 'registro' sigue describiendo
+        la tabla: su archivo existe con el mismo tamaño, usa el bloque y
+        la tabla lo sitúa en este nodo. Un bloque que ningún archivo
+        conocido usa (subida en curso, o metadatos que aún no llegaron) se
+        conserva mientras siga en disco.
+        """
+        nombre_bloque = registro["block"]
+        if not self.catalogo.block_refs.get(nombre_bloque):
+            return os.path.isfile(self.get_local_storage_path(nombre_bloque))
+        archivo = self.catalogo.files.get(registro["file"])
+        if archivo is None or archivo.size != registro["file_size"]:
+            return False
+        pista = self.catalogo.block_file.get(nombre_bloque, (None, 0))[0]
+        if pista != registro["file"] and registro["file"] not in self.catalogo.block_otros.get(nombre_bloque, {}):
+            return False
+        node_id = self.catalogo.nodes.lookup(self.host_addr)
+        return nombre_bloque in self.catalogo.node_blocks.get(node_id, {})
+
+    def _cargar(self):
+        """Restaura la última instantánea y reaplica las operaciones del WAL."""
+        snap, ops = self.store.load()
+        with self.lock:
+            if snap is not None:
+                self.origin = snap["origin"]
+                self._reindexar(snap["files"])
+                self.stamps = snap["stamps"]
+                self.vector = snap["vector"]
+                self.clock = snap["clock"]
+                # El registro de operaciones no se guarda en la instantánea:
+                # a un nodo que aún no las tenga se le enviará la tabla completa.
+                self.truncated = dict(self.vector)
+            for op in ops:
+                if op["seq"] > self.vector.get(op["origin"], 0):
+                    self._aplicar_op(op, registrar=False)
+
+    def registrar_bloque_recibido(self, nombre_bloque, ref, size):
+        """
+        Anota a qué archivo pertenece un bloque recién guardado en este nodo.
+        'ref' es {"file", "file_size", "offsets", "size", "crc"} tal como
+        lo envía el cliente; 'size' son los bytes guardados, que en un bloque
+        comprimido no coinciden con ref["size"].
+        """
+        if self.store is not None:
+            self.store.record_block(nombre_bloque, ref["file"], ref["file_size"],
+                                    ref["offsets"], ref.get("size", size), size, ref.get("crc"))
+
+    def reconstruir_desde_bloques(self):
+        """
+        Reconstruye la tabla a partir de los bloques guardados en este nodo
+        cuando no hay metadatos (directorio de metadatos borrado o nodo
+        nuevo con bloques antiguos). Solo se recuperan los archivos cuyos
+        bloques están todos aquí; el resto llega de los demás nodos al
+        sincronizar. Devuelve los nombres recuperados.
+        """
+        archivos = {}
+        for registro in self.store.block_records():
+            ruta = self.get_local_storage_path(registro["block"])
+            if not os.path.isfile(ruta) or os.path.getsize(ruta) != registro.get("stored", registro["size"]):
+                continue
+            # Si el archivo se subió varias veces vale la versión más reciente
+            clave = registro["file"]
+            if archivos.get(clave, {}).get("file_size") != registro["file_size"]:
+                archivos[clave] = {"file_size": registro["file_size"], "offsets": {}, "mtime": 0}
+            info = archivos[clave]
+            for offset in registro["offsets"]:
+                info["offsets"][offset] = (registro["block"], registro["size"], registro.get("crc"))
+            info["mtime"] = max(info["mtime"], os.path.getmtime(ruta))
+
+        recuperados = []
+        with self.lock:
+            for nombre, info in archivos.items():
+                block_map = []
+                posicion = 0
+                for offset in sorted(info["offsets"]):
+                    nombre_bloque, size, crc = info["offsets"][offset]
+                    if offset != posicion:
+                        break
+                    attrs = {"offset": offset, "size": size}
+                    if codec_de_bloque(nombre_bloque):
+                        attrs["codec"] = codec_de_bloque(nombre_bloque)
+                    if crc is not None:
+                        attrs["crc"] = crc
+                    block_map.append(crear_entrada_bloque(nombre_bloque, [self.host_addr], **attrs))
+                    posicion += size
+                if posicion != info["file_size"]:
+                    print(f"No se pudo reconstruir {nombre}: faltan bloques en este nodo")
+                    continue
+                data = {'size': info["file_size"],
+                        'date': datetime.fromtimestamp(info["mtime"]).strftime("%d/%m/%Y"),
+                        'blocks': block_map}
+                self._registrar_op("add", nombre, data)
+                recuperados.append(nombre)
+        self._esperar_disco()
+        if recuperados:
+            print(f"Metadatos reconstruidos desde los bloques locales: {len(recuperados)} archivo(s)")
+        return recuperados
+
+    def close(self):
+        """Guarda una instantánea final para que el próximo arranque no reproduzca el WAL."""
+        if self.store is not None:
+            with self.lock:
+                self._compactar()
+            self.store.close()
 
     def get_file_blocks(self, nombre_original):
-        return self.file_table.get(nombre_original, {}).get('blocks', [])
+        with self.lock:
+            registro = self.catalogo.files.get(nombre_original)
+            if registro is None:
+                return []
+            return [self.catalogo.encode_block(b) for b in registro.blocks]
+
+    def get_file_size(self, nombre_original):
+        registro = self.catalogo.files.get(nombre_original)
+        return registro.size if registro is not None else None
 
     def get_file_attributes(self, nombre_original):
-        if nombre_original not in self.file_table:
-            return "Archivo no encontrado."
-            
-        data = self.file_table[nombre_original]
-        info = f"Atributos de: {nombre_original}\n"
-        info += f"Tamaño: {data['size'] / 1024:,.0f} KB\n"
-        info += "Ubicación de Bloques:\n"
-        
-        for i, (nombre_bloque, original_addr, copia_addr) in enumerate(data['blocks']):
-            info += f"  - Bloque {i+1} ({nombre_bloque}):\n"
-            info += f"    - Original: {original_addr[0]}:{original_addr[1]}\n"
-            info += f"    - Copia:    {copia_addr[0]}:{copia_addr[1]}\n"
-        return info
+        with self.lock:
+            registro = self.catalogo.files.get(nombre_original)
+            if registro is None:
+                return "Archivo no encontrado."
+
+            addr = self.catalogo.nodes.addr
+            partes = [f"Atributos de: {nombre_original}",
+                      f"Tamaño: {registro.size / 1024:,.0f} KB",
+                      "Ubicación de Bloques:"]
+            for i, bloque in enumerate(registro.blocks):
+                original_addr = addr(bloque.nodes[0])
+                copia_addr = addr(bloque.nodes[1 if len(bloque.nodes) > 1 else 0])
+                partes.append(f"  - Bloque {i+1} ({bloque.name}):")
+                ec = bloque.extra.get('ec') if bloque.extra else None
+                if ec is not None:
+                    # Erasure coding: una sola copia de cada pieza
+                    tipo = "paridad" if es_paridad(bloque.extra) else "datos"
+                    partes.append(f"    - Nodo:     {original_addr[0]}:{original_addr[1]}")
+                    partes.append(f"    - Franja {ec['stripe'] + 1}, pieza {ec['index'] + 1} de "
+                                  f"{ec['k'] + ec['m']} ({tipo}, {ec['scheme']} {ec['k']}+{ec['m']})")
+                    continue
+                partes.append(f"    - Original: {original_addr[0]}:{original_addr[1]}")
+                partes.append(f"    - Copia:    {copia_addr[0]}:{copia_addr[1]}")
+                for node_id in bloque.nodes[2:]:
+                    extra_addr = addr(node_id)
+                    partes.append(f"    - Réplica:  {extra_addr[0]}:{extra_addr[1]}")
+                if bloque.extra and bloque.extra.get('codec'):
+                    partes.append(f"    - Compresión: {bloque.extra['codec']}")
+            return "\n".join(partes) + "\n"
 
     def get_block_table_content(self):
-        if not self.file_table:
-            return "La Tabla de Bloques está vacía."
-            
-        info = "=== TABLA de BLOQUES (Vista de Archivos) ===\n"
-        for nombre_archivo, data in self.file_table.items():
-            info += f"\nArchivo: {nombre_archivo}\n"
-            for nombre_bloque, original, copia in data['blocks']:
-                # Mostramos solo el puerto para que sea más legible
-                info += f"  -> {nombre_bloque} @ ({original[1]}, {copia[1]})\n"
-        return info
+        with self.lock:
+            if not len(self.catalogo):
+                return "La Tabla de Bloques está vacía."
 
-    def get_nodos_para_bloque(self, n=2):
+            addr = self.catalogo.nodes.addr
+            partes = ["=== TABLA de BLOQUES (Vista de Archivos) ==="]
+            for nombre_archivo in self.catalogo.names:
+                partes.append(f"\nArchivo: {nombre_archivo}")
+                for bloque in self.catalogo.files[nombre_archivo].blocks:
+                    # Mostramos solo el puerto para que sea más legible
+                    puertos = ", ".join(str(addr(node_id)[1]) for node_id in bloque.nodes)
+                    partes.append(f"  -> {bloque.name} @ ({puertos}) "
+                                  f"refs={self.get_block_refs(bloque.name)}")
+            return "\n".join(partes) + "\n"
+
+    def get_nodos_para_bloque(self, n=REPLICATION_FACTOR):
         """
-        *** FUNCIÓN CORREGIDA ***
-        Selecciona 'n' nodos aleatorios de la lista COMPLETA.
+        Selecciona 'n' nodos aleatorios y distintos de la lista COMPLETA.
+        Si hay menos nodos que 'n', se usan todos los que existan.
         """
         
         # 1. Obtener la lista COMPLETA de nodos, incluyéndonos.
@@ -145,25 +728,18 @@ class MetadataManager:
             # No hay nodos definidos
             return []
             
-        # 2. Caso borde: Si pedimos 2 nodos pero solo hay 1 (o menos)
-        if len(lista_nodos) < n:
-            # Devolvemos el único nodo que existe, duplicado.
-            return [lista_nodos[0]] * n
+        # 2. Caso borde: Si solo hay 1 nodo, una segunda copia en el mismo
+        #    nodo no protege de nada: se devuelve una sola vez.
+        if len(lista_nodos) == 1:
+            return [lista_nodos[0]]
             
-        # 3. Seleccionar 'n' nodos DIFERENTES aleatoriamente
-        #    de la lista completa.
+        # 3. Seleccionar nodos DIFERENTES aleatoriamente de la lista completa.
         #    random.sample() garantiza que no se repitan (sin reemplazo).
-        return random.sample(lista_nodos, n)
-
-    def set_file_table(self, new_table_json):
-        try:
-            self.file_table = json.loads(new_table_json)
-            return True
-        except json.JSONDecodeError:
-            return False
+        return random.sample(lista_nodos, min(n, len(lista_nodos)))
 
     def get_file_table_json(self):
-        return json.dumps(self.file_table)
+        with self.lock:
+            return json.dumps(self.catalogo.to_dict())
 
     def get_local_storage_path(self, nombre_bloque):
         return os.path.join(self.storage_dir, nombre_bloque)
\ No newline at end of file
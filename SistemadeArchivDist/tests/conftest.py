@@ -0,0 +1,81 @@
+# conftest.py
+#
+# Los módulos del sistema se importan por su nombre (from Config import ...),
+# como cuando se ejecutan desde SistemadeArchivDist/.
+
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def puerto_libre():
+    """Un puerto TCP libre en 127.0.0.1 (lo elige el sistema)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def nodos(tmp_path, monkeypatch):
+    """
+    Arranca NodeServers en 127.0.0.1, cada uno en su hilo y con su
+    almacenamiento en tmp_path. nodos(n, **opciones) devuelve los n
+    servidores nuevos (las opciones van a NodeServer). nodos.parar(servidor)
+    para uno y espera a que su hilo termine: stop() solo lo pide, y hasta
+    entonces el nodo aún puede aceptar conexiones. Mientras dura la
+    prueba, NODOS_CONOCIDOS contiene solo estos nodos; al terminar se
+    paran y se restaura.
+    """
+    from Config import NODOS_CONOCIDOS
+    from Server import NodeServer
+    from Utils import MetadataManager
+
+    monkeypatch.chdir(tmp_path)
+    previos = dict(NODOS_CONOCIDOS)
+    NODOS_CONOCIDOS.clear()
+    arrancados = []
+    hilos = {}
+
+    def arrancar(n=1, **opciones):
+        nuevos = []
+        for _ in range(n):
+            port = puerto_libre()
+            metadata_manager = MetadataManager(f"nodo_{port}", "127.0.0.1", port, persistir=False)
+            servidor = NodeServer("127.0.0.1", port, metadata_manager, on_log=lambda mensaje: None,
+                                  **opciones)
+            hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+            hilo.start()
+            servidor.ready.wait()
+            NODOS_CONOCIDOS[f"nodo{port}"] = ("127.0.0.1", port)
+            arrancados.append((servidor, hilo))
+            hilos[servidor] = hilo
+            nuevos.append(servidor)
+        return nuevos
+
+    def parar(servidor):
+        servidor.stop()
+        hilos[servidor].join(5)
+
+    arrancar.parar = parar
+    yield arrancar
+    for servidor, hilo in arrancados:
+        servidor.stop()
+        hilo.join(5)
+    NODOS_CONOCIDOS.clear()
+    NODOS_CONOCIDOS.update(previos)
+
+
+@pytest.fixture
+def cliente():
+    """Un DFSClient sin caché, para que cada lectura llegue al nodo."""
+    from Cache import BlockCache
+    from Network import DFSClient
+
+    dfs_client = DFSClient(cache=BlockCache(memory_bytes=0, disk_bytes=0))
+    yield dfs_client
+    dfs_client.close()
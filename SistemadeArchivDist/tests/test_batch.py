@@ -0,0 +1,92 @@
+# test_batch.py
+#
+# Comandos por lotes (UPLOAD_BLOCKS, STAT_BLOCKS, DELETE_BLOCKS) contra
+# NodeServers reales (fixture 'nodos').
+
+import builtins
+import os
+import socket
+
+import Network
+import Server
+from Protocol import (OP_PING, OP_UPLOAD_BLOCKS, STATUS_BAD_REQUEST, STATUS_OK, build_message,
+                      recv_message)
+from Utils import crc_bloque, hash_bloque
+
+_open = builtins.open
+
+
+def direccion(servidor):
+    return (servidor.host, servidor.port)
+
+
+def lote(n, size=2000):
+    """[(nombre, bytes, ref)] de 'n' bloques distintos, con su CRC."""
+    bloques = []
+    for _ in range(n):
+        data = os.urandom(size)
+        bloques.append((hash_bloque(data), data, {"crc": crc_bloque(data)}))
+    return bloques
+
+
+def test_subida_consulta_y_borrado_por_lotes(nodos, cliente, monkeypatch):
+    servidor, = nodos()
+    addr = direccion(servidor)
+    bloques = lote(30)
+    assert cliente.upload_blocks(addr, bloques) == {nombre for nombre, _, _ in bloques}
+
+    # Más nombres que BATCH_MAX_BLOCKS: varias peticiones en paralelo
+    monkeypatch.setattr(Network, "BATCH_MAX_BLOCKS", 7)
+    nombres = [nombre for nombre, _, _ in bloques] + ["f" * 64]
+    assert cliente.stat_blocks({addr: nombres}) == {addr: {nombre: 2000 for nombre, _, _ in bloques}}
+
+    confirmados = cliente.delete_blocks({addr: nombres[:10] + ["f" * 64]})
+    assert confirmados == {addr: set(nombres[:10] + ["f" * 64])}
+    assert set(cliente.stat_blocks({addr: nombres})[addr]) == set(nombres[10:30])
+    assert servidor.used_bytes == 20 * 2000
+
+
+def test_fallo_parcial_dentro_de_un_lote(nodos, cliente, monkeypatch):
+    servidor, = nodos()
+    addr = direccion(servidor)
+    bloques = lote(6, size=100_000)
+    sin_disco = bloques[2][0]
+    corrupto = bloques[4][0]
+    bloques[4] = (corrupto, bloques[4][1], {"crc": bloques[4][2]["crc"] ^ 1})
+
+    def disco_lleno(ruta, *args, **kwargs):
+        if sin_disco in str(ruta) and str(ruta).endswith(".part"):
+            raise OSError(28, "No space left on device")
+        return _open(ruta, *args, **kwargs)
+    monkeypatch.setattr(Server, "open", disco_lleno, raising=False)
+
+    guardados = cliente.upload_blocks(addr, bloques)
+    assert guardados == {nombre for nombre, _, _ in bloques} - {sin_disco, corrupto}
+    existentes = cliente.stat_blocks({addr: [nombre for nombre, _, _ in bloques]})[addr]
+    assert set(existentes) == guardados
+    assert servidor.used_bytes == 4 * 100_000
+    assert not [n for n in os.listdir(servidor.metadata_manager.storage_dir) if n.endswith(".part")]
+
+
+def test_lote_mal_formado_no_desincroniza_la_conexion(nodos):
+    servidor, = nodos()
+    with socket.create_connection(direccion(servidor), timeout=5) as sock:
+        # Los tamaños no suman el cuerpo: se rechaza y el cuerpo se descarta
+        args = {"blocks": [{"name": "a" * 64, "size": 10}]}
+        sock.sendall(build_message(OP_UPLOAD_BLOCKS, args, os.urandom(500_000), request_id=1)
+                     + build_message(OP_PING, request_id=2))
+        assert recv_message(sock).status == STATUS_BAD_REQUEST
+        respuesta = recv_message(sock)
+        assert (respuesta.request_id, respuesta.status) == (2, STATUS_OK)
+
+
+def test_nodo_sin_respuesta_queda_vacio(nodos, cliente):
+    servidor, = nodos()
+    caido = ("127.0.0.1", 1)
+    bloques = lote(3)
+    cliente.upload_blocks(direccion(servidor), bloques)
+    nombres = [nombre for nombre, _, _ in bloques]
+    existentes = cliente.stat_blocks({direccion(servidor): nombres, caido: nombres})
+    assert existentes[caido] == {} and len(existentes[direccion(servidor)]) == 3
+    assert cliente.upload_blocks(caido, bloques) == set()
+    assert cliente.delete_blocks({caido: nombres}) == {caido: set()}
@@ -0,0 +1,180 @@
+# test_cache.py
+#
+# Caché de bloques del cliente (BlockCache) y de bloques calientes del
+# servidor (HotBlockCache), solas y con NodeServers reales (fixture 'nodos').
+
+import asyncio
+import os
+import time
+
+import Cache
+from Cache import BlockCache, HotBlockCache
+from Compression import comprimir, nombre_almacenado
+from Network import DFSClient
+from Transfer import BlockFetcher
+from Utils import crear_entrada_bloque, hash_bloque
+
+
+def bloque(n=1000):
+    data = os.urandom(n)
+    return hash_bloque(data), data
+
+
+# --- 1. BlockCache ---
+
+def test_memoria_expulsa_el_menos_reciente():
+    cache = BlockCache(memory_bytes=2500, disk_bytes=0)
+    (a, da), (b, db), (c, dc) = bloque(), bloque(), bloque()
+    cache.put(a, da)
+    cache.put(b, db)
+    assert cache.get(a) == da
+    cache.put(c, dc)
+    assert cache.get(b) is None
+    assert cache.get(a) == da and cache.get(c) == dc
+    assert cache.stats()["memory_bytes"] == 2000
+
+
+def test_disco_guarda_lo_que_sale_de_memoria_y_sobrevive(tmp_path):
+    cache = BlockCache(memory_bytes=1000, disk_bytes=10_000, disk_dir=str(tmp_path))
+    (a, da), (b, db) = bloque(), bloque()
+    cache.put(a, da)
+    cache.put(b, db)
+    assert cache.get(a) == da
+    assert cache.stats()["hits"]["disk"] == 1
+
+    otra = BlockCache(memory_bytes=0, disk_bytes=10_000, disk_dir=str(tmp_path))
+    assert otra.get(b) == db
+    assert otra.stats()["disk_bytes"] == 2000
+
+
+def test_disco_corrupto_se_descarta(tmp_path):
+    cache = BlockCache(memory_bytes=0, disk_bytes=10_000, disk_dir=str(tmp_path))
+    a, da = bloque()
+    cache.put(a, da)
+    with open(tmp_path / a, 'r+b') as f:
+        f.write(b"X")
+    assert cache.get(a) is None
+    assert not (tmp_path / a).exists()
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_nombres_que_no_son_hash_no_se_cachean():
+    cache = BlockCache(memory_bytes=10_000, disk_bytes=0)
+    cache.put("archivo_b0.bin", b"datos")
+    assert cache.get("archivo_b0.bin") is None
+
+
+def test_replica_local_comprimida_se_lee_del_almacenamiento(tmp_path):
+    data = b"abc" * 10_000
+    nombre = nombre_almacenado(hash_bloque(data), "zlib")
+    (tmp_path / nombre).write_bytes(comprimir("zlib", data))
+    cache = BlockCache(memory_bytes=0, disk_bytes=0, local_addr=("127.0.0.1", 1),
+                       local_dir=str(tmp_path))
+    assert cache.get(nombre, [("127.0.0.1", 1)]) == data
+    assert cache.get(nombre, [("127.0.0.1", 2)]) is None
+    assert cache.stats()["hits"]["local"] == 1
+
+
+# --- 2. Delante de un nodo ---
+
+def test_segunda_lectura_no_llega_al_nodo(nodos):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    dfs_client = DFSClient(cache=BlockCache(memory_bytes=1024 * 1024, disk_bytes=0))
+    try:
+        nombre, data = bloque(100_000)
+        assert dfs_client.upload_block([addr], nombre, data)
+        fetcher = BlockFetcher(dfs_client, on_log=lambda m: None)
+        assert fetcher.fetch(nombre, [addr]) == data
+        # Sin el nodo, el bloque sigue saliendo de la caché
+        servidor.stop()
+        assert fetcher.fetch(nombre, [addr]) == data
+        assert fetcher.fetch(nombre, [addr], 10, 20) == data[10:30]
+        assert dfs_client.cache.stats()["hits"]["memory"] == 2
+    finally:
+        dfs_client.close()
+
+
+def test_bloque_de_este_nodo_no_usa_la_red(nodos):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    cache = BlockCache(memory_bytes=0, disk_bytes=0, local_addr=addr,
+                       local_dir=servidor.metadata_manager.storage_dir)
+    dfs_client = DFSClient(cache=cache)
+    try:
+        nombre, data = bloque(100_000)
+        assert dfs_client.upload_block([addr], nombre, data)
+        servidor.stop()
+        assert BlockFetcher(dfs_client, on_log=lambda m: None).fetch(nombre, [addr]) == data
+        assert cache.stats()["hits"]["local"] == 1
+    finally:
+        dfs_client.close()
+
+
+# --- 3. Caché de bloques calientes del servidor ---
+
+def test_lecturas_simultaneas_comparten_una_del_disco(tmp_path, monkeypatch):
+    ruta = tmp_path / "bloque"
+    ruta.write_bytes(b"x" * 1000)
+    lecturas = []
+    leer = Cache._leer_bloque
+
+    def contar(ruta):
+        lecturas.append(ruta)
+        time.sleep(0.05)
+        return leer(ruta)
+    monkeypatch.setattr(Cache, "_leer_bloque", contar)
+
+    async def probar():
+        cache = HotBlockCache(budget=10_000)
+        vistas = await asyncio.gather(*(cache.get("b", str(ruta)) for _ in range(10)))
+        assert all(bytes(v) == b"x" * 1000 for v in vistas)
+        assert await cache.get("b", str(ruta)) is vistas[0]
+        return cache.stats()
+
+    stats = asyncio.run(probar())
+    assert len(lecturas) == 1
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 9, 1)
+
+
+def test_caliente_respeta_el_presupuesto_e_invalida(tmp_path):
+    for nombre in "abc":
+        (tmp_path / nombre).write_bytes(nombre.encode() * 400)
+
+    async def probar():
+        cache = HotBlockCache(budget=1000)
+        for nombre in "abc":
+            await cache.get(nombre, str(tmp_path / nombre))
+        assert "a" not in cache and "b" in cache and "c" in cache
+        # Un bloque invalidado mientras se lee no se guarda
+        carga = asyncio.ensure_future(cache.get("a", str(tmp_path / "a")))
+        await asyncio.sleep(0)
+        cache.invalidate("a")
+        assert bytes(await carga) == b"a" * 400
+        assert "a" not in cache
+        return cache.stats()
+
+    assert asyncio.run(probar())["bytes"] == 800
+
+
+def test_bloque_repetido_sale_de_memoria_y_los_siguientes_se_leen_antes(nodos, cliente):
+    servidor, = nodos(readahead=2)
+    addr = (servidor.host, servidor.port)
+    bloques = [bloque(50_000) for _ in range(4)]
+    for nombre, data in bloques:
+        assert cliente.upload_block([addr], nombre, data)
+    entradas = [crear_entrada_bloque(nombre, [addr], offset=i * 50_000, size=50_000)
+                for i, (nombre, _) in enumerate(bloques)]
+    servidor.metadata_manager.add_file_entry("f.bin", 200_000, entradas)
+
+    assert cliente.request_block(addr, bloques[0][0]) == bloques[0][1]
+    assert cliente.request_block(addr, bloques[0][0]) == bloques[0][1]
+    # Los dos siguientes del archivo llegan a la caché sin pedirlos
+    limite = time.monotonic() + 5
+    while servidor.block_cache.stats()["blocks"] < 3:
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+    assert all(nombre in servidor.block_cache for nombre, _ in bloques[1:3])
+    assert bloques[3][0] not in servidor.block_cache
+    assert cliente.request_block(addr, bloques[1][0]) == bloques[1][1]
+    assert servidor.block_cache.stats()["hits"] == 2
@@ -0,0 +1,110 @@
+# test_catalog.py
+
+from Catalog import Catalog
+
+A, B, C, D = ("h", 1), ("h", 2), ("h", 3), ("h", 4)
+
+
+def _archivo(bloques, size=100):
+    """bloques: [(nombre, [addrs], tamaño)] -> formato de la red."""
+    entradas, offset = [], 0
+    for nombre, addrs, tamano in bloques:
+        attrs = {"offset": offset, "size": tamano, "crc": len(nombre)}
+        if len(addrs) > 2:
+            attrs["replicas"] = addrs[2:]
+        entradas.append([nombre, addrs[0], addrs[1], attrs])
+        offset += tamano
+    return {"size": size, "date": "hoy", "blocks": entradas}
+
+
+def _nombres(sin_referencias):
+    return sorted(entrada[0] for entrada in sin_referencias)
+
+
+def test_formato_de_la_red_ida_y_vuelta():
+    c = Catalog()
+    data = _archivo([("x", [A, B, C], 10), ("y", [B, C], 5)], 15)
+    c.put("f", data)
+    assert c.to_dict()["f"] == {"size": 15, "date": "hoy", "blocks": [
+        ["x", A, B, {"crc": 1, "offset": 0, "size": 10, "replicas": [C]}],
+        ["y", B, C, {"crc": 1, "offset": 10, "size": 5}]]}
+
+
+def test_referencias_de_bloques_compartidos():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 10), ("y", [A, B], 10)]))
+    c.put("b", _archivo([("x", [A, B], 10)]))
+    assert c.block_refs == {"x": 2, "y": 1}
+    assert _nombres(c.put("a", None)) == ["y"]
+    assert c.block_refs == {"x": 1}
+    assert _nombres(c.put("b", None)) == ["x"]
+    assert c.block_refs == {} and c.block_nodes == {}
+
+
+def test_bloque_repetido_en_un_archivo_cuenta_una_vez():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 10), ("x", [A, B], 10)]))
+    assert c.block_refs == {"x": 1}
+    assert c.bytes_on_node(A) == 10
+    assert _nombres(c.put("a", None)) == ["x"]
+    assert c.bytes_on_node(A) == 0
+
+
+def test_reemplazo_no_libera_bloques_que_siguen_en_uso():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 10), ("y", [A, B], 10)]))
+    assert _nombres(c.put("a", _archivo([("y", [A, B], 10), ("z", [A, B], 10)]))) == ["x"]
+    assert c.block_refs == {"y": 1, "z": 1}
+    assert c.block_record("y").offset == 0
+
+
+def test_alta_baja_alta_de_un_bloque_compartido():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 10)]))
+    c.put("b", _archivo([("x", [C, D], 10)]))
+    # Al quitar el último archivo que se añadió, las réplicas y la pista
+    # pasan al que sigue usando el bloque
+    c.put("b", None)
+    assert c.block_replicas("x") == [A, B]
+    assert c.block_record("x").extra == {"crc": 1}
+    assert c.block_ref("x") == {"file": "a", "file_size": 100, "offsets": [0], "size": 10}
+    c.put("b", _archivo([("x", [C, D], 10)]))
+    c.put("a", None)
+    assert c.block_replicas("x") == [C, D]
+    assert c.block_ref("x")["file"] == "b"
+    assert c.put("b", None) and c.block_record("x") is None
+
+
+def test_indices_por_nodo():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 10), ("y", [B, C], 7)]))
+    assert sorted(c.blocks_on_node(B)) == ["x", "y"]
+    assert c.bytes_on_node(B) == 17 and c.bytes_on_node(C) == 7
+    assert c.blocks_on_node(D) == []
+    c.set_block_nodes("a", {"y": [B, D]})
+    assert c.blocks_on_node(C) == [] and c.blocks_on_node(D) == ["y"]
+    assert c.bytes_on_node(C) == 0 and c.bytes_on_node(D) == 7
+    assert c.block_replicas("y") == [B, D]
+
+
+def test_orden_por_nombre_y_tamano():
+    c = Catalog()
+    for nombre, size in [("b/2", 30), ("a", 10), ("b/1", 20), ("c", 5)]:
+        c.put(nombre, _archivo([], size))
+    assert c.names == ["a", "b/1", "b/2", "c"]
+    assert c.names_with_prefix("b/") == ["b/1", "b/2"]
+    assert c.largest(2) == [(30, "b/2"), (20, "b/1")]
+    c.put("b/2", None)
+    c.put("d", _archivo([], 50))
+    assert c.names == ["a", "b/1", "c", "d"]
+    assert c.largest(1) == [(50, "d")]
+    assert c.total_size == 85
+
+
+def test_bloques_siguientes():
+    c = Catalog()
+    c.put("a", _archivo([("x", [A, B], 1), ("y", [A, B], 1), ("z", [C, D], 1), ("w", [A, B], 1)]))
+    assert c.next_blocks("x", 2) == ["y", "z"]
+    assert c.next_blocks("x", 3, A) == ["y", "w"]
+    assert c.next_blocks("w", 2) == []
+    assert c.next_blocks("desconocido", 2) == []
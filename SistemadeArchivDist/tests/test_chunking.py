@@ -0,0 +1,90 @@
+# test_chunking.py
+
+import random
+
+import pytest
+
+import Chunking
+from Chunking import WINDOW, calcular_rangos_cdc
+
+MIN, AVG, MAX = 2 * 1024, 8 * 1024, 32 * 1024
+
+
+@pytest.fixture
+def datos():
+    return random.Random(1234).randbytes(1024 * 1024)
+
+
+@pytest.fixture
+def escribir(tmp_path):
+    contador = iter(range(1000))
+
+    def escribir(data):
+        ruta = tmp_path / f"archivo{next(contador)}"
+        ruta.write_bytes(data)
+        return str(ruta)
+    return escribir
+
+
+def _trozos(data, rangos):
+    return [data[offset:offset + size] for offset, size in rangos]
+
+
+def test_rangos_cubren_el_archivo_y_respetan_los_limites(datos, escribir):
+    rangos = calcular_rangos_cdc(escribir(datos), MIN, AVG, MAX)
+    assert rangos[0][0] == 0
+    for (offset, size), (siguiente, _) in zip(rangos, rangos[1:]):
+        assert offset + size == siguiente
+        assert MIN <= size <= MAX
+    assert sum(size for _, size in rangos) == len(datos)
+    # La media queda cerca del tamaño pedido
+    assert AVG / 2 <= len(datos) / len(rangos) <= AVG * 2
+
+
+def test_una_insercion_solo_cambia_los_bloques_cercanos(datos, escribir):
+    antes = set(_trozos(datos, calcular_rangos_cdc(escribir(datos), MIN, AVG, MAX)))
+    editado = datos[:5000] + b"unos bytes nuevos" + datos[5000:]
+    despues = _trozos(editado, calcular_rangos_cdc(escribir(editado), MIN, AVG, MAX))
+    nuevos = [trozo for trozo in despues if trozo not in antes]
+    assert len(nuevos) <= 3
+    assert sum(map(len, nuevos)) < 3 * MAX
+
+
+def test_no_depende_del_tamano_de_lectura(datos, escribir, monkeypatch):
+    ruta = escribir(datos)
+    esperado = calcular_rangos_cdc(ruta, MIN, AVG, MAX)
+    # Tramos pequeños: muchos cortes caen en la frontera entre dos lecturas
+    monkeypatch.setattr(Chunking, "_TRAMO", 50_000)
+    monkeypatch.setattr(Chunking, "_TRAMO_SIN_NUMPY", 50_000)
+    assert calcular_rangos_cdc(ruta, MIN, AVG, MAX) == esperado
+
+
+def test_numpy_y_biblioteca_estandar_cortan_igual(datos, escribir, monkeypatch):
+    ruta = escribir(datos[:256 * 1024])
+    Chunking._cargar()
+    if Chunking.np is None:
+        pytest.skip("NumPy no está instalado")
+    con_numpy = calcular_rangos_cdc(ruta, MIN, AVG, MAX)
+    monkeypatch.setattr(Chunking, "np", None)
+    assert calcular_rangos_cdc(ruta, MIN, AVG, MAX) == con_numpy
+
+
+def test_datos_sin_cortes_se_parten_en_el_maximo(escribir):
+    # Con bytes todos iguales el hash es constante: o corta en todas partes
+    # o en ninguna, y en ese caso manda el máximo
+    rangos = calcular_rangos_cdc(escribir(b"\x00" * (100 * 1024)), MIN, AVG, MAX)
+    assert sum(size for _, size in rangos) == 100 * 1024
+    assert all(MIN <= size <= MAX for _, size in rangos[:-1])
+
+
+def test_archivos_pequenos_y_vacios(escribir):
+    assert calcular_rangos_cdc(escribir(b""), MIN, AVG, MAX) == []
+    assert calcular_rangos_cdc(escribir(b"hola"), MIN, AVG, MAX) == [(0, 4)]
+
+
+def test_tamanos_invalidos(escribir):
+    ruta = escribir(b"x")
+    with pytest.raises(ValueError):
+        calcular_rangos_cdc(ruta, WINDOW - 1, AVG, MAX)
+    with pytest.raises(ValueError):
+        calcular_rangos_cdc(ruta, MIN, MAX + 1, MAX)
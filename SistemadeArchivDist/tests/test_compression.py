@@ -0,0 +1,92 @@
+# test_compression.py
+#
+# Compresión adaptativa de bloques: códecs y nombres, y subidas y
+# descargas de bloques comprimidos contra NodeServers reales (fixture 'nodos').
+
+import os
+
+import pytest
+
+from Compression import (CODECS, codec_de_bloque, comprimir, decodificar_bloque, elegir_codec,
+                         nombre_almacenado, nombre_contenido, registrar_codec)
+from Transfer import BlockFetcher, ParallelDownloader, StreamingUploader
+from Utils import MetadataManager, desempaquetar_bloque, hash_bloque
+
+BLOQUE = 512 * 1024
+
+
+# --- 1. Códecs y nombres ---
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma", "bz2"])
+def test_ida_y_vuelta(codec):
+    data = b"linea de texto repetida\n" * 5000
+    nombre = nombre_almacenado(hash_bloque(data), codec)
+    assert codec_de_bloque(nombre) == codec
+    assert nombre_contenido(nombre) == hash_bloque(data)
+    assert decodificar_bloque(nombre, comprimir(codec, data)) == data
+
+
+def test_solo_se_comprime_lo_que_ahorra():
+    assert elegir_codec(b"a" * 10_000, "zlib") == "zlib"
+    assert elegir_codec(os.urandom(10_000), "zlib") is None
+    assert elegir_codec(b"a" * 10_000, None) is None
+
+
+def test_bloque_comprimido_corrupto_lanza_ioerror():
+    nombre = nombre_almacenado(hash_bloque(b"x"), "zlib")
+    with pytest.raises(IOError):
+        decodificar_bloque(nombre, b"no es zlib")
+    # Un sufijo que no es un códec registrado es parte del nombre
+    assert codec_de_bloque("archivo_b0.bin") is None
+
+
+def test_registrar_codec(monkeypatch):
+    monkeypatch.setitem(CODECS, "al_reves", None)
+    registrar_codec("al_reves", lambda d: d[::-1], lambda d: d[::-1])
+    assert decodificar_bloque("h.al_reves", b"abc") == b"cba"
+    with pytest.raises(ValueError):
+        registrar_codec("a.b", bytes, bytes)
+
+
+# --- 2. Contra nodos reales ---
+
+def _subir(cliente, ruta, **opciones):
+    uploader = StreamingUploader(cliente, MetadataManager("cliente", "127.0.0.1", 0, persistir=False),
+                                 replication_factor=1, compression="zlib", block_size=BLOQUE,
+                                 on_log=lambda m: None, **opciones)
+    return uploader.upload(str(ruta))
+
+
+@pytest.mark.parametrize("batch_block_max", [0, BLOQUE])
+def test_bloques_compresibles_se_guardan_comprimidos(nodos, cliente, tmp_path, batch_block_max):
+    # Con batch_block_max 0 cada bloque va en su UPLOAD_BLOCK; con BLOQUE, en lotes
+    servidor, = nodos()
+    texto = (b"registro %08d: todo correcto\n" * 20_000)[:BLOQUE]
+    aleatorio = os.urandom(BLOQUE)
+    data = texto + aleatorio + texto[:1000]
+    ruta = tmp_path / "mixto.bin"
+    ruta.write_bytes(data)
+    _, size, block_map = _subir(cliente, ruta, batch_block_max=batch_block_max)
+
+    codecs = [desempaquetar_bloque(e)[3].get("codec") for e in block_map]
+    assert codecs == ["zlib", None, "zlib"]
+    nombre = desempaquetar_bloque(block_map[0])[0]
+    guardado = servidor.metadata_manager.get_local_storage_path(nombre)
+    assert os.path.getsize(guardado) < BLOQUE // 10
+
+    destino = tmp_path / "copia.bin"
+    ParallelDownloader(cliente).download(block_map, str(destino), size)
+    assert destino.read_bytes() == data
+
+
+def test_rango_de_un_bloque_comprimido(nodos, cliente, tmp_path):
+    servidor, = nodos()
+    data = (b"0123456789" * 60_000)[:BLOQUE]
+    ruta = tmp_path / "texto.bin"
+    ruta.write_bytes(data)
+    _, _, block_map = _subir(cliente, ruta, batch_block_max=0)
+    nombre, replicas = desempaquetar_bloque(block_map[0])[0], [(servidor.host, servidor.port)]
+
+    # Se pide el bloque comprimido entero y se recorta ya descomprimido
+    fetcher = BlockFetcher(cliente, on_log=lambda m: None)
+    assert fetcher.fetch(nombre, replicas, 1000, 50) == data[1000:1050]
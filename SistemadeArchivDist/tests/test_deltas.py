@@ -0,0 +1,122 @@
+# test_deltas.py
+
+import pytest
+
+import Utils
+from Utils import MetadataManager
+
+
+@pytest.fixture
+def nodos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return [MetadataManager(f"n{i}", "127.0.0.1", 50001 + i, persistir=False) for i in range(3)]
+
+
+def _entrada(nombre, puerto=50001):
+    return [[nombre, ["127.0.0.1", puerto], ["127.0.0.1", puerto + 1], {"offset": 0, "size": 10}]]
+
+
+def _sincronizar(origen, destino):
+    """Envía a 'destino' lo que le falta de 'origen'. Devuelve (cambió, hueco)."""
+    return destino.apply_delta(origen.delta_para(destino.get_vector()))
+
+
+def _bloques(mm, nombre):
+    return [entrada[0] for entrada in mm.get_file_blocks(nombre)]
+
+
+def test_delta_lleva_solo_lo_que_falta(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    assert _sincronizar(a, b) == (True, False)
+    a.add_file_entry("y", 10, _entrada("h2"))
+    delta = a.delta_para(b.get_vector())
+    assert [op["name"] for op in delta["ops"]] == ["y"]
+    b.apply_delta(delta)
+    assert b.get_vector() == a.get_vector()
+    assert b.snapshot()["files"] == a.snapshot()["files"]
+
+
+def test_aplicar_dos_veces_no_cambia_nada(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    delta = a.delta_para({})
+    assert b.apply_delta(delta) == (True, False)
+    assert b.apply_delta(delta) == (False, False)
+    assert b.get_block_refs("h1") == 1
+
+
+def test_hueco_no_aplica_operaciones_posteriores(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    a.add_file_entry("y", 10, _entrada("h2"))
+    ops = a.delta_para({})["ops"]
+    assert b.apply_delta({"ops": ops[1:]}) == (False, True)
+    assert b.get_file_size("y") is None
+    assert b.apply_delta({"ops": ops}) == (True, False)
+    assert b.get_vector() == a.get_vector()
+
+
+def test_escrituras_concurrentes_convergen(nodos):
+    a, b, c = nodos
+    a.add_file_entry("x", 10, _entrada("de_a"))
+    b.add_file_entry("x", 10, _entrada("de_b"))
+    # Se entregan en órdenes distintos a cada nodo
+    _sincronizar(a, c)
+    _sincronizar(b, c)
+    _sincronizar(b, a)
+    _sincronizar(a, b)
+    assert _bloques(a, "x") == _bloques(b, "x") == _bloques(c, "x")
+    assert a.get_vector() == b.get_vector() == c.get_vector()
+    # El bloque de la versión perdedora no queda referenciado
+    perdedor = "de_a" if _bloques(a, "x") == ["de_b"] else "de_b"
+    assert a.get_block_refs(perdedor) == 0
+
+
+def test_borrado_posterior_gana_a_un_alta_anterior(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    _sincronizar(a, b)
+    b.remove_file_entry("x")
+    assert _sincronizar(b, a) == (True, False)
+    assert a.get_file_size("x") is None
+    assert a.get_block_refs("h1") == 0
+
+
+def test_nodo_muy_atrasado_recibe_instantanea(nodos, monkeypatch):
+    a, b, _ = nodos
+    monkeypatch.setattr(Utils, "METADATA_OPLOG_MAX", 2)
+    for i in range(5):
+        a.add_file_entry(f"f{i}", i, _entrada(f"h{i}"))
+    delta = a.delta_para(b.get_vector())
+    assert "snapshot" in delta
+    assert b.apply_delta(delta) == (True, False)
+    assert b.snapshot()["files"] == a.snapshot()["files"]
+    assert b.get_vector() == a.get_vector()
+
+
+def test_cambio_de_replicas_sobre_version_vieja_se_descarta(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    _sincronizar(a, b)
+    # 'a' mueve una réplica de la primera versión; entretanto 'b' sube otra
+    a.mover_replicas({"h1": {("127.0.0.1", 50002): ("127.0.0.1", 50009)}})
+    b.add_file_entry("x", 10, _entrada("h1", 50005))
+    _sincronizar(b, a)
+    _sincronizar(a, b)
+    esperado = [["127.0.0.1", 50005], ["127.0.0.1", 50006]]
+    for mm in (a, b):
+        assert [list(addr) for addr in mm.get_block_replicas("h1")] == esperado
+
+
+def test_cambio_de_replicas_se_propaga(nodos):
+    a, b, _ = nodos
+    a.add_file_entry("x", 10, _entrada("h1"))
+    a.add_file_entry("y", 10, _entrada("h1"))
+    _sincronizar(a, b)
+    assert a.mover_replicas({"h1": {("127.0.0.1", 50002): ("127.0.0.1", 50009)}}) == 2
+    assert _sincronizar(a, b) == (True, False)
+    for mm in (a, b):
+        assert [tuple(addr) for addr in mm.get_block_replicas("h1")] == [("127.0.0.1", 50001),
+                                                                          ("127.0.0.1", 50009)]
+        assert mm.get_bloques_en_nodo(("127.0.0.1", 50002)) == []
@@ -0,0 +1,118 @@
+# test_erasure.py
+
+import itertools
+import os
+
+import pytest
+
+import Erasure
+from Erasure import ErasureCode, StripeIndex, gf_inv, gf_mul
+
+
+@pytest.fixture(params=["numpy", "python"])
+def motor(request, monkeypatch):
+    """Prueba cada código con NumPy y con la versión sin NumPy."""
+    ErasureCode(1, 1)  # carga las tablas
+    if request.param == "numpy":
+        if Erasure.np is None:
+            pytest.skip("NumPy no está instalado")
+    else:
+        monkeypatch.setattr(Erasure, "np", None)
+    return request.param
+
+
+def _franja(k, tamanos):
+    return [os.urandom(t) for t in tamanos[:k]]
+
+
+def test_aritmetica_gf256():
+    for a in range(1, 256):
+        assert gf_mul(a, gf_inv(a)) == 1
+        assert gf_mul(a, 1) == a and gf_mul(a, 0) == 0
+    for a, b, c in [(3, 7, 200), (255, 2, 91), (17, 17, 17)]:
+        assert gf_mul(a, b) == gf_mul(b, a)
+        assert gf_mul(a, b ^ c) == gf_mul(a, b) ^ gf_mul(a, c)
+    with pytest.raises(ZeroDivisionError):
+        gf_inv(0)
+
+
+def test_reed_solomon_recupera_cualquier_perdida_de_m_piezas(motor):
+    k, m = 4, 2
+    codigo = ErasureCode(k, m, "rs")
+    datos = _franja(k, [1000, 1000, 1000, 333])
+    piezas = dict(enumerate(datos + codigo.encode(datos)))
+    for perdidas in itertools.combinations(range(k + m), m):
+        quedan = {i: p for i, p in piezas.items() if i not in perdidas}
+        recuperados = codigo.decode(quedan, range(k))
+        # Los reconstruidos llevan el relleno hasta el mayor bloque
+        for i in range(k):
+            assert bytes(recuperados[i])[:len(datos[i])] == datos[i]
+            assert not bytes(recuperados[i])[len(datos[i]):].strip(b'\0')
+
+
+def test_xor_recupera_una_pieza(motor):
+    codigo = ErasureCode(3, 1, "xor")
+    datos = _franja(3, [64, 64, 10])
+    paridad, = codigo.encode(datos)
+    assert paridad == bytes(a ^ b ^ c for a, b, c in zip(*(d.ljust(64, b'\0') for d in datos)))
+    recuperado = codigo.decode({0: datos[0], 2: datos[2], 3: paridad}, [1])[1]
+    assert recuperado == datos[1]
+
+
+def test_franja_incompleta_se_rellena_con_ceros(motor):
+    codigo = ErasureCode(4, 2, "rs")
+    datos = _franja(2, [50, 20])
+    paridad = codigo.encode(datos)
+    # Los bloques que faltan al final del archivo cuentan como ceros
+    piezas = {1: datos[1], 2: b'', 3: b'', 5: paridad[1]}
+    assert codigo.decode(piezas, [0])[0] == datos[0]
+
+
+def test_faltan_piezas():
+    codigo = ErasureCode(4, 2, "rs")
+    with pytest.raises(IOError):
+        codigo.decode({0: b'a', 1: b'b', 4: b'c'}, [2])
+
+
+def test_parametros_invalidos():
+    with pytest.raises(ValueError):
+        ErasureCode(0, 1)
+    with pytest.raises(ValueError):
+        ErasureCode(4, 2, "xor")
+    with pytest.raises(ValueError):
+        ErasureCode(200, 100)
+    with pytest.raises(ValueError):
+        ErasureCode(4, 2, "otro")
+
+
+class _Fetcher:
+    """Sustituye a Transfer.BlockFetcher: sirve piezas de un dict; las perdidas dan None."""
+    def __init__(self, piezas, perdidas):
+        self.piezas = piezas
+        self.perdidas = set(perdidas)
+        self.pedidas = []
+
+    def fetch(self, nombre, replicas, crc=None):
+        self.pedidas.append(nombre)
+        return None if nombre in self.perdidas else self.piezas[nombre]
+
+
+def test_stripe_index_reconstruye_un_bloque():
+    k, m = 3, 2
+    codigo = ErasureCode(k, m, "rs")
+    datos = _franja(k, [100, 100, 40])
+    piezas = datos + codigo.encode(datos)
+    nombres = [f"p{i}" for i in range(k + m)]
+    block_map = [[nombre, ["h", 1], ["h", 1],
+                  {"size": len(pieza), "ec": {"stripe": 0, "index": i, "k": k, "m": m, "scheme": "rs"}}]
+                 for i, (nombre, pieza) in enumerate(zip(nombres, piezas))]
+    franjas = StripeIndex()
+    franjas.add(block_map)
+    assert "p2" in franjas and "p3" not in franjas
+
+    fetcher = _Fetcher(dict(zip(nombres, piezas)), perdidas=["p0", "p2"])
+    assert franjas.recover("p2", fetcher) == datos[2]
+    assert "p2" not in fetcher.pedidas
+
+    with pytest.raises(IOError):
+        franjas.recover("p0", _Fetcher(dict(zip(nombres, piezas)), perdidas=["p1", "p3", "p4"]))
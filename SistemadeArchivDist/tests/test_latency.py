@@ -0,0 +1,130 @@
+# test_latency.py
+#
+# LatencyTracker por sí solo, y lecturas duplicadas (hedged) de
+# BlockFetcher contra NodeServers reales (fixture 'nodos').
+
+import asyncio
+import os
+import time
+
+import Latency
+from Latency import LatencyTracker
+from Protocol import OP_DOWNLOAD_BLOCK
+from Transfer import BlockFetcher
+from Utils import hash_bloque
+
+A, B, C = ("10.0.0.1", 1), ("10.0.0.2", 1), ("10.0.0.3", 1)
+
+
+def contador(metrics, nombre):
+    return sum(c["value"] for c in metrics.snapshot()["counters"] if c["name"] == nombre)
+
+
+# --- 1. LatencyTracker ---
+
+def test_un_fallo_no_entra_en_las_muestras():
+    latency = LatencyTracker()
+    for _ in range(20):
+        latency.record(A, 0.05)
+    antes = latency.deadline(A)
+    for _ in range(20):
+        latency.record_failure(A)
+    assert latency.deadline(A) == antes
+    assert latency.expected(A) == 0.05
+    assert latency.failures(A) == 20
+
+
+def test_los_nodos_con_fallos_van_al_final():
+    latency = LatencyTracker()
+    latency.record(A, 0.01)
+    latency.record(B, 0.5)
+    latency.record(C, 0.2)
+    assert latency.rank([A, B, C]) == [A, C, B]
+    latency.record_failure(A)
+    latency.record_failure(C)
+    latency.record_failure(C)
+    assert latency.rank([A, B, C]) == [B, A, C]
+
+
+def test_los_aciertos_y_el_tiempo_olvidan_los_fallos(monkeypatch):
+    latency = LatencyTracker()
+    for _ in range(4):
+        latency.record_failure(A)
+    latency.record(A, 0.01)
+    assert latency.failures(A) == 2
+    monkeypatch.setattr(Latency, "LATENCY_STALE", 0.05)
+    time.sleep(0.1)
+    assert latency.failures(A) == 0
+
+
+def test_una_lectura_abandonada_sube_la_media_pero_no_el_plazo():
+    latency = LatencyTracker()
+    for _ in range(20):
+        latency.record(A, 0.05)
+    antes = latency.deadline(A)
+    latency.record_slow(A, 5.0)
+    assert latency.deadline(A) == antes
+    assert latency.expected(A) > 0.05
+
+
+# --- 2. BlockFetcher contra nodos reales ---
+
+def _subir(cliente, servidores, data):
+    nombre = hash_bloque(data)
+    for servidor in servidores:
+        assert cliente.upload_block([(servidor.host, servidor.port)], nombre, data)
+    return nombre
+
+
+def _lento(servidor, segundos):
+    """Hace que 'servidor' tarde 'segundos' más en servir DOWNLOAD_BLOCK."""
+    original = servidor.handlers[OP_DOWNLOAD_BLOCK]
+
+    async def handler(conn, addr, peticion):
+        await asyncio.sleep(segundos)
+        await original(conn, addr, peticion)
+    servidor.handlers[OP_DOWNLOAD_BLOCK] = handler
+
+
+def test_lectura_duplicada_cuando_la_replica_elegida_se_atasca(nodos, cliente):
+    lento, rapido = nodos(2)
+    data = os.urandom(200_000)
+    nombre = _subir(cliente, [lento, rapido], data)
+    addr_lento, addr_rapido = (lento.host, lento.port), (rapido.host, rapido.port)
+    # Según lo medido hasta ahora, el nodo lento es el rápido
+    for _ in range(20):
+        cliente.latency.record(addr_lento, 0.01)
+        cliente.latency.record(addr_rapido, 0.2)
+    _lento(lento, 3)
+
+    inicio = time.monotonic()
+    assert BlockFetcher(cliente, on_log=lambda m: None).fetch(nombre, [addr_lento, addr_rapido]) == data
+    assert time.monotonic() - inicio < 1
+    assert contador(cliente.metrics, "client_hedged_reads_total") == 1
+    # La lectura abandonada no es un fallo ni entra en las muestras
+    assert cliente.latency.failures(addr_lento) == 0
+    assert cliente.latency.deadline(addr_lento) < 0.1
+
+
+def test_bloque_ausente_no_cuenta_como_fallo(nodos, cliente):
+    sin_bloque, con_bloque = nodos(2)
+    data = os.urandom(50_000)
+    nombre = _subir(cliente, [con_bloque], data)
+    addr_sin, addr_con = (sin_bloque.host, sin_bloque.port), (con_bloque.host, con_bloque.port)
+
+    assert BlockFetcher(cliente, on_log=lambda m: None).fetch(nombre, [addr_sin, addr_con]) == data
+    assert cliente.latency.failures(addr_sin) == 0
+    assert contador(cliente.metrics, "client_replica_fallbacks_total") == 1
+
+
+def test_nodo_caido_cuenta_como_fallo_y_pasa_al_final(nodos, cliente):
+    caido, vivo = nodos(2)
+    data = os.urandom(50_000)
+    nombre = _subir(cliente, [caido, vivo], data)
+    addr_caido, addr_vivo = (caido.host, caido.port), (vivo.host, vivo.port)
+    nodos.parar(caido)
+
+    fetcher = BlockFetcher(cliente, on_log=lambda m: None)
+    assert fetcher.fetch(nombre, [addr_caido, addr_vivo]) == data
+    assert cliente.latency.failures(addr_caido) == 1
+    assert cliente.latency.rank([addr_caido, addr_vivo]) == [addr_vivo, addr_caido]
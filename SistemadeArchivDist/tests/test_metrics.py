@@ -0,0 +1,90 @@
+# test_metrics.py
+#
+# Métricas (Metrics y to_prometheus) y el comando STATS de un NodeServer
+# real (fixture 'nodos').
+
+import os
+
+from Metrics import LATENCY_BUCKETS, Histogram, Metrics, to_prometheus
+from Utils import hash_bloque
+
+
+def buscar(snapshot, tipo, nombre, **etiquetas):
+    return [m for m in snapshot[tipo] if m["name"] == nombre and m["labels"] == etiquetas]
+
+
+# --- 1. Metrics ---
+
+def test_contadores_por_etiquetas():
+    metrics = Metrics()
+    metrics.inc("peticiones_total", op="PING")
+    metrics.inc("peticiones_total", 2, op="PING")
+    metrics.inc("peticiones_total", op="STATS")
+    snapshot = metrics.snapshot()
+    assert buscar(snapshot, "counters", "peticiones_total", op="PING")[0]["value"] == 3
+    assert buscar(snapshot, "counters", "peticiones_total", op="STATS")[0]["value"] == 1
+
+
+def test_histograma_por_limites():
+    histograma = Histogram()
+    for valor in (0.0001, 0.0005, 0.003, 100):
+        histograma.observe(valor)
+    # Cada límite incluye los valores iguales a él; lo que pasa del último va aparte
+    assert histograma.counts[0] == 2
+    assert histograma.counts[LATENCY_BUCKETS.index(0.005)] == 1
+    assert histograma.counts[-1] == 1
+    assert histograma.count == 4
+
+
+def test_medida_instantanea_que_falla_se_omite():
+    metrics = Metrics()
+    metrics.gauge("bien", lambda: 7)
+    metrics.gauge("mal", lambda: 1 / 0)
+    assert [m["name"] for m in metrics.snapshot()["gauges"]] == ["bien"]
+
+
+def test_formato_prometheus():
+    metrics = Metrics()
+    metrics.inc("bytes_total", 10, peer='a"b')
+    metrics.gauge("en_curso", lambda: 2)
+    metrics.observe("segundos", 0.003)
+    metrics.observe("segundos", 0.2)
+    texto = to_prometheus(metrics.snapshot())
+    lineas = texto.splitlines()
+    assert "# TYPE sadtf_bytes_total counter" in lineas
+    assert 'sadtf_bytes_total{peer="a\\"b"} 10' in lineas
+    assert "sadtf_en_curso 2" in lineas
+    assert "# TYPE sadtf_segundos histogram" in lineas
+    # Cuentas acumuladas
+    assert 'sadtf_segundos_bucket{le="0.0025"} 0' in lineas
+    assert 'sadtf_segundos_bucket{le="0.005"} 1' in lineas
+    assert 'sadtf_segundos_bucket{le="0.25"} 2' in lineas
+    assert 'sadtf_segundos_bucket{le="+Inf"} 2' in lineas
+    assert "sadtf_segundos_count 2" in lineas
+    assert texto.endswith("\n")
+
+
+# --- 2. STATS de un nodo ---
+
+def test_stats_de_un_nodo(nodos, cliente):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    data = os.urandom(100_000)
+    nombre = hash_bloque(data)
+    assert cliente.upload_block([addr], nombre, data)
+    assert cliente.request_block(addr, nombre) == data
+
+    stats = cliente.stats(addr)
+    assert buscar(stats, "gauges", "server_used_bytes")[0]["value"] == len(data)
+    assert buscar(stats, "counters", "server_bytes_in_total")[0]["value"] >= len(data)
+    assert buscar(stats, "counters", "server_bytes_out_total")[0]["value"] >= len(data)
+    subidas = buscar(stats, "histograms", "server_request_seconds", op="UPLOAD_BLOCK")
+    assert subidas[0]["count"] == 1
+    assert "sadtf_server_used_bytes 100000" in to_prometheus(stats).splitlines()
+
+    # El cliente mide cada petición por comando y nodo
+    peer = f"{addr[0]}:{addr[1]}"
+    medidas = buscar(cliente.metrics.snapshot(), "histograms", "client_request_seconds",
+                     op="DOWNLOAD_BLOCK", peer=peer)
+    assert medidas[0]["count"] == 1
+
@@ -0,0 +1,96 @@
+# test_placement.py
+#
+# PlacementEngine con el estado real de NodeServers (HEARTBEAT) en
+# 127.0.0.1 (fixture 'nodos').
+
+import os
+import time
+
+import pytest
+
+from Placement import NodeStats, PlacementEngine, politica_dos_opciones
+from Transfer import StreamingUploader
+from Utils import MetadataManager, replicas_de_bloque
+
+MB = 1024 * 1024
+
+
+def direccion(servidor):
+    return (servidor.host, servidor.port)
+
+
+def test_nunca_elige_un_nodo_sin_espacio(nodos, cliente):
+    lleno, = nodos(1, capacity=MB)
+    libres = nodos(2, capacity=100 * MB)
+    motor = PlacementEngine(cliente, [direccion(lleno)] + [direccion(s) for s in libres])
+    for _ in range(20):
+        elegidos = motor.choose(3, 2 * MB)
+        assert sorted(elegidos) == sorted(direccion(s) for s in libres)
+        for addr in elegidos:
+            motor.release(addr, 2 * MB)
+
+
+def test_el_espacio_asignado_cuenta_hasta_el_siguiente_heartbeat(nodos, cliente):
+    servidor, = nodos(1, capacity=10 * MB)
+    motor = PlacementEngine(cliente, [direccion(servidor)])
+    assert motor.choose(1, 4 * MB) == [direccion(servidor)]
+    assert motor.choose(1, 4 * MB) == [direccion(servidor)]
+    # Ya hay 8 MB apartados: otros 4 no caben
+    assert motor.choose(1, 4 * MB) == []
+    motor.release(direccion(servidor), 4 * MB)
+    assert motor.choose(1, 4 * MB) == [direccion(servidor)]
+    motor.refresh()
+    assert motor.stats[direccion(servidor)].pending == 0
+
+
+def test_un_nodo_caido_deja_de_elegirse(nodos, cliente):
+    vivo, caido = nodos(2)
+    motor = PlacementEngine(cliente, [direccion(vivo), direccion(caido)], timeout=0.2)
+    motor.refresh()
+    assert sorted(motor.vivos()) == sorted([direccion(vivo), direccion(caido)])
+
+    nodos.parar(caido)
+    # Deja de contar como vivo 'timeout' segundos después del último heartbeat que respondió
+    limite = time.monotonic() + 5
+    while motor.vivos() != [direccion(vivo)]:
+        assert time.monotonic() < limite
+        time.sleep(0.05)
+        motor.refresh()
+    assert motor.choose(2, MB) == [direccion(vivo)]
+    assert motor.perdidos(0.2) == [direccion(caido)]
+
+
+def test_dos_opciones_prefiere_el_menos_cargado():
+    ocupado, libre = NodeStats(("10.0.0.1", 1)), NodeStats(("10.0.0.2", 1))
+    ocupado.in_flight, libre.in_flight = 5, 0
+    assert all(politica_dos_opciones([ocupado, libre]) is libre for _ in range(20))
+
+
+def test_subida_solo_usa_nodos_con_espacio(nodos, cliente, tmp_path):
+    lleno, = nodos(1, capacity=MB)
+    libres = nodos(2, capacity=100 * MB)
+    motor = PlacementEngine(cliente, [direccion(lleno)] + [direccion(s) for s in libres])
+    ruta = tmp_path / "origen.bin"
+    ruta.write_bytes(os.urandom(6 * MB))
+    uploader = StreamingUploader(cliente, MetadataManager("cliente", "127.0.0.1", 0, persistir=False),
+                                 replication_factor=2, placement=motor, compression=None,
+                                 block_size=2 * MB, on_log=lambda mensaje: None)
+    _, _, block_map = uploader.upload(str(ruta))
+
+    for entrada in block_map:
+        assert sorted(tuple(a) for a in replicas_de_bloque(entrada)) == sorted(direccion(s) for s in libres)
+    assert lleno.used_bytes == 0
+    motor.refresh()
+    assert [motor.stats[direccion(s)].used for s in libres] == [6 * MB, 6 * MB]
+
+
+def test_sin_nodos_con_espacio_la_subida_falla(nodos, cliente, tmp_path):
+    lleno, = nodos(1, capacity=MB)
+    motor = PlacementEngine(cliente, [direccion(lleno)])
+    ruta = tmp_path / "origen.bin"
+    ruta.write_bytes(os.urandom(2 * MB))
+    uploader = StreamingUploader(cliente, MetadataManager("cliente", "127.0.0.1", 0, persistir=False),
+                                 placement=motor, compression=None, block_size=2 * MB,
+                                 on_log=lambda mensaje: None)
+    with pytest.raises(IOError):
+        uploader.upload(str(ruta))
@@ -0,0 +1,140 @@
+# test_pool.py
+
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import Pool
+from Pool import ConnectionPool
+from Protocol import OP_DOWNLOAD_BLOCK, OP_PING, OP_STATS, OP_UPLOAD_BLOCK, STATUS_OK, build_response
+from Utils import hash_bloque
+
+
+@pytest.fixture
+def pool():
+    conexiones = ConnectionPool(timeout=3)
+    yield conexiones
+    conexiones.close()
+
+
+def lento(servidor, opcode, segundos):
+    """Hace que 'servidor' tarde 'segundos' en responder a 'opcode'."""
+    async def handler(conn, addr, peticion):
+        await asyncio.sleep(segundos)
+        await servidor.send(conn, build_response(peticion))
+    servidor.handlers[opcode] = handler
+
+
+def test_respuestas_encadenadas_por_una_conexion(nodos):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    pool = ConnectionPool(max_per_peer=1)
+    try:
+        bloques = [os.urandom(1000 + i) for i in range(40)]
+        for data in bloques:
+            assert pool.request(addr, OP_UPLOAD_BLOCK, {"name": hash_bloque(data)}, data).status == STATUS_OK
+        futures = [pool.submit(addr, OP_DOWNLOAD_BLOCK, {"name": hash_bloque(data)}) for data in bloques]
+        assert [bytes(pool.wait(future).body) for future in futures] == bloques
+        assert len(pool.peers[addr]) == 1
+    finally:
+        pool.close()
+
+
+def test_no_abre_mas_de_max_per_peer(nodos, monkeypatch):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+
+    class ConexionLenta(Pool.PeerConnection):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(Pool, "PeerConnection", ConexionLenta)
+    pool = ConnectionPool(max_per_peer=2, max_in_flight=1)
+    try:
+        salida = threading.Barrier(30)
+        futures = []
+
+        def pedir():
+            salida.wait()
+            futures.append(pool.submit(addr, OP_PING))
+
+        hilos = [threading.Thread(target=pedir) for _ in range(30)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert all(pool.wait(future).status == STATUS_OK for future in futures)
+        assert len(pool.peers[addr]) <= 2
+    finally:
+        pool.close()
+
+
+def test_plazo_agotado_no_afecta_a_las_demas_peticiones(nodos):
+    servidor, = nodos()
+    lento(servidor, OP_STATS, 0.5)
+    addr = (servidor.host, servidor.port)
+    pool = ConnectionPool(max_per_peer=1)
+    try:
+        lenta = pool.submit(addr, OP_STATS)
+        rapidas = [pool.submit(addr, OP_PING) for _ in range(5)]
+        with pytest.raises(TimeoutError):
+            pool.wait(lenta, timeout=0.1)
+        # Las que compartían conexión reciben su respuesta
+        assert all(pool.wait(future).status == STATUS_OK for future in rapidas)
+        conexion, = pool.peers[addr]
+        assert not conexion.closed
+        # La respuesta tardía se descartó y la conexión sigue sirviendo
+        assert pool.request(addr, OP_PING).status == STATUS_OK
+        assert pool.peers[addr] == [conexion]
+    finally:
+        pool.close()
+
+
+def test_plazo_agotado_en_una_conexion_ociosa_la_cierra(nodos, pool):
+    servidor, = nodos()
+    lento(servidor, OP_STATS, 1)
+    addr = (servidor.host, servidor.port)
+    with pytest.raises(TimeoutError):
+        pool.request(addr, OP_STATS, timeout=0.1)
+    # Era la única petición: la conexión se cierra para que el nodo deje de enviar
+    assert all(conexion.closed for conexion in pool.peers[addr])
+    assert pool.request(addr, OP_PING).status == STATUS_OK
+
+
+def test_nodo_que_no_lee_no_bloquea_el_envio():
+    # Acepta la conexión pero nunca lee: el envío debe cortarse por plazo
+    servidor = socket.socket()
+    servidor.bind(("127.0.0.1", 0))
+    servidor.listen()
+    addr = servidor.getsockname()
+    aceptadas = []
+    hilo = threading.Thread(target=lambda: aceptadas.append(servidor.accept()[0]), daemon=True)
+    hilo.start()
+    pool = ConnectionPool(timeout=0.5)
+    try:
+        inicio = time.monotonic()
+        future = pool.submit(addr, OP_UPLOAD_BLOCK, {"name": "x"}, bytes(64 * 1024 * 1024))
+        with pytest.raises(OSError):
+            pool.wait(future)
+        assert time.monotonic() - inicio < 10
+    finally:
+        pool.close()
+        for conn in aceptadas:
+            conn.close()
+        servidor.close()
+
+
+def test_cancelar_descarta_la_respuesta(nodos, pool):
+    servidor, = nodos()
+    lento(servidor, OP_STATS, 0.3)
+    addr = (servidor.host, servidor.port)
+    abandonada = pool.submit(addr, OP_STATS)
+    otra = pool.submit(addr, OP_PING)
+    pool.cancel(abandonada)
+    assert abandonada.cancelled()
+    assert pool.wait(otra).status == STATUS_OK
@@ -0,0 +1,120 @@
+# test_protocol.py
+
+import socket
+import threading
+import tracemalloc
+
+import pytest
+
+from Protocol import (HEADER_SIZE, MAX_BODY_SIZE, FLAG_RESPONSE, OP_PING, OP_UPLOAD_BLOCK,
+                      STATUS_NOT_FOUND, FileRange, ProtocolError, build_message, build_response,
+                      decode_args, decode_header, encode_header, recv_message, send_message)
+
+
+@pytest.fixture
+def par():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_mensaje_ida_y_vuelta(par):
+    a, b = par
+    a.sendall(build_message(OP_UPLOAD_BLOCK, {"name": "x", "forward": [["h", 1]]}, b"datos", request_id=7))
+    mensaje = recv_message(b)
+    assert mensaje.opcode == OP_UPLOAD_BLOCK
+    assert mensaje.request_id == 7
+    assert mensaje.args == {"name": "x", "forward": [["h", 1]]}
+    assert bytes(mensaje.body) == b"datos"
+
+
+def test_varios_mensajes_seguidos_en_la_misma_conexion(par):
+    a, b = par
+    a.sendall(build_message(OP_PING, request_id=1) + build_message(OP_UPLOAD_BLOCK, {"n": 1}, b"z" * 1000, 2)
+              + build_message(OP_PING, request_id=3))
+    recibidos = [recv_message(b) for _ in range(3)]
+    assert [m.request_id for m in recibidos] == [1, 2, 3]
+    assert recibidos[0].args == {} and recibidos[0].body == b''
+    assert bytes(recibidos[1].body) == b"z" * 1000
+
+
+def test_cuerpo_desde_filerange(par, tmp_path):
+    a, b = par
+    ruta = tmp_path / "origen"
+    ruta.write_bytes(bytes(range(256)) * 40)
+    with open(ruta, 'rb') as f:
+        send_message(a, OP_UPLOAD_BLOCK, {"name": "y"}, FileRange(f, 100, 5000))
+    assert bytes(recv_message(b).body) == (bytes(range(256)) * 40)[100:5100]
+
+
+def test_respuesta_conserva_opcode_e_id(par):
+    a, b = par
+    a.sendall(build_message(OP_UPLOAD_BLOCK, request_id=42))
+    peticion = recv_message(b)
+    b.sendall(build_response(peticion, STATUS_NOT_FOUND, {"motivo": "no"}))
+    respuesta = recv_message(a)
+    assert (respuesta.opcode, respuesta.request_id, respuesta.status) == (OP_UPLOAD_BLOCK, 42, STATUS_NOT_FOUND)
+    assert respuesta.flags & FLAG_RESPONSE
+    assert respuesta.args == {"motivo": "no"}
+
+
+def test_cierre_limpio_entre_mensajes(par):
+    a, b = par
+    a.close()
+    assert recv_message(b) is None
+
+
+def test_cierre_a_mitad_de_mensaje(par):
+    a, b = par
+    a.sendall(build_message(OP_UPLOAD_BLOCK, body=b"x" * 100)[:HEADER_SIZE + 10])
+    a.close()
+    with pytest.raises(ConnectionError):
+        recv_message(b)
+
+
+def test_encabezado_invalido():
+    valido = encode_header(OP_PING, 0, 0)
+    assert decode_header(valido)[0] == OP_PING
+    with pytest.raises(ProtocolError):
+        decode_header(b"XX" + valido[2:])
+    with pytest.raises(ProtocolError):
+        decode_header(valido[:2] + bytes([99]) + valido[3:])
+    with pytest.raises(ProtocolError):
+        decode_header(encode_header(OP_PING, 0, MAX_BODY_SIZE + 1))
+
+
+def test_argumentos_invalidos():
+    assert decode_args(b'') == {}
+    with pytest.raises(ProtocolError):
+        decode_args(b'{no es json')
+    with pytest.raises(ProtocolError):
+        decode_args(b'[1, 2]')
+    with pytest.raises(ProtocolError):
+        decode_args(b'"nombre"')
+
+
+def test_cuerpo_anunciado_no_se_reserva_de_golpe(par):
+    # Un encabezado que anuncia un cuerpo enorme y luego se corta no debe
+    # hacer que el receptor reserve todo ese tamaño
+    a, b = par
+    a.sendall(encode_header(OP_UPLOAD_BLOCK, 0, MAX_BODY_SIZE) + b"x" * 1000)
+    a.close()
+    tracemalloc.start()
+    try:
+        with pytest.raises(ConnectionError):
+            recv_message(b)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert pico < MAX_BODY_SIZE // 16
+
+
+def test_cuerpo_que_crece_por_trozos(par):
+    # Más grande que el buffer inicial: obliga a ampliarlo varias veces
+    a, b = par
+    datos = bytes(range(256)) * 5000
+    emisor = threading.Thread(target=a.sendall, args=(build_message(OP_UPLOAD_BLOCK, body=datos),))
+    emisor.start()
+    assert bytes(recv_message(b).body) == datos
+    emisor.join()
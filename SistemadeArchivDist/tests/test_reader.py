@@ -0,0 +1,83 @@
+# test_reader.py
+#
+# Lecturas de rangos (RangeReader y DFSFile) contra NodeServers reales
+# (fixture 'nodos').
+
+import os
+
+import pytest
+
+from Reader import RangeReader
+from Transfer import StreamingUploader
+from Utils import MetadataManager
+
+BLOQUE = 256 * 1024
+
+
+@pytest.fixture
+def archivo_subido(nodos, cliente, tmp_path):
+    """Sube un archivo de 4 bloques y medio y devuelve (RangeReader, contenido, nodo)."""
+    servidor, = nodos(cache_bytes=0)
+    metadata_manager = MetadataManager("cliente", "127.0.0.1", 0, persistir=False)
+    data = os.urandom(4 * BLOQUE + BLOQUE // 2)
+    ruta = tmp_path / "datos.bin"
+    ruta.write_bytes(data)
+    uploader = StreamingUploader(cliente, metadata_manager, replication_factor=1, compression=None,
+                                 block_size=BLOQUE, batch_block_max=0, on_log=lambda m: None)
+    filename, size, block_map = uploader.upload(str(ruta))
+    metadata_manager.add_file_entry(filename, size, block_map)
+    reader = RangeReader(cliente, metadata_manager, on_log=lambda m: None)
+    yield reader, data, servidor
+    reader.close()
+
+
+def espiar_envios(servidor):
+    """Lista de (offset, bytes) de cada envío de bloque desde el disco de 'servidor'."""
+    enviados = []
+    send_file = servidor.send_file
+
+    async def espia(conn, peticion, ruta, size, offset=0):
+        enviados.append((offset, size))
+        await send_file(conn, peticion, ruta, size, offset)
+
+    servidor.send_file = espia
+    return enviados
+
+
+@pytest.mark.parametrize("offset, length", [
+    (0, 10),
+    (BLOQUE - 5, 10),                  # cruza un límite de bloque
+    (BLOQUE, BLOQUE),                  # un bloque entero
+    (100, 3 * BLOQUE),                 # varios bloques, en paralelo
+    (4 * BLOQUE + 7, 10 * BLOQUE),     # pasa del final
+    (5 * BLOQUE, 10),                  # empieza después del final
+])
+def test_rangos(archivo_subido, offset, length):
+    reader, data, _ = archivo_subido
+    assert reader.read("datos.bin", offset, length) == data[offset:offset + length]
+
+
+def test_solo_se_envia_el_trozo_pedido(archivo_subido):
+    reader, data, servidor = archivo_subido
+    enviados = espiar_envios(servidor)
+    assert reader.read("datos.bin", BLOQUE + 1000, 500) == data[BLOQUE + 1000:BLOQUE + 1500]
+    assert enviados == [(1000, 500)]
+
+
+def test_archivo_inexistente_o_rango_negativo(archivo_subido):
+    reader, _, _ = archivo_subido
+    with pytest.raises(FileNotFoundError):
+        reader.read("no_existe.bin", 0, 10)
+    with pytest.raises(ValueError):
+        reader.read("datos.bin", -1, 10)
+
+
+def test_objeto_archivo_con_seek(archivo_subido):
+    reader, data, _ = archivo_subido
+    with reader.open("datos.bin") as f:
+        assert f.read(100) == data[:100]
+        f.seek(-1024, os.SEEK_END)
+        assert f.read() == data[-1024:]
+        f.seek(2 * BLOQUE + 3)
+        assert f.tell() == 2 * BLOQUE + 3
+        assert f.read(BLOQUE) == data[2 * BLOQUE + 3:3 * BLOQUE + 3]
@@ -0,0 +1,117 @@
+# test_repair.py
+#
+# Re-replicación de los bloques de un nodo perdido (Repairer) contra
+# NodeServers reales (fixture 'nodos'). El nodo perdido es una dirección
+# en la que no escucha nadie.
+
+import os
+import threading
+import time
+
+from conftest import puerto_libre
+from Placement import PlacementEngine
+from Repair import Repairer, TokenBucket
+from Utils import crc_bloque, crear_entrada_bloque, desempaquetar_bloque, hash_bloque, replicas_de_bloque
+
+
+def direccion(servidor):
+    return (servidor.host, servidor.port)
+
+
+# --- 1. TokenBucket ---
+
+def test_token_bucket_limita_el_ritmo():
+    bucket = TokenBucket(1_000_000, burst=100_000)
+    inicio = time.monotonic()
+    for _ in range(4):
+        assert bucket.consume(100_000)
+    # La primera ráfaga es gratis; las otras tres esperan 0,1 s cada una
+    assert time.monotonic() - inicio >= 0.25
+
+
+def test_token_bucket_se_interrumpe():
+    bucket = TokenBucket(1000)
+    bucket.consume(1000)
+    parar = threading.Event()
+    parar.set()
+    assert bucket.consume(1000, parar) is False
+
+
+# --- 2. Repairer ---
+
+def preparar(cliente, local, replicas, data):
+    """Guarda 'data' en 'local' y lo anota en sus metadatos en 'replicas'."""
+    nombre = hash_bloque(data)
+    assert cliente.upload_block([direccion(local)], nombre, data)
+    local.metadata_manager.add_file_entry(
+        "f.bin", len(data), [crear_entrada_bloque(nombre, replicas, offset=0, size=len(data),
+                                                  crc=crc_bloque(data))])
+    return nombre
+
+
+def reparador(cliente, local, nodos, **opciones):
+    motor = PlacementEngine(cliente, nodos)
+    # Cuenta como perdido quien no respondió en los 0,1 s desde que arrancó el motor
+    time.sleep(0.15)
+    motor.refresh()
+    cambios = []
+    repairer = Repairer(local.metadata_manager, cliente, motor, grace=0.1, on_log=lambda m: None,
+                        on_changed=lambda: cambios.append(True), **opciones)
+    return repairer, cambios
+
+
+def test_copia_los_bloques_del_nodo_perdido(nodos, cliente):
+    local, destino = nodos(2)
+    perdido = ("127.0.0.1", puerto_libre())
+    data = os.urandom(200_000)
+    nombre = preparar(cliente, local, [direccion(local), perdido], data)
+
+    repairer, cambios = reparador(cliente, local, [direccion(local), perdido, direccion(destino)])
+    assert repairer.repair_once() == 1
+    assert cliente.request_block(direccion(destino), nombre) == data
+    entrada, = local.metadata_manager.get_file_blocks("f.bin")
+    assert [tuple(a) for a in replicas_de_bloque(entrada)] == [direccion(local), direccion(destino)]
+    assert desempaquetar_bloque(entrada)[3]["crc"] == crc_bloque(data)
+    assert cambios == [True]
+    assert repairer.stats["repaired"] == 1 and repairer.movidos == {perdido: {nombre}}
+
+    # Ya no queda nada que reparar
+    assert repairer.repair_once() == 0
+
+
+def test_solo_repara_la_primera_replica_viva(nodos, cliente):
+    primera, local, destino = nodos(3)
+    perdido = ("127.0.0.1", puerto_libre())
+    data = os.urandom(50_000)
+    preparar(cliente, local, [direccion(primera), direccion(local), perdido], data)
+
+    repairer, cambios = reparador(cliente, local, [direccion(primera), direccion(local), perdido,
+                                                   direccion(destino)])
+    assert repairer.repair_once() == 0
+    assert repairer.stats["under_replicated"] == 1
+    assert cambios == []
+
+
+def test_bloque_sin_replicas_vivas(nodos, cliente):
+    local, = nodos()
+    perdidos = [("127.0.0.1", puerto_libre()), ("127.0.0.1", puerto_libre())]
+    data = os.urandom(1000)
+    nombre = hash_bloque(data)
+    local.metadata_manager.add_file_entry(
+        "f.bin", len(data), [crear_entrada_bloque(nombre, perdidos, offset=0, size=len(data))])
+
+    repairer, _ = reparador(cliente, local, [direccion(local)] + perdidos)
+    assert repairer.repair_once() == 0
+    assert repairer.stats["lost"] == 1
+
+
+def test_sin_destino_con_espacio_no_copia(nodos, cliente):
+    local, = nodos()
+    lleno, = nodos(capacity=1000)
+    perdido = ("127.0.0.1", puerto_libre())
+    preparar(cliente, local, [direccion(local), perdido], os.urandom(50_000))
+
+    repairer, cambios = reparador(cliente, local, [direccion(local), perdido, direccion(lleno)])
+    assert repairer.repair_once() == 0
+    assert repairer.stats["failed"] == 1
+    assert cambios == [] and lleno.used_bytes == 0
@@ -0,0 +1,98 @@
+# test_scrubber.py
+#
+# CRC32 de cada bloque al subirlo y al leerlo, y Scrubber reparando
+# bloques dañados en disco, contra NodeServers reales (fixture 'nodos').
+
+import asyncio
+import os
+
+from Protocol import OP_DOWNLOAD_BLOCK
+from Scrubber import Scrubber
+from Transfer import BlockFetcher
+from Utils import crc_bloque, crear_entrada_bloque, hash_bloque
+
+
+def direccion(servidor):
+    return (servidor.host, servidor.port)
+
+
+def contador(metrics, nombre):
+    return sum(c["value"] for c in metrics.snapshot()["counters"] if c["name"] == nombre)
+
+
+def danar(servidor, nombre_bloque):
+    with open(servidor.metadata_manager.get_local_storage_path(nombre_bloque), 'r+b') as f:
+        f.seek(100)
+        f.write(b"\0" * 8)
+
+
+def repartir(cliente, servidores, data):
+    """Guarda 'data' en todos los 'servidores' y lo anota en sus metadatos con su CRC."""
+    nombre, crc = hash_bloque(data), crc_bloque(data)
+    replicas = [direccion(s) for s in servidores]
+    for servidor in servidores:
+        assert cliente.upload_block([direccion(servidor)], nombre, data, {"crc": crc})
+        servidor.metadata_manager.add_file_entry(
+            "f.bin", len(data), [crear_entrada_bloque(nombre, replicas, offset=0, size=len(data), crc=crc)])
+    return nombre, crc
+
+
+# --- 1. CRC al subir y al leer ---
+
+def test_subida_con_crc_incorrecto_se_rechaza(nodos, cliente):
+    servidor, = nodos()
+    data = os.urandom(100_000)
+    nombre = hash_bloque(data)
+    assert cliente.upload_block([direccion(servidor)], nombre, data, {"crc": crc_bloque(data) ^ 1}) == []
+    assert not os.path.exists(servidor.metadata_manager.get_local_storage_path(nombre))
+    assert servidor.used_bytes == 0
+
+
+def test_lectura_de_replica_danada_pasa_a_la_sana(nodos, cliente):
+    danado, sano = nodos(2, cache_bytes=0)
+    data = os.urandom(100_000)
+    nombre, crc = repartir(cliente, [danado, sano], data)
+    danar(danado, nombre)
+
+    fetcher = BlockFetcher(cliente, on_log=lambda m: None)
+    assert fetcher.fetch(nombre, [direccion(danado), direccion(sano)], crc=crc) == data
+    assert contador(cliente.metrics, "client_corrupt_blocks_total") == 1
+
+
+# --- 2. Scrubber ---
+
+def test_scrubber_repara_con_otra_replica(nodos, cliente):
+    local, otro = nodos(2)
+    data = os.urandom(300_000)
+    nombre, _ = repartir(cliente, [local, otro], data)
+    danar(local, nombre)
+
+    reparados = []
+    scrubber = Scrubber(local.metadata_manager, cliente, on_log=lambda m: None,
+                        on_repaired=reparados.append)
+    assert scrubber.scrub_once() == [nombre]
+    assert reparados == [nombre]
+    with open(local.metadata_manager.get_local_storage_path(nombre), 'rb') as f:
+        assert f.read() == data
+    assert scrubber.stats["corrupt"] == scrubber.stats["repaired"] == 1
+    assert scrubber.scrub_once() == []
+
+
+def test_scrubber_cancela_la_peticion_que_no_responde(nodos, cliente, monkeypatch):
+    local, atascado = nodos(2)
+    data = os.urandom(50_000)
+    nombre, _ = repartir(cliente, [local, atascado], data)
+    danar(local, nombre)
+
+    async def sin_respuesta(conn, addr, peticion):
+        await asyncio.sleep(10)
+    atascado.handlers[OP_DOWNLOAD_BLOCK] = sin_respuesta
+    cliente.timeout = 0.2
+    cancelados = []
+    cancelar = cliente.cancel
+    monkeypatch.setattr(cliente, "cancel", lambda future: (cancelados.append(future), cancelar(future)))
+
+    scrubber = Scrubber(local.metadata_manager, cliente, on_log=lambda m: None)
+    assert scrubber.scrub_once() == [nombre]
+    assert scrubber.stats["repaired"] == 0
+    assert len(cancelados) == 1 and cancelados[0].cancelled()
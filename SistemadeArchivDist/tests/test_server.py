@@ -0,0 +1,104 @@
+# test_server.py
+#
+# NodeServer real en 127.0.0.1 (ver el fixture 'nodos' de conftest.py),
+# atendido por un DFSClient o por sockets sueltos.
+
+import os
+import socket
+import time
+
+import pytest
+
+from Protocol import (OP_PING, OP_UPLOAD_BLOCK, STATUS_BAD_REQUEST, STATUS_NOT_FOUND, STATUS_OK,
+                      build_message, encode_header, recv_message)
+from Utils import hash_bloque
+
+
+def conectar(servidor):
+    return socket.create_connection((servidor.host, servidor.port), timeout=5)
+
+
+def test_ping(nodos, cliente):
+    servidor, = nodos()
+    assert cliente.pool.request((servidor.host, servidor.port), OP_PING).status == STATUS_OK
+
+
+def test_subida_y_descarga(nodos, cliente):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    data = os.urandom(300_000)
+    nombre = hash_bloque(data)
+    assert cliente.upload_block([addr], nombre, data) == [addr]
+    assert cliente.request_block(addr, nombre) == data
+    assert os.path.getsize(servidor.metadata_manager.get_local_storage_path(nombre)) == len(data)
+    assert servidor.used_bytes == len(data)
+
+
+def test_bloque_inexistente(nodos, cliente):
+    servidor, = nodos()
+    respuesta = cliente.request_block_async((servidor.host, servidor.port), "f" * 64).result(5)
+    assert respuesta.status == STATUS_NOT_FOUND
+
+
+def test_muchas_conexiones_a_la_vez(nodos):
+    servidor, = nodos()
+    socks = [conectar(servidor) for _ in range(200)]
+    try:
+        for i, sock in enumerate(socks):
+            sock.sendall(build_message(OP_PING, request_id=i))
+        respuestas = [recv_message(sock) for sock in socks]
+    finally:
+        for sock in socks:
+            sock.close()
+    assert [r.request_id for r in respuestas] == list(range(200))
+    assert all(r.status == STATUS_OK for r in respuestas)
+
+
+def test_opcode_desconocido_no_corta_la_conexion(nodos):
+    servidor, = nodos()
+    with conectar(servidor) as sock:
+        sock.sendall(build_message(99, body=b"x" * 1000, request_id=1) + build_message(OP_PING, request_id=2))
+        assert recv_message(sock).status == STATUS_BAD_REQUEST
+        assert recv_message(sock).status == STATUS_OK
+
+
+def test_nombre_de_bloque_fuera_del_almacenamiento(nodos):
+    servidor, = nodos()
+    with conectar(servidor) as sock:
+        sock.sendall(build_message(OP_UPLOAD_BLOCK, {"name": "../fuera"}, b"x" * 5000, request_id=1)
+                     + build_message(OP_PING, request_id=2))
+        assert recv_message(sock).status == STATUS_BAD_REQUEST
+        assert recv_message(sock).status == STATUS_OK
+    assert not os.path.exists("fuera")
+
+
+def test_mensaje_invalido_cierra_solo_esa_conexion(nodos):
+    servidor, = nodos()
+    with conectar(servidor) as buena, conectar(servidor) as mala:
+        mala.sendall(b"XX" + build_message(OP_PING)[2:])
+        assert recv_message(mala) is None
+        # Argumentos que no son un objeto JSON
+        with conectar(servidor) as otra:
+            otra.sendall(encode_header(OP_PING, 3, 0) + b"[1]")
+            assert recv_message(otra) is None
+        buena.sendall(build_message(OP_PING, request_id=5))
+        assert recv_message(buena).request_id == 5
+
+
+def test_peticiones_encadenadas_con_un_solo_cupo(nodos, cliente):
+    # Con max_concurrent=1 las peticiones esperan su turno, pero todas se atienden
+    servidor, = nodos(max_concurrent=1)
+    addr = (servidor.host, servidor.port)
+    futures = [cliente.pool.submit(addr, OP_PING) for _ in range(50)]
+    assert all(future.result(5).status == STATUS_OK for future in futures)
+
+
+def test_stop_cierra_el_puerto(nodos):
+    servidor, = nodos()
+    servidor.stop()
+    # El bucle del servidor cierra el socket poco después
+    limite = time.monotonic() + 5
+    with pytest.raises(ConnectionRefusedError):
+        while time.monotonic() < limite:
+            conectar(servidor).close()
+            time.sleep(0.01)
@@ -0,0 +1,171 @@
+# test_store.py
+
+import os
+
+import pytest
+
+import Utils
+from Store import MetadataStore
+from Utils import MetadataManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = MetadataStore(str(tmp_path / "meta"), str(tmp_path / "blocks.jsonl"), fsync_interval=0.001)
+    yield s
+    if not s.wal.closed:
+        s.close()
+
+
+def _reabrir(tmp_path):
+    return MetadataStore(str(tmp_path / "meta"), str(tmp_path / "blocks.jsonl"), fsync_interval=0.001)
+
+
+def _entrada(nombre, puerto=50001):
+    return [[nombre, ["127.0.0.1", puerto], ["127.0.0.1", puerto + 1], {"offset": 0, "size": 10}]]
+
+
+# --- 1. MetadataStore ---
+
+def test_wal_se_reproduce_en_orden(tmp_path, store):
+    for i in range(1, 6):
+        registro = store.append({"seq": i})
+    store.wait_durable(registro)
+    store.close()
+
+    otro = _reabrir(tmp_path)
+    try:
+        assert otro.existe()
+        snapshot, ops = otro.load()
+        assert snapshot is None
+        assert [op["seq"] for op in ops] == [1, 2, 3, 4, 5]
+    finally:
+        otro.close()
+
+
+def test_linea_cortada_al_final_se_ignora(tmp_path, store):
+    store.append({"seq": 1})
+    store.append({"seq": 2})
+    store.close()
+    with open(store.wal_path, 'ab') as f:
+        f.write(b'{"seq":3,"op":"ad')
+
+    otro = _reabrir(tmp_path)
+    try:
+        _, ops = otro.load()
+        assert [op["seq"] for op in ops] == [1, 2]
+    finally:
+        otro.close()
+
+
+def test_instantanea_vacia_el_wal(tmp_path, store):
+    store.append({"seq": 1})
+    store.write_snapshot({"files": {"a": 1}})
+    assert store.registros_wal == 0
+    store.append({"seq": 2})
+    store.close()
+
+    otro = _reabrir(tmp_path)
+    try:
+        snapshot, ops = otro.load()
+        assert snapshot == {"files": {"a": 1}}
+        assert [op["seq"] for op in ops] == [2]
+    finally:
+        otro.close()
+
+
+def test_wait_durable_no_bloquea_tras_cerrar(store):
+    registro = store.append({"seq": 1})
+    store.close()
+    store.wait_durable(registro + 10)
+
+
+# --- 2. MetadataManager persistente ---
+
+@pytest.fixture
+def en_tmp(tmp_path, monkeypatch):
+    # Los directorios de almacenamiento se crean relativos al directorio actual
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_tabla_sobrevive_a_un_reinicio(en_tmp):
+    mm = MetadataManager("n", "127.0.0.1", 50001)
+    mm.add_file_entry("a.txt", 10, _entrada("h1"))
+    mm.add_file_entry("b.txt", 10, _entrada("h2"))
+    mm.remove_file_entry("a.txt")
+    vector, origen = mm.get_vector(), mm.origin
+    mm.close()
+
+    mm = MetadataManager("n", "127.0.0.1", 50001)
+    try:
+        assert [nombre for nombre, _, _ in mm.get_lista_archivos()] == ["b.txt"]
+        assert mm.get_vector() == vector
+        assert mm.origin == origen
+        assert mm.get_block_refs("h2") == 1 and mm.get_block_refs("h1") == 0
+    finally:
+        mm.close()
+
+
+def test_compactacion_conserva_el_estado(en_tmp, monkeypatch):
+    monkeypatch.setattr(Utils, "METADATA_SNAPSHOT_EVERY", 3)
+    mm = MetadataManager("n", "127.0.0.1", 50002)
+    for i in range(10):
+        mm.add_file_entry(f"f{i}", i, _entrada(f"h{i}"))
+    assert mm.store.registros_wal < 3
+    snapshot = mm.snapshot()
+    mm.close()
+
+    mm = MetadataManager("n", "127.0.0.1", 50002)
+    try:
+        assert mm.snapshot() == snapshot
+        # Sin registro de operaciones tras cargar: a un nodo atrasado se le
+        # manda la instantánea
+        assert "snapshot" in mm.delta_para({})
+    finally:
+        mm.close()
+
+
+# --- 3. Registro de bloques locales ---
+
+def test_compactar_bloques_deja_el_ultimo_de_cada_par(tmp_path, store):
+    store.record_block("h1", "a.txt", 10, [0], 10)
+    store.record_block("h2", "a.txt", 10, [0], 10)
+    store.record_block("h1", "a.txt", 20, [10], 10)
+    store.compact_blocks(lambda registro: registro["block"] != "h2")
+    assert [(r["block"], r["file_size"]) for r in store.block_records()] == [("h1", 20)]
+
+    # El registro sigue admitiendo altas tras reescribirse
+    store.record_block("h3", "b.txt", 5, [0], 5)
+    store.close()
+
+    otro = _reabrir(tmp_path)
+    try:
+        assert [r["block"] for r in otro.block_records()] == ["h1", "h3"]
+    finally:
+        otro.close()
+
+
+def _recibir(mm, nombre_bloque, archivo, data):
+    with open(mm.get_local_storage_path(nombre_bloque), 'wb') as f:
+        f.write(data)
+    mm.registrar_bloque_recibido(nombre_bloque, {"file": archivo, "file_size": len(data),
+                                                 "offsets": [0], "size": len(data)}, len(data))
+
+
+def test_borrar_archivo_saca_sus_bloques_del_registro(en_tmp):
+    mm = MetadataManager("n", "127.0.0.1", 50003)
+    try:
+        _recibir(mm, "h1", "a.txt", b"x" * 10)
+        _recibir(mm, "h2", "b.txt", b"y" * 10)
+        _recibir(mm, "h3", "c.txt", b"z" * 10)
+        mm.add_file_entry("a.txt", 10, _entrada("h1", 50003))
+        mm.add_file_entry("b.txt", 10, _entrada("h2", 50003))
+        # c.txt aún no está en la tabla: su bloque se conserva mientras siga en disco
+        mm.remove_file_entry("a.txt")
+        os.remove(mm.get_local_storage_path("h1"))
+        with mm.lock:
+            mm._compactar()
+        assert sorted(r["block"] for r in mm.store.block_records()) == ["h2", "h3"]
+    finally:
+        mm.close()
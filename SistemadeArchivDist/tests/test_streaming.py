@@ -0,0 +1,138 @@
+# test_streaming.py
+#
+# Subidas que van del socket al disco por trozos y descargas con sendfile,
+# contra un NodeServer real (fixture 'nodos').
+
+import builtins
+import os
+import socket
+import time
+
+import Server
+from Protocol import (OP_PING, OP_UPLOAD_BLOCK, STATUS_ERROR, STATUS_OK, build_message, encode_args,
+                      encode_header, recv_message)
+from Utils import hash_bloque
+
+_open = builtins.open
+
+
+def conectar(servidor):
+    return socket.create_connection((servidor.host, servidor.port), timeout=5)
+
+
+def temporales(servidor):
+    return [n for n in os.listdir(servidor.metadata_manager.storage_dir) if n.endswith(".part")]
+
+
+def test_descarga_con_sendfile(nodos, cliente):
+    # Sin caché, todo bloque sale con sendfile
+    servidor, = nodos(cache_bytes=0)
+    addr = (servidor.host, servidor.port)
+    enviados = []
+    send_file = servidor.send_file
+
+    async def espia(conn, peticion, ruta, size, offset=0):
+        enviados.append(size)
+        await send_file(conn, peticion, ruta, size, offset)
+
+    servidor.send_file = espia
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    nombre = hash_bloque(data)
+    assert cliente.upload_block([addr], nombre, data) == [addr]
+    assert cliente.request_block(addr, nombre) == data
+    assert enviados == [len(data)]
+
+
+def test_subida_desde_archivo(nodos, cliente, tmp_path):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    origen = tmp_path / "origen.bin"
+    origen.write_bytes(os.urandom(2_500_000))
+    parte = origen.read_bytes()[1_000_000:2_000_000]
+    with open(origen, 'rb') as f:
+        assert cliente.send_block_range(addr, hash_bloque(parte), f, 1_000_000, 1_000_000)
+    with open(servidor.metadata_manager.get_local_storage_path(hash_bloque(parte)), 'rb') as f:
+        assert f.read() == parte
+    assert temporales(servidor) == []
+
+
+def test_fallo_al_abrir_el_temporal_descarta_el_cuerpo(nodos, monkeypatch):
+    servidor, = nodos()
+
+    def sin_espacio(ruta, *args, **kwargs):
+        if str(ruta).endswith(".part"):
+            raise OSError(28, "No space left on device")
+        return _open(ruta, *args, **kwargs)
+
+    monkeypatch.setattr(Server, "open", sin_espacio, raising=False)
+    with conectar(servidor) as sock:
+        sock.sendall(build_message(OP_UPLOAD_BLOCK, {"name": "a" * 64}, os.urandom(700_000), request_id=1)
+                     + build_message(OP_PING, request_id=2))
+        assert recv_message(sock).status == STATUS_ERROR
+        # El resto del cuerpo no se confundió con el siguiente encabezado
+        respuesta = recv_message(sock)
+        assert (respuesta.request_id, respuesta.status) == (2, STATUS_OK)
+    assert temporales(servidor) == []
+    assert servidor.used_bytes == 0
+
+
+def test_fallo_de_escritura_a_mitad_del_cuerpo(nodos, monkeypatch):
+    servidor, = nodos()
+
+    class Disco:
+        def __init__(self, f):
+            self.f = f
+            self.escrituras = 0
+
+        def write(self, data):
+            self.escrituras += 1
+            if self.escrituras == 2:
+                raise OSError(5, "Input/output error")
+            return self.f.write(data)
+
+        def close(self):
+            self.f.close()
+
+    def averiado(ruta, *args, **kwargs):
+        f = _open(ruta, *args, **kwargs)
+        return Disco(f) if str(ruta).endswith(".part") else f
+
+    monkeypatch.setattr(Server, "open", averiado, raising=False)
+    data = os.urandom(2_000_000)
+    with conectar(servidor) as sock:
+        sock.sendall(build_message(OP_UPLOAD_BLOCK, {"name": hash_bloque(data)}, data, request_id=1)
+                     + build_message(OP_PING, request_id=2))
+        assert recv_message(sock).status == STATUS_ERROR
+        assert recv_message(sock).request_id == 2
+    assert temporales(servidor) == []
+    assert not os.path.exists(servidor.metadata_manager.get_local_storage_path(hash_bloque(data)))
+
+
+def test_cliente_que_corta_a_mitad_no_deja_restos(nodos, cliente):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    args = encode_args({"name": "b" * 64})
+    with conectar(servidor) as sock:
+        sock.sendall(encode_header(OP_UPLOAD_BLOCK, len(args), 1_000_000) + args + bytes(300_000))
+    # El nodo sigue atendiendo y el temporal se borra
+    assert cliente.pool.request(addr, OP_PING).status == STATUS_OK
+    for _ in range(100):
+        if not temporales(servidor):
+            break
+        time.sleep(0.02)
+    assert temporales(servidor) == []
+    assert servidor.used_bytes == 0
+    assert not os.path.exists(servidor.metadata_manager.get_local_storage_path("b" * 64))
+
+
+def test_subidas_simultaneas_del_mismo_bloque(nodos, cliente):
+    servidor, = nodos()
+    addr = (servidor.host, servidor.port)
+    data = os.urandom(1_500_000)
+    nombre = hash_bloque(data)
+    futures = [cliente.pool.submit(addr, OP_UPLOAD_BLOCK, {"name": nombre}, data) for _ in range(6)]
+    assert all(future.result(10).status == STATUS_OK for future in futures)
+    with open(servidor.metadata_manager.get_local_storage_path(nombre), 'rb') as f:
+        assert f.read() == data
+    assert servidor.used_bytes == len(data)
+    assert temporales(servidor) == []
@@ -0,0 +1,203 @@
+# test_transfer.py
+#
+# Subidas en streaming (StreamingUploader) y descargas en paralelo
+# (ParallelDownloader) de archivos de varios bloques, contra NodeServers
+# reales (fixture 'nodos').
+
+import asyncio
+import os
+
+import pytest
+
+import Network
+import Server
+from Protocol import OP_UPLOAD_BLOCK, FileRange, build_response
+from Transfer import ParallelDownloader, StreamingUploader
+from Utils import MetadataManager, desempaquetar_bloque, hash_bloque, replicas_de_bloque
+
+BLOQUE = 512 * 1024
+
+
+def subidor(cliente, **opciones):
+    # Sin lotes ni compresión: cada bloque sale con su UPLOAD_BLOCK desde el archivo
+    opciones = dict(dict(replication_factor=1, compression=None, block_size=BLOQUE,
+                         batch_block_max=0, on_log=lambda mensaje: None), **opciones)
+    metadata_manager = MetadataManager("cliente", "127.0.0.1", 0, persistir=False)
+    return StreamingUploader(cliente, metadata_manager, **opciones)
+
+
+def archivo(tmp_path, data, nombre="origen.bin"):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(data)
+    return str(ruta)
+
+
+def en_disco(servidores):
+    """{nombre_bloque: contenido} de todos los bloques guardados en 'servidores'."""
+    bloques = {}
+    for servidor in servidores:
+        directorio = servidor.metadata_manager.storage_dir
+        for nombre in os.listdir(directorio):
+            with open(os.path.join(directorio, nombre), 'rb') as f:
+                bloques[nombre] = f.read()
+    return bloques
+
+
+def test_subida_en_streaming_de_varios_bloques(nodos, cliente, tmp_path):
+    servidores = nodos(2)
+    data = os.urandom(5 * BLOQUE + 1234)
+    progreso = []
+    filename, size, block_map = subidor(
+        cliente, on_progress=lambda enviados, total: progreso.append((enviados, total))
+    ).upload(archivo(tmp_path, data))
+
+    assert (filename, size) == ("origen.bin", len(data))
+    assert len(block_map) == 6
+    guardados = en_disco(servidores)
+    for entrada in block_map:
+        nombre_bloque, _, _, attrs = desempaquetar_bloque(entrada)
+        trozo = data[attrs['offset']:attrs['offset'] + attrs['size']]
+        assert nombre_bloque == hash_bloque(trozo)
+        assert guardados[nombre_bloque] == trozo
+    assert not [n for n in guardados if n.endswith(".part")]
+    assert progreso[-1] == (len(data), len(data))
+
+
+def test_subida_sin_nodos_falla(nodos, cliente, tmp_path):
+    servidor, = nodos(1)
+    nodos.parar(servidor)
+    with pytest.raises(IOError):
+        subidor(cliente).upload(archivo(tmp_path, os.urandom(2 * BLOQUE)))
+
+
+def test_descarga_en_paralelo_reconstruye_el_archivo(nodos, cliente, tmp_path):
+    nodos(3)
+    data = os.urandom(7 * BLOQUE + 99)
+    _, size, block_map = subidor(cliente).upload(archivo(tmp_path, data))
+
+    destino = str(tmp_path / "copia.bin")
+    progreso = []
+    ParallelDownloader(cliente, concurrency=4,
+                       on_progress=lambda recibidos, total: progreso.append(recibidos)
+                       ).download(block_map, destino, size)
+    with open(destino, 'rb') as f:
+        assert f.read() == data
+    assert progreso[-1] == len(data)
+
+
+def test_descarga_escribe_un_bloque_repetido_en_todos_sus_offsets(nodos, cliente, tmp_path):
+    nodos(1)
+    trozo = os.urandom(BLOQUE)
+    data = trozo + os.urandom(BLOQUE) + trozo + b"cola"
+    _, size, block_map = subidor(cliente).upload(archivo(tmp_path, data))
+
+    destino = str(tmp_path / "copia.bin")
+    ParallelDownloader(cliente).download(block_map, destino, size)
+    with open(destino, 'rb') as f:
+        assert f.read() == data
+
+
+def test_descarga_fallida_borra_el_destino(nodos, cliente, tmp_path):
+    servidor, = nodos(1)
+    _, size, block_map = subidor(cliente).upload(archivo(tmp_path, os.urandom(3 * BLOQUE)))
+    # Se pierde un bloque y no hay otra réplica
+    nombre_bloque = desempaquetar_bloque(block_map[1])[0]
+    os.remove(servidor.metadata_manager.get_local_storage_path(nombre_bloque))
+
+    destino = tmp_path / "copia.bin"
+    with pytest.raises(IOError):
+        ParallelDownloader(cliente).download(block_map, str(destino), size)
+    assert not destino.exists()
+
+
+@pytest.mark.parametrize("modo", ["chain", "fanout"])
+def test_replicacion_en_todos_los_nodos(nodos, cliente, tmp_path, modo):
+    servidores = nodos(3)
+    data = os.urandom(2 * BLOQUE + 10)
+    _, _, block_map = subidor(cliente, replication_factor=3, replication_mode=modo).upload(
+        archivo(tmp_path, data))
+
+    direcciones = {(servidor.host, servidor.port) for servidor in servidores}
+    for entrada in block_map:
+        nombre_bloque, _, _, attrs = desempaquetar_bloque(entrada)
+        assert {tuple(addr) for addr in replicas_de_bloque(entrada)} == direcciones
+        trozo = data[attrs['offset']:attrs['offset'] + attrs['size']]
+        for servidor in servidores:
+            assert en_disco([servidor])[nombre_bloque] == trozo
+
+
+def test_cadena_con_un_nodo_atascado_conserva_las_copias_confirmadas(nodos, cliente, tmp_path,
+                                                                      monkeypatch):
+    # Cada salto espera 1 s a su siguiente y el cliente, 0,5 s por su cuenta:
+    # el plazo del cliente tiene que cubrir la espera de toda la cadena
+    monkeypatch.setattr(Server, "SERVER_PEER_TIMEOUT", 1)
+    monkeypatch.setattr(Network, "SERVER_PEER_TIMEOUT", 1)
+    cliente.timeout = cliente.pool.timeout = 0.5
+    primero, segundo, atascado = nodos(3)
+
+    async def sin_respuesta(conn, addr, peticion):
+        await atascado.discard_body(conn, peticion)
+        await asyncio.sleep(3)
+        await atascado.send(conn, build_response(peticion))
+    atascado.handlers[OP_UPLOAD_BLOCK] = sin_respuesta
+
+    uploader = subidor(cliente, replication_factor=3)
+    cadena = [(servidor.host, servidor.port) for servidor in (primero, segundo, atascado)]
+    with open(archivo(tmp_path, os.urandom(300_000)), 'rb') as f:
+        body = FileRange(f, 0, 300_000)
+        guardado_en = uploader._send_chain(hash_bloque(f.read()), body, cadena)
+
+    # Las copias del primero y el segundo no se repiten; solo se reintenta el tercero
+    assert guardado_en == cadena[:2]
+    assert [c["value"] for c in cliente.metrics.snapshot()["counters"]
+            if c["name"] == "client_upload_retries_total"] == [1]
+
+
+def test_subida_con_bloques_repetidos_los_envia_una_vez(nodos, cliente, tmp_path):
+    nodos(1)
+    trozo = os.urandom(BLOQUE)
+    uploader = subidor(cliente)
+    _, _, block_map = uploader.upload(archivo(tmp_path, trozo * 3 + b"fin"))
+
+    nombres = [desempaquetar_bloque(entrada)[0] for entrada in block_map]
+    assert nombres[0] == nombres[1] == nombres[2]
+    assert uploader.bytes_transferidos == BLOQUE + 3
+
+
+def test_resubida_no_envia_bloques_que_los_nodos_ya_tienen(nodos, cliente, tmp_path):
+    nodos(2)
+    ruta = archivo(tmp_path, os.urandom(3 * BLOQUE + 5))
+    primera = subidor(cliente, replication_factor=2)
+    _, _, block_map = primera.upload(ruta)
+    assert primera.bytes_transferidos == 3 * BLOQUE + 5
+
+    # Otro cliente sin metadatos: STAT_BLOCKS le dice que ya están todos
+    segunda = subidor(cliente, replication_factor=2)
+    _, _, otra = segunda.upload(ruta)
+    assert segunda.bytes_transferidos == 0
+    assert [desempaquetar_bloque(e)[0] for e in otra] == [desempaquetar_bloque(e)[0] for e in block_map]
+
+
+def test_bloque_compartido_entre_archivos_se_sube_una_vez(nodos, cliente, tmp_path):
+    nodos(1)
+    comun = os.urandom(BLOQUE)
+    uploader = subidor(cliente)
+    (_, _, a), (_, _, b) = uploader.upload_many([archivo(tmp_path, comun + b"a", "a.bin"),
+                                                 archivo(tmp_path, comun + b"b", "b.bin")])
+    assert desempaquetar_bloque(a[0])[0] == desempaquetar_bloque(b[0])[0]
+    assert uploader.bytes_transferidos == BLOQUE + 2
+
+
+def test_bloque_truncado_en_el_nodo_se_vuelve_a_enviar(nodos, cliente, tmp_path):
+    servidor, = nodos(1)
+    data = os.urandom(2 * BLOQUE)
+    ruta = archivo(tmp_path, data)
+    _, _, block_map = subidor(cliente).upload(ruta)
+    nombre_bloque = desempaquetar_bloque(block_map[0])[0]
+    with open(servidor.metadata_manager.get_local_storage_path(nombre_bloque), 'r+b') as f:
+        f.truncate(100)
+
+    uploader = subidor(cliente)
+    uploader.upload(ruta)
+    assert uploader.bytes_transferidos == BLOQUE
+    assert en_disco([servidor])[nombre_bloque] == data[:BLOQUE]